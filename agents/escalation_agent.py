@@ -1,13 +1,15 @@
 import json
-import requests
 from state import IncidentState
-from tools.common_functions import get_llm, parse_json
+from tools.model_router import get_model_router
+from tools.notifier import get_dispatcher
+from tools.llm_limiter import PRIORITY_HIGH, PRIORITY_NORMAL, llm_priority
+from agents.escalation_templates import primary_root_cause, priority_for, render_escalation
 
 # -----------------------------
 # LLM Setup
 # -----------------------------
 
-llm = get_llm()
+router = get_model_router()
 
 
 # -----------------------------
@@ -58,26 +60,42 @@ Return:
 def escalation_node(state: IncidentState) -> IncidentState:
     """
     LangGraph Node:
-    - LLM drafts escalation message
+    - Renders escalation message from a template
+    - LLM drafts it only if requested or no template fits
     - Prints formatted Slack payload
-    - Slack POST is commented (enable later)
+    - Queues Slack POST on the notification dispatcher
     """
 
     print("\n🚨 ESCALATION AGENT TRIGGERED")
 
-    prompt = ESCALATION_PROMPT.format(
-        description=state.get("description", "N/A"),
-        incident_type=state.get("incident_type", "unknown"),
-        confidence=state.get("confidence", "low"),
-        retry_status=state.get("retry_status", "not_attempted"),
-        root_cause=state.get("root_cause", "Not determined"),
-        run_id=state.get("dbt_run_id", "N/A")
-    )
+    parsed = None
 
-    response = llm.invoke(prompt)
-    response_text = response.content if hasattr(response, "content") else str(response)
+    if state.get("escalation_mode") != "llm":
+        parsed = render_escalation(state)
 
-    parsed = parse_json(response_text)
+    if parsed:
+        print("Escalation rendered from template (LLM skipped)")
+
+    else:
+        prompt = ESCALATION_PROMPT.format(
+            description=state.get("description", "N/A"),
+            incident_type=state.get("incident_type", "unknown"),
+            confidence=state.get("confidence", "low"),
+            retry_status=state.get("retry_status", "not_attempted"),
+            root_cause=primary_root_cause(state),
+            run_id=state.get("dbt_run_id", "N/A")
+        )
+
+        # High blast radius escalations jump the LLM queue
+        lane = PRIORITY_HIGH if priority_for(state) == "P1" else PRIORITY_NORMAL
+
+        with llm_priority(lane):
+            parsed = router.invoke_json(
+                "escalation_node",
+                prompt,
+                required_keys=("title", "priority", "summary", "impact", "recommended_action"),
+                accept=lambda parsed: parsed.get("priority") in ("P1", "P2", "P3")
+            )
 
     # Fallback if LLM JSON fails
     if not parsed:
@@ -116,30 +134,17 @@ Run ID: {state.get("dbt_run_id", "N/A")}
     print(slack_message)
 
     # -----------------------------
-    # Slack Webhook (DISABLED)
+    # Slack Webhook (queued, off the critical path)
     # -----------------------------
     #
-    # To enable Slack:
-    #
-    # 1. export SLACK_WEBHOOK_URL="https://hooks.slack.com/services/XXX/YYY/ZZZ"
-    # 2. Uncomment the block below
-    #
-    # import os
-    #
-    # SLACK_WEBHOOK = os.getenv("SLACK_WEBHOOK_URL")
-    #
-    # if SLACK_WEBHOOK:
-    #     response = requests.post(
-    #         SLACK_WEBHOOK,
-    #         json={"text": slack_message},
-    #         headers={"Content-Type": "application/json"}
-    #     )
-    #
-    #     if response.status_code != 200:
-    #         print("❌ Slack notification failed:", response.text)
-    #     else:
-    #         print("✅ Slack notification sent successfully")
-    #
+    # Enabled when SLACK_WEBHOOK_URL is set. Alerts for the same run
+    # are coalesced into a digest by the background dispatcher.
+
+    dispatcher = get_dispatcher()
+
+    if dispatcher:
+        dispatcher.submit(f"run {state.get('dbt_run_id', 'N/A')}", slack_message)
+        print("📨 Slack notification queued")
 
     # -----------------------------
     # Update State
@@ -0,0 +1,138 @@
+from typing import Dict, Optional
+from state import IncidentState
+
+# -----------------------------
+# Priority Rules
+# -----------------------------
+
+# blast_radius >= threshold → priority (checked in order)
+PRIORITY_BY_BLAST_RADIUS = [
+    (10, "P1"),
+    (1, "P2"),
+    (0, "P3"),
+]
+
+# Retry outcomes that mean automation already gave up
+# (trigger failures are retry_status "failed" with retry_reason "trigger_failed")
+FAILED_RETRY_STATUSES = {"failed"}
+
+
+# -----------------------------
+# Templates
+# -----------------------------
+
+ESCALATION_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "transient_infra": {
+        "title": "Transient infra failure in {model}",
+        "summary": "{model} failed with a transient infrastructure error. Retry status: {retry_status}.",
+        "impact": "{impact}",
+        "recommended_action": "Check warehouse / network health and rerun the job once stable.",
+    },
+    "performance_issue": {
+        "title": "Resource limits exceeded in {model}",
+        "summary": "{model} exceeded memory or resource limits. Root cause: {root_cause}.",
+        "impact": "{impact}",
+        "recommended_action": "Review the model for expensive joins or scale the warehouse, then rerun.",
+    },
+    "dependency_issue": {
+        "title": "Dependency break in {model}",
+        "summary": "{model} references a column or model that changed upstream. Root cause: {root_cause}.",
+        "impact": "{impact}",
+        "recommended_action": "Align {model} with the upstream schema change and redeploy.",
+    },
+    "data_type_mismatch": {
+        "title": "Data type mismatch in {model}",
+        "summary": "{model} failed on incompatible column types. Root cause: {root_cause}.",
+        "impact": "{impact}",
+        "recommended_action": "Add an explicit cast or fix the upstream type, then rerun.",
+    },
+    "data_quality": {
+        "title": "Data quality test failed on {model}",
+        "summary": "A data test on {model} failed. Root cause: {root_cause}.",
+        "impact": "{impact}",
+        "recommended_action": "Inspect the failing rows and fix the source data or test expectation.",
+    },
+    "permission_issue": {
+        "title": "Permission denied in {model}",
+        "summary": "{model} failed due to missing warehouse permissions.",
+        "impact": "{impact}",
+        "recommended_action": "Grant the dbt service account access to the affected objects.",
+    },
+    "config_issue": {
+        "title": "Configuration error in {model}",
+        "summary": "{model} failed due to a configuration problem. Root cause: {root_cause}.",
+        "impact": "{impact}",
+        "recommended_action": "Review dbt_project.yml / model config for {model}.",
+    },
+    "logical_error": {
+        "title": "Logic error in {model}",
+        "summary": "{model} failed due to incorrect SQL logic. Root cause: {root_cause}.",
+        "impact": "{impact}",
+        "recommended_action": "Review joins and filters in {model} and open a fix PR.",
+    },
+    "pipeline_failure": {
+        "title": "Orchestration failure for run {run_id}",
+        "summary": "The dbt Cloud run failed at the orchestration level. Retry status: {retry_status}.",
+        "impact": "{impact}",
+        "recommended_action": "Check the dbt Cloud job configuration and run logs.",
+    },
+}
+
+
+# -----------------------------
+# Rendering
+# -----------------------------
+
+def priority_for(state: IncidentState) -> str:
+    blast_radius = state.get("blast_radius") or 0
+
+    priority = "P3"
+    for threshold, level in PRIORITY_BY_BLAST_RADIUS:
+        if blast_radius >= threshold:
+            priority = level
+            break
+
+    # A failed automated retry means nobody is fixing it yet
+    if priority == "P3" and state.get("retry_status") in FAILED_RETRY_STATUSES:
+        priority = "P2"
+
+    return priority
+
+
+def primary_root_cause(state: IncidentState) -> str:
+    root_causes = state.get("root_causes") or []
+    if root_causes and isinstance(root_causes[0], dict):
+        return root_causes[0].get("cause") or "Not determined"
+    return "Not determined"
+
+
+def render_escalation(state: IncidentState) -> Optional[Dict[str, str]]:
+    """
+    Deterministic escalation payload.
+    Returns None when no template fits the incident type.
+    """
+    template = ESCALATION_TEMPLATES.get(state.get("incident_type") or "unknown")
+
+    if not template:
+        return None
+
+    blast_radius = state.get("blast_radius") or 0
+
+    impact = (
+        f"{blast_radius} downstream model(s) impacted."
+        if blast_radius else
+        "No known downstream models impacted."
+    )
+
+    fields = {
+        "model": state.get("model_name") or state.get("unique_id") or "unknown model",
+        "run_id": state.get("dbt_run_id", "N/A"),
+        "retry_status": state.get("retry_status", "not_attempted"),
+        "root_cause": primary_root_cause(state),
+        "impact": impact,
+    }
+
+    payload = {key: value.format(**fields) for key, value in template.items()}
+    payload["priority"] = priority_for(state)
+
+    return payload
@@ -1,12 +1,13 @@
 import json
 from typing import Optional
 from state import IncidentState
-from tools.common_functions import get_llm, parse_json, get_embeddings
+from tools.model_router import confident, get_model_router
+from tools.prompt_budget import compact_error, compact_snippets, report_prompt_budget
 from memory.vector_store import IncidentVectorStore
 
 store = IncidentVectorStore()
 
-llm = get_llm()
+router = get_model_router()
 
 # -----------------------------
 # Configuration
@@ -113,25 +114,43 @@ def classify_incident(state: IncidentState) -> IncidentState:
         incident_type = rule_type
         confidence = "high"
         reason = "Rule-based classification matched known error pattern"
+        source = "rule"
 
     else:
+        source = "llm"
         similar_incidents = store.search_similar(description, k=3)
 
-        memory_context = "\n\n".join(
-            f"- {getattr(item, 'page_content', str(item))}"
+        snippets = [
+            getattr(item, 'page_content', str(item))
             for item in similar_incidents
-        )
+        ]
 
-        prompt = CLASSIFICATION_PROMPT.format(
+        memory_context = "\n\n".join(f"- {snippet}" for snippet in snippets)
+
+        original_prompt = CLASSIFICATION_PROMPT.format(
             description=description,
             similar_incidents=memory_context or "No similar incidents found"
         )
 
-        response = llm.invoke(prompt)
+        prompt = CLASSIFICATION_PROMPT.format(
+            description=compact_error(description),
+            similar_incidents=compact_snippets(snippets) or "No similar incidents found"
+        )
 
-        response_text = response.content if hasattr(response, "content") else str(response)
+        state.setdefault("prompt_tokens_saved", {})["classify"] = report_prompt_budget(
+            "classify", original_prompt, prompt
+        )
 
-        parsed = parse_json(response_text)
+        # Small tier first; escalates on unknown types or low confidence
+        parsed = router.invoke_json(
+            "classify_incident",
+            prompt,
+            required_keys=("incident_type", "confidence", "reason"),
+            accept=lambda parsed: (
+                normalize_incident_type(parsed.get("incident_type")) != "unknown"
+                and confident(parsed)
+            )
+        )
 
         incident_type = normalize_incident_type(
             parsed.get("incident_type") if parsed else None
@@ -146,6 +165,7 @@ def classify_incident(state: IncidentState) -> IncidentState:
     state["incident_type"] = incident_type
     state["explanation"] = reason
     state["confidence"] = confidence
+    state["classification_source"] = source
 
     print(f"Incident classified as: {incident_type} (confidence={confidence})")
 
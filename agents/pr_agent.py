@@ -1,8 +1,30 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
 from state import IncidentState
-from tools.common_functions import get_llm, parse_json
+from tools.json_stream import invoke_json
+from tools.model_router import get_model_router
+from api.run_context import context_for_state, get_state_sql
+from tools.manifest_index import load_manifest, upstream_columns
+from tools.sql_validation import unified_diff, validate_sql_fix
+from tools.prompt_budget import (
+    compact_error,
+    extract_error_line,
+    report_prompt_budget,
+    splice_sql,
+    trim_sql
+)
 from tools.github_client import create_pull_request
 
-llm = get_llm()
+# One client per candidate; varied temperature gives distinct fixes
+CANDIDATE_TEMPERATURES = (0.1, 0.4, 0.7)
+
+router = get_model_router()
+
+
+def candidate_llms(tier: str) -> List[Any]:
+    return [router.llm(tier, temperature=t) for t in CANDIDATE_TEMPERATURES]
 
 SQL_FIX_PROMPT = """
 You are an expert dbt engineer.
@@ -12,59 +34,195 @@ Failure:
 {error}
 \"\"\"
 
-Original SQL:
+Original SQL (lines {start_line}-{end_line} of the file):
 \"\"\"
 {sql}
 \"\"\"
 
-Fix the SQL.
+Fix the SQL. Return the corrected version of ONLY the lines shown above.
 
 Return ONLY JSON:
 
 {{
-  "fixed_sql": "<correct SQL>",
+  "fixed_sql": "<corrected SQL for the lines shown>",
   "summary": "<what was changed>",
   "risk_level": "<low | medium | high>"
 }}
 """
 
 
+# -----------------------------
+# Candidate Generation
+# -----------------------------
+
+def generate_candidate(candidate_llm, prompt: str, stop: Optional[threading.Event] = None) -> Optional[Dict[str, Any]]:
+    # stop is checked per streamed chunk, so losing candidates stop generating
+    return invoke_json(candidate_llm, prompt, required_keys=("fixed_sql", "summary", "risk_level"), stop=stop)
+
+
+def first_valid_fix(
+    llms: List[Any],
+    prompt: str,
+    raw_sql: str,
+    start_line: int,
+    end_line: int,
+    known_columns,
+    forbidden_columns
+) -> Optional[Dict[str, Any]]:
+    """
+    Generate candidates in parallel and return the first one that
+    passes local validation, with the spliced full file attached.
+    """
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(llms))
+    futures = [
+        executor.submit(generate_candidate, candidate_llm, prompt, stop)
+        for candidate_llm in llms
+    ]
+
+    try:
+        for number, future in enumerate(as_completed(futures), start=1):
+            try:
+                parsed = future.result()
+            except Exception as exc:
+                # One failing candidate must not sink the others
+                print(f"Candidate {number}: failed ({exc})")
+                continue
+
+            if not parsed or not isinstance(parsed.get("fixed_sql"), str):
+                print(f"Candidate {number}: invalid response")
+                continue
+
+            if parsed.get("risk_level") == "high":
+                print(f"Candidate {number}: rejected (high risk)")
+                continue
+
+            fixed_sql = splice_sql(raw_sql, parsed["fixed_sql"], start_line, end_line)
+
+            ok, errors = validate_sql_fix(raw_sql, fixed_sql, known_columns, forbidden_columns)
+
+            if ok:
+                print(f"Candidate {number}: valid")
+                return {**parsed, "full_sql": fixed_sql}
+
+            print(f"Candidate {number}: rejected ({'; '.join(errors)})")
+
+        return None
+
+    finally:
+        # Don't wait for slower candidates once a winner is found;
+        # the ones already streaming close their streams on stop
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# -----------------------------
+# LangGraph Node
+# -----------------------------
+
 def raise_pr(state: IncidentState) -> IncidentState:
     print("\nLLM PR AGENT RUNNING")
 
-    raw_sql = state.get("raw_sql")
+    raw_sql = get_state_sql(state)
     file_path = state.get("file_path")
     error = state.get("description")
 
-    prompt = SQL_FIX_PROMPT.format(
+    if not raw_sql or not file_path:
+        print(f"❌ No {'SQL' if not raw_sql else 'file path'} for {state.get('unique_id')}. Escalating.")
+        state["recommended_action"] = "escalate"
+        return state
+
+    missing_column = state.get("missing_column")
+
+    excerpt, start_line, end_line = trim_sql(
+        raw_sql,
+        column=missing_column or (state.get("type_mismatch") or {}).get("column"),
+        line_number=extract_error_line(error)
+    )
+
+    original_prompt = SQL_FIX_PROMPT.format(
         error=error,
-        sql=raw_sql
+        sql=raw_sql,
+        start_line=1,
+        end_line=len(raw_sql.splitlines())
+    )
+
+    prompt = SQL_FIX_PROMPT.format(
+        error=compact_error(error),
+        sql=excerpt,
+        start_line=start_line,
+        end_line=end_line
+    )
+
+    state.setdefault("prompt_tokens_saved", {})["raise_pr"] = report_prompt_budget(
+        "raise_pr", original_prompt, prompt
+    )
+
+    # -----------------------------
+    # Local Validation Context
+    # -----------------------------
+
+    context = context_for_state(state)
+    manifest = context.manifest if context else load_manifest()
+    known_columns = (
+        upstream_columns(manifest, state["unique_id"])
+        if manifest and state.get("unique_id") else None
     )
 
-    response = llm.invoke(prompt)
-    parsed = parse_json(response.content if hasattr(response, "content") else str(response))
+    if known_columns is None:
+        print("⚠️ Column index incomplete for upstream models; skipping column check")
+
+    # Candidates from the agent's tier; a larger tier only if none validate
+    chain = router.chain("raise_pr")
+    parsed = None
+
+    for position, tier in enumerate(chain):
+        started = time.time()
+
+        parsed = first_valid_fix(
+            candidate_llms(tier),
+            prompt,
+            raw_sql,
+            start_line,
+            end_line,
+            known_columns,
+            [missing_column] if missing_column else []
+        )
+
+        router.record("raise_pr", tier, time.time() - started, bool(parsed), fallback=position > 0)
+
+        if parsed:
+            break
+
+        if position < len(chain) - 1:
+            print(f"🧭 [raise_pr] no valid fix from {tier} tier; escalating to {chain[position + 1]}")
 
     if not parsed:
+        print("❌ No candidate fix passed validation. Escalating.")
         state["recommended_action"] = "escalate"
         return state
 
-    if parsed.get("risk_level") == "high":
-        state["recommended_action"] = "escalate"
-        return state
+    diff = unified_diff(raw_sql, parsed["full_sql"], file_path)
+    state["pr_diff"] = diff
 
     pr_url = create_pull_request(
         file_path=file_path,
-        updated_content=parsed["fixed_sql"],
+        updated_content=parsed["full_sql"],
         title="AI Auto-Fix: dbt Failure",
         body=f"""
 Root Cause: {state.get("rca_reason")}
 
 Summary:
 {parsed.get("summary")}
-"""
+
+Diff:
+{diff}
+""",
+        # Fixes from the same run share one branch / PR (opened on flush)
+        batch_key=state.get("dbt_run_id")
     )
 
     state["pr_url"] = pr_url
-    print(f"PR Created: {pr_url}")
+    print(f"Fix committed: {pr_url}")
 
     return state
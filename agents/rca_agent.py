@@ -1,18 +1,26 @@
 import json
 import re
+import time
 from typing import List
 from state import IncidentState
-from tools.common_functions import get_llm, parse_json
+from tools.model_router import confident, get_model_router
+from tools.manifest_index import LineageIndex, load_manifest
+from api.run_context import context_for_state
+from tools.prompt_budget import compact_code, compact_error, compact_snippets, report_prompt_budget
 from memory.vector_store import IncidentVectorStore
+from memory.code_index import get_code_index
 
 # ---------------------------------------------------
 # Initialization
 # ---------------------------------------------------
 
 store = IncidentVectorStore()
-llm = get_llm()
+store.start_background_compaction()
+code_index = get_code_index()
+router = get_model_router()
 
-MANIFEST_PATH = "target/manifest.json"
+# SQL / docs chunks from the failing model's upstream closure
+CODE_SNIPPETS = 4
 
 RCA_PROMPT = """
 You are an expert dbt root cause analysis agent.
@@ -24,6 +32,15 @@ Incident description:
 
 Incident type: {incident_type}
 
+Downstream models that also failed in the same run (likely cascaded):
+{cascaded_failures}
+
+Downstream models skipped in the same run because of this failure:
+{skipped_models}
+
+Relevant code from the failing model and its upstream models:
+{related_code}
+
 Similar historical incidents:
 {similar_incidents}
 
@@ -53,14 +70,6 @@ Required format:
 # Helper Functions
 # ---------------------------------------------------
 
-def load_manifest():
-    try:
-        with open(MANIFEST_PATH, "r") as f:
-            return json.load(f)
-    except Exception:
-        return None
-
-
 def extract_missing_column(description: str):
     match = re.search(r"Column\s+([a-zA-Z0-9_]+)\s+does not exist", description)
     return match.group(1) if match else None
@@ -80,6 +89,47 @@ def extract_type_mismatch(description: str):
     return None
 
 
+def summarize_models(models, limit: int = 10) -> str:
+    if not models:
+        return "None"
+
+    more = " ..." if len(models) > limit else ""
+    return f"{len(models)}: " + ", ".join(models[:limit]) + more
+
+
+def upstream_closure(lineage: LineageIndex, node_id: str) -> List[str]:
+    return [node_id] + lineage.ancestors(node_id)
+
+
+def related_code(manifest, lineage: LineageIndex, node_id: str, description: str):
+    """
+    (header, code) of the chunks most relevant to the error, from the
+    failing model and its ancestors only.
+    """
+    started = time.perf_counter()
+
+    query = f"{node_id.split('.')[-1]}\n{compact_error(description)}"
+    chunks = code_index.search(manifest, query, upstream_closure(lineage, node_id), k=CODE_SNIPPETS)
+
+    print(f"🔎 {len(chunks)} related code snippet(s) in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return [(chunk["header"], chunk["code"]) for chunk in chunks]
+
+
+def full_upstream_code(manifest, lineage: LineageIndex, node_id: str) -> str:
+    # Only used to report what the uncompacted prompt would have cost
+    return "\n\n".join(
+        (manifest.get("nodes", {}).get(unique_id) or {}).get("raw_code") or ""
+        for unique_id in upstream_closure(lineage, node_id)
+    )
+
+
+def merge_impacted(state: IncidentState, impacted_models: List[str]) -> List[str]:
+    # Keep failures collapsed in at ingestion alongside column-level impact
+    merged = list(state.get("impacted_models") or [])
+    merged.extend(model for model in impacted_models if model not in merged)
+    return merged
+
+
 # ---------------------------------------------------
 # LangGraph Node
 # ---------------------------------------------------
@@ -111,23 +161,69 @@ def analyze_root_cause(state: IncidentState) -> IncidentState:
     incident_type = state.get("incident_type", "unknown")
     model_name = state.get("model_name")
 
-    similar_incidents = store.search_similar(description)
+    # Same incident type only; older incidents weigh less
+    similar_incidents = store.search_similar(description, incident_type=incident_type)
 
-    memory_context = "\n\n".join(
-    f"- {item.page_content}"
-    for item in similar_incidents
-    )
+    snippets = [item.page_content for item in similar_incidents]
 
-    prompt = RCA_PROMPT.format(
+    # Shared run context first; the local manifest is the fallback
+    context = context_for_state(state)
+
+    if context:
+        manifest, lineage = context.manifest, context.lineage
+    else:
+        if state.get("run_context_id") is not None:
+            print(f"⚠️ Run context {state['run_context_id']} is gone; falling back to the local manifest")
+        manifest = load_manifest()
+        lineage = LineageIndex(manifest) if manifest else None
+
+    # Manifest nodes are keyed by unique_id
+    node_id = state.get("unique_id") or model_name
+    has_node = bool(manifest and node_id and node_id in manifest.get("nodes", {}))
+
+    code_snippets = related_code(manifest, lineage, node_id, description) if has_node else []
+    upstream_code = full_upstream_code(manifest, lineage, node_id) if has_node else ""
+
+    memory_context = "\n\n".join(f"- {snippet}" for snippet in snippets)
+
+    # Correlated failures: descendants that errored or were skipped
+    # because of this node are analyzed as part of this incident
+    cascaded_context = summarize_models(state.get("cascaded_failures"))
+    skipped_context = summarize_models(state.get("skipped_models"))
+
+    original_prompt = RCA_PROMPT.format(
         description=description,
         incident_type=incident_type,
+        cascaded_failures=cascaded_context,
+        skipped_models=skipped_context,
+        related_code=upstream_code or "None",
         similar_incidents=memory_context or "No similar incidents found"
     )
 
-    response = llm.invoke(prompt)
-    response_text = response.content if hasattr(response, "content") else str(response)
+    prompt = RCA_PROMPT.format(
+        description=compact_error(description),
+        incident_type=incident_type,
+        cascaded_failures=cascaded_context,
+        skipped_models=skipped_context,
+        related_code=compact_code(code_snippets) or "None",
+        similar_incidents=compact_snippets(snippets) or "No similar incidents found"
+    )
+
+    state.setdefault("prompt_tokens_saved", {})["rca"] = report_prompt_budget(
+        "rca", original_prompt, prompt
+    )
 
-    parsed = parse_json(response_text)
+    parsed = router.invoke_json(
+        "analyze_root_cause",
+        prompt,
+        required_keys=("root_causes", "recommended_action", "reason"),
+        # Escalate to the large tier if the primary cause is low confidence
+        accept=lambda parsed: (
+            bool(parsed.get("root_causes"))
+            and isinstance(parsed["root_causes"][0], dict)
+            and confident(parsed["root_causes"][0])
+        )
+    )
 
     if not parsed:
         state["root_causes"] = []
@@ -146,18 +242,11 @@ def analyze_root_cause(state: IncidentState) -> IncidentState:
     # Manifest Impact Analysis
     # ---------------------------------------------------
 
-    manifest = load_manifest()
-
-    if manifest and model_name and model_name in manifest.get("nodes", {}):
-
-        node = manifest["nodes"][model_name]
+    if has_node:
 
-        upstream = node.get("depends_on", {}).get("nodes", [])
+        upstream = lineage.parents.get(node_id, [])
 
-        downstream = [
-            key for key, value in manifest["nodes"].items()
-            if model_name in value.get("depends_on", {}).get("nodes", [])
-        ]
+        downstream = list(lineage.children.get(node_id, []))
 
         state["upstream_models"] = upstream
         state["downstream_models"] = downstream
@@ -173,12 +262,13 @@ def analyze_root_cause(state: IncidentState) -> IncidentState:
             impacted_models = []
 
             for child in downstream:
-                child_sql = manifest["nodes"][child].get("raw_sql", "")
+                child_node = manifest["nodes"].get(child, {})
+                child_sql = child_node.get("raw_code") or child_node.get("raw_sql", "")
                 if missing_column in child_sql:
                     impacted_models.append(child)
 
-            state["impacted_models"] = impacted_models
-            state["blast_radius"] = len(impacted_models)
+            state["impacted_models"] = merge_impacted(state, impacted_models)
+            state["blast_radius"] = len(state["impacted_models"])
 
             if impacted_models:
                 state["recommended_action"] = "fix_dependency_break"
@@ -196,12 +286,13 @@ def analyze_root_cause(state: IncidentState) -> IncidentState:
             impacted_models = []
 
             for child in downstream:
-                child_sql = manifest["nodes"][child].get("raw_sql", "")
+                child_node = manifest["nodes"].get(child, {})
+                child_sql = child_node.get("raw_code") or child_node.get("raw_sql", "")
                 if column in child_sql:
                     impacted_models.append(child)
 
-            state["impacted_models"] = impacted_models
-            state["blast_radius"] = len(impacted_models)
+            state["impacted_models"] = merge_impacted(state, impacted_models)
+            state["blast_radius"] = len(state["impacted_models"])
 
             if impacted_models:
                 state["recommended_action"] = "fix_dependency_break"
@@ -230,7 +321,10 @@ def analyze_root_cause(state: IncidentState) -> IncidentState:
         incident_id=incident_id,
         description=description,
         incident_type=incident_type,
-        root_cause=primary_root_cause
+        root_cause=primary_root_cause,
+        job_id=job_id,
+        model_name=model_name,
+        created_at=state.get("detected_at")
     )
 
     print("Root cause stored in Vector DB")
@@ -1,19 +1,23 @@
 import json
-from typing import Optional
 from state import IncidentState
 from tools.common_functions import (
-    get_llm,
-    parse_json,
-    retry_dbt_cloud_job
+    rerun_options,
+    ACCOUNT_ID,
+    RERUN_MODE
 )
+from tools.retry_coordinator import get_retry_coordinator
+from tools.retry_stats import EXPLORE_RATE, error_fingerprint, get_retry_stats
+from tools.cassette import replaying
+from tools.model_router import get_model_router
 from agents.escalation_agent import escalation_node
+from agents.speculative_retry import cancel_speculative_run
 
 
 # -----------------------------
 # LLM Setup
 # -----------------------------
 
-llm = get_llm()
+router = get_model_router()
 
 
 # -----------------------------
@@ -64,8 +68,10 @@ Return:
 def retry_agent_node(state: IncidentState) -> IncidentState:
     """
     LangGraph Node:
-    - LLM decides retry strategy
-    - Executes dbt Cloud retry
+    - Historical outcomes decide retry strategy when known
+    - A speculative rerun (rule + RCA agree) is awaited without an LLM call
+    - LLM decides it for novel failures
+    - Executes dbt Cloud retry (deduped per job)
     - Updates state
     - Escalates automatically if needed
     """
@@ -83,60 +89,112 @@ def retry_agent_node(state: IncidentState) -> IncidentState:
         return escalation_node(state)
 
     # -----------------------------
-    # LLM Reasoning
+    # Historical Outcomes
     # -----------------------------
 
-    prompt = RETRY_EXECUTION_PROMPT.format(
-        description=description,
-        incident_type=incident_type,
-        confidence=confidence,
-        job_id=job_id
-    )
-
-    response = llm.invoke(prompt)
+    fingerprint = error_fingerprint(description)
+    state["error_fingerprint"] = fingerprint
 
-    response_text = response.content if hasattr(response, "content") else str(response)
+    stats = get_retry_stats()
+    # No random exploration on replay: the branch taken must match the recording
+    parsed = stats.decide(job_id, incident_type, fingerprint, explore_rate=0 if replaying() else EXPLORE_RATE)
+    decision_source = "history"
 
-    print(response_text)
+    # Rules and RCA both call it transient: no need to ask the LLM
+    if not parsed and state.get("speculative_run_id"):
+        decision_source = "speculative"
+        parsed = {
+            "retry": True,
+            "max_attempts": 1,
+            "delay_seconds": 10,
+            "reason": "Rule-classified transient failure confirmed by RCA"
+        }
 
-    parsed = parse_json(response_text)
+    # -----------------------------
+    # LLM Reasoning (novel failures only)
+    # -----------------------------
 
     if not parsed:
-        print("⚠️ LLM returned invalid JSON. Escalating.")
-        state["retry_status"] = "llm_parse_failed"
-        return escalation_node(state)
+        decision_source = "llm"
+
+        prompt = RETRY_EXECUTION_PROMPT.format(
+            description=description,
+            incident_type=incident_type,
+            confidence=confidence,
+            job_id=job_id
+        )
+
+        parsed = router.invoke_json(
+            "retry_agent_node",
+            prompt,
+            required_keys=("retry", "max_attempts", "delay_seconds", "reason"),
+            accept=lambda parsed: isinstance(parsed.get("retry"), bool)
+        )
+
+        if not parsed:
+            print("⚠️ LLM returned invalid JSON. Escalating.")
+            state["retry_status"] = "llm_parse_failed"
+            cancel_speculative_run(state)
+            return escalation_node(state)
 
     should_retry = parsed.get("retry", False)
     reason = parsed.get("reason", "No reason provided")
 
-    print(f"LLM Decision: retry={should_retry} | reason={reason}")
+    state["retry_decision_source"] = decision_source
+
+    print(f"Retry decision ({decision_source}): retry={should_retry} | reason={reason}")
 
     if not should_retry:
         print("🚨 Retry not recommended. Escalating.")
         state["retry_status"] = "not_recommended"
         state["retry_reason"] = reason
+        cancel_speculative_run(state)
         return escalation_node(state)
 
     # -----------------------------
     # Safe Limits
     # -----------------------------
 
-    # max_attempts = min(max(int(parsed.get("max_attempts", 1)), 1), 1)
-    max_attempts = 1
+    # LLM suggestions stay at a single attempt; history has earned more
+    if decision_source == "history":
+        max_attempts = parsed["max_attempts"]
+    else:
+        max_attempts = 1
     delay_seconds = min(max(int(parsed.get("delay_seconds", 10)), 5), 60)
 
-    print(f"Executing retry: attempts={max_attempts}, delay={delay_seconds}s")
+    print(f"Executing retry: attempts={max_attempts}, delay={delay_seconds}s, mode={RERUN_MODE}")
+
+    # Rerun only the failing model and its children when possible
+    options = rerun_options(state.get("model_name"))
 
     # -----------------------------
     # Execute Retry
     # -----------------------------
-
-    result = retry_dbt_cloud_job(
-        job_id=job_id,
+    #
+    # Shared per job: concurrent incidents for the same job
+    # await one rerun (selectors merged) instead of each triggering
+    # their own. A covering speculative rerun is adopted as attempt 1.
+
+    result = get_retry_coordinator().retry(
+        job_id,
+        account_id=ACCOUNT_ID,
         max_attempts=max_attempts,
-        delay_seconds=delay_seconds
+        delay_seconds=delay_seconds,
+        **options
     )
 
+    # Shared results were already recorded by the incident that ran them;
+    # replayed outcomes are not real history
+    if not result.get("shared") and not replaying():
+        stats.record(
+            job_id,
+            incident_type,
+            fingerprint,
+            success=bool(result.get("success")),
+            attempts=result.get("attempts"),
+            delay_seconds=delay_seconds
+        )
+
     # -----------------------------
     # Handle Result
     # -----------------------------
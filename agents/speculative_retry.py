@@ -0,0 +1,79 @@
+import os
+from state import IncidentState
+from tools.common_functions import ACCOUNT_ID, rerun_options
+from tools.retry_coordinator import get_retry_coordinator
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+# Start the rerun right after a rule-based transient_infra
+# classification, while RCA runs; cancelled if RCA disagrees
+SPECULATIVE_RETRY = os.getenv("SPECULATIVE_RETRY", "false").lower() in ("1", "true", "yes")
+
+
+def should_speculate(state: IncidentState) -> bool:
+    return (
+        SPECULATIVE_RETRY
+        and bool(state.get("job_id"))
+        and state.get("classification_source") == "rule"
+        and state.get("incident_type") == "transient_infra"
+        and state.get("confidence") == "high"
+    )
+
+
+# -----------------------------
+# LangGraph Nodes
+# -----------------------------
+
+def speculative_retry_node(state: IncidentState) -> IncidentState:
+    """
+    LangGraph Node:
+    - Triggers the rerun before RCA for high-confidence transient failures
+    - The retry agent later awaits this run instead of starting another
+    """
+    if not should_speculate(state):
+        return state
+
+    print("\n⚡ SPECULATIVE RETRY")
+
+    run_id = get_retry_coordinator().speculate(
+        state["job_id"],
+        account_id=ACCOUNT_ID,
+        **rerun_options(state.get("model_name"))
+    )
+
+    if run_id:
+        state["speculative_run_id"] = run_id
+        print(f"Speculative rerun {run_id} started; RCA continues in parallel")
+
+    return state
+
+
+def cancel_speculative_run(state: IncidentState) -> bool:
+    """
+    Release this incident's speculative run (cancelled in dbt Cloud
+    once no other incident still needs it).
+    """
+    if not state.get("speculative_run_id"):
+        return False
+
+    cancelled = get_retry_coordinator().abandon(
+        state["job_id"],
+        account_id=ACCOUNT_ID,
+        **rerun_options(state.get("model_name"))
+    )
+
+    state["speculative_cancelled"] = cancelled
+    return cancelled
+
+
+def cancel_speculative_node(state: IncidentState) -> IncidentState:
+    """
+    LangGraph Node: RCA decided against retrying.
+    """
+    print("\n🛑 RCA does not recommend a retry; releasing speculative rerun")
+
+    cancel_speculative_run(state)
+    state["retry_status"] = "speculative_cancelled"
+    return state
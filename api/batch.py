@@ -0,0 +1,54 @@
+from typing import List, Optional
+from state import IncidentState
+from api.scheduler import WORKFLOW_WORKERS, IncidentScheduler, print_queue
+from api.run_context import get_run_context, release_run_context
+from tools.cassette import replaying
+
+
+def process_incidents(incidents: List[IncidentState], workers: Optional[int] = None) -> List[IncidentState]:
+    """
+    Run the workflow for a batch of incidents, highest priority first,
+    then open batched PRs and release the run contexts.
+    Returns the final states.
+    """
+    # Heavy: agents, LLM clients, vector store
+    from graph.workflow import run_workflow
+    from memory.code_index import get_code_index
+    from tools.github_client import flush_pull_requests
+    from tools.llm_limiter import limiter_stats
+    from tools.model_router import get_model_router
+
+    # Highest blast radius / most critical jobs first
+    scheduler = IncidentScheduler()
+    for incident in incidents:
+        scheduler.push(incident)
+
+    print_queue(scheduler)
+
+    # Index code before RCA starts (only changed models are re-chunked)
+    for run_id in {incident.get("run_context_id") for incident in incidents}:
+        context = get_run_context(run_id)
+        if context:
+            get_code_index().update(context.manifest)
+
+    workers = workers or WORKFLOW_WORKERS
+    if replaying() and workers > 1:
+        # Repeated identical calls are served in recorded order
+        print("📼 Replay: running incidents on a single worker")
+        workers = 1
+
+    results = scheduler.run(run_workflow, workers=workers)
+    print("\nCLASSIFICATION AND RCA DONE")
+
+    # One PR per run for all auto-fixes
+    flush_pull_requests()
+
+    for run_id in {incident.get("run_context_id") for incident in incidents}:
+        release_run_context(run_id)
+
+    for stats in limiter_stats().values():
+        print(f"LLM concurrency [{stats['name']}]: {stats}")
+
+    print(f"Model routing: {get_model_router().stats()}")
+
+    return results
@@ -1,59 +1,106 @@
-from typing import List
+import time
+from typing import Any, Dict, List, Optional
 from state import IncidentState
 from tools.common_functions import get_failed_dbt_runs, get_run_artifact
+from api.run_context import RunContext, register_run_context
 
 
-def extract_dbt_incidents() -> List[IncidentState]:
+def incidents_for_run(
+    run: Dict[str, Any],
+    run_results: Optional[Dict[str, Any]] = None,
+    manifest: Optional[Dict[str, Any]] = None
+) -> List[IncidentState]:
+    """
+    One IncidentState per root failure of a single dbt Cloud run.
+    Artifacts are fetched unless the caller already has them.
+
+    Errored nodes downstream of another errored node are collapsed
+    into that root incident (impacted_models) instead of getting a
+    workflow run of their own.
+
+    All incidents share one registered RunContext (manifest, lineage,
+    run_results); states reference it by run_context_id.
+    """
     incidents: List[IncidentState] = []
 
-    failed_runs = get_failed_dbt_runs(limit=1)
+    run_id = run.get("id")
+    job_id = run.get("job_id")
 
-    for run in failed_runs:
-        run_id = run.get("id")
-        job_id = run.get("job_id") 
-        print(job_id)  
+    run_results = run_results or get_run_artifact(run_id, "run_results.json")
+    manifest = manifest or get_run_artifact(run_id, "manifest.json")
+
+    if not run_results or not manifest:
+        return incidents
+
+    context = register_run_context(RunContext(run, run_results, manifest))
+
+    detected_at = time.time()
 
-        run_results = get_run_artifact(run_id, "run_results.json")
-        manifest = get_run_artifact(run_id, "manifest.json")
+    # Skip cascade: only root failures become incidents
+    cascade_roots = context.cascade_roots()
+    collapsed = len(context.errored_nodes()) - len(cascade_roots)
 
-        if not run_results or not manifest:
+    if collapsed:
+        print(f"Collapsed {collapsed} downstream failure(s) into {len(cascade_roots)} root incident(s)")
+
+    for result in run_results.get("results", []):
+        if result.get("status") != "error":
+            continue
+
+        unique_id = result.get("unique_id")
+
+        if unique_id not in cascade_roots:
             continue
 
-        for result in run_results.get("results", []):
-            if result.get("status") != "error":
-                continue
-
-            unique_id = result.get("unique_id")
-            node = manifest.get("nodes", {}).get(unique_id, {})
-
-            status = result.get("status")
-            error_message = result.get("message")
-
-            # Fallback for compile-time failures
-            if not error_message and status == "error":
-                error_message = run.get("error")
-
-            # Final fallback
-            if not error_message:
-                error_message = "Compile-time failure (no message in artifact)"
-
-            state: IncidentState = {
-                "description": error_message,
-                "source": "dbt_cloud",
-                "job_id": job_id,              # REQUIRED FOR RETRY
-                "dbt_run_id": run_id,          # REQUIRED FOR ESCALATION
-                "incident_id": f"{run_id}_{unique_id}",    # Useful for memory
-                "model_name": node.get("name"),
-                "unique_id": unique_id,
-                "file_path": node.get("original_file_path"),
-                "raw_sql": node.get("raw_code"),
-                "compiled_sql": node.get("compiled_code"),
-                # Error Info
-                "error_message": error_message,
-                "execution_time": result.get("execution_time"),
-            }
-
-            incidents.append(state)
+        cascaded_failures = cascade_roots[unique_id]
+        node = context.node(unique_id)
+
+        status = result.get("status")
+        error_message = result.get("message")
+
+        # Fallback for compile-time failures
+        if not error_message and status == "error":
+            error_message = run.get("error")
+
+        # Final fallback
+        if not error_message:
+            error_message = "Compile-time failure (no message in artifact)"
+
+        state: IncidentState = {
+            "description": error_message,
+            "source": "dbt_cloud",
+            "job_id": job_id,              # REQUIRED FOR RETRY
+            "dbt_run_id": run_id,          # REQUIRED FOR ESCALATION
+            "incident_id": f"{run_id}_{unique_id}",    # Useful for memory
+            "model_name": node.get("name"),
+            "unique_id": unique_id,
+            "file_path": node.get("original_file_path"),
+            # SQL stays in the run context (see get_state_sql)
+            "run_context_id": run_id,
+            # Children dbt skipped because of this failure: analyzed with it
+            "skipped_models": context.skipped_descendants(unique_id),
+            # Descendants that errored too: impacted by this root failure
+            "cascaded_failures": cascaded_failures,
+            "impacted_models": list(cascaded_failures),
+            "blast_radius": len(cascaded_failures),
+            # Error Info
+            "error_message": error_message,
+            "execution_time": result.get("execution_time"),
+            "detected_at": detected_at,
+        }
+
+        incidents.append(state)
+
+    return incidents
+
+
+def extract_dbt_incidents(limit: int = 1) -> List[IncidentState]:
+    incidents: List[IncidentState] = []
+
+    failed_runs = get_failed_dbt_runs(limit=limit)
+
+    for run in failed_runs:
+        incidents.extend(incidents_for_run(run))
 
     print(f"Extracted {len(incidents)} dbt incidents")
     return incidents
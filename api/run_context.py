@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+from state import IncidentState
+from tools.manifest_index import LineageIndex, get_node
+
+# Released contexts kept for later lookups (replay, the UI); contexts
+# with incidents still pending are never evicted
+MAX_RUN_CONTEXTS = 16
+
+class RunContext:
+    """
+    Everything shared by the incidents of one dbt Cloud run:
+    run metadata, run_results, the parsed manifest and its lineage.
+
+    Incident states carry only run_context_id and look SQL / lineage
+    up here instead of holding their own copies.
+    """
+
+    def __init__(self, run: Dict[str, Any], run_results: Dict[str, Any], manifest: Dict[str, Any]):
+        self.run = run
+        self.run_id = run.get("id")
+        self.job_id = run.get("job_id")
+        self.run_results = run_results
+        self.manifest = manifest
+        self.lineage = LineageIndex(manifest)
+
+        self.results_by_id: Dict[str, Dict[str, Any]] = {
+            result.get("unique_id"): result
+            for result in run_results.get("results", [])
+        }
+
+    def node(self, unique_id: str) -> Dict[str, Any]:
+        return get_node(self.manifest, unique_id)
+
+    def status(self, unique_id: str) -> Optional[str]:
+        return (self.results_by_id.get(unique_id) or {}).get("status")
+
+    def errored_nodes(self) -> List[str]:
+        return [uid for uid, result in self.results_by_id.items() if result.get("status") == "error"]
+
+    def cascade_roots(self) -> Dict[str, List[str]]:
+        """
+        Errored nodes with no errored ancestor in this run, each mapped
+        to the errored descendants that most likely failed because of it.
+        """
+        errored = set(self.errored_nodes())
+        roots: Dict[str, List[str]] = {
+            uid: [] for uid in errored
+            if not errored.intersection(self.lineage.ancestors(uid))
+        }
+
+        for uid in errored.difference(roots):
+            for ancestor in self.lineage.ancestors(uid):
+                if ancestor in roots:
+                    roots[ancestor].append(uid)
+
+        for cascaded in roots.values():
+            cascaded.sort()
+
+        return roots
+
+    def skipped_descendants(self, unique_id: str) -> List[str]:
+        """
+        Descendants dbt skipped in this run because of this node.
+        """
+        return [uid for uid in self.lineage.descendants(unique_id) if self.status(uid) == "skipped"]
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+
+_contexts: "OrderedDict[Any, RunContext]" = OrderedDict()
+# run_id -> registrations not released yet
+_pins: Dict[Any, int] = {}
+_contexts_lock = threading.Lock()
+
+
+def register_run_context(context: RunContext) -> RunContext:
+    """
+    Register a run's context, pinned until release_run_context.
+    """
+    with _contexts_lock:
+        _contexts[context.run_id] = context
+        _contexts.move_to_end(context.run_id)
+        _pins[context.run_id] = _pins.get(context.run_id, 0) + 1
+        _evict()
+
+    return context
+
+
+def _evict():
+    released = [run_id for run_id in _contexts if run_id not in _pins]
+
+    for run_id in released[:max(len(_contexts) - MAX_RUN_CONTEXTS, 0)]:
+        del _contexts[run_id]
+
+
+def get_run_context(run_id) -> Optional[RunContext]:
+    with _contexts_lock:
+        return _contexts.get(run_id)
+
+
+def registered_manifest_ids() -> Set[int]:
+    """
+    id() of every registered context's manifest.
+    """
+    with _contexts_lock:
+        return {id(context.manifest) for context in _contexts.values()}
+
+
+def release_run_context(run_id):
+    """
+    Unpin a context once its incidents are done. It stays available
+    for lookups until MAX_RUN_CONTEXTS newer ones push it out.
+    """
+    with _contexts_lock:
+        if run_id not in _pins:
+            return
+
+        _pins[run_id] -= 1
+        if _pins[run_id] <= 0:
+            del _pins[run_id]
+            _evict()
+
+
+def context_for_state(state: IncidentState) -> Optional[RunContext]:
+    run_context_id = state.get("run_context_id")
+    return get_run_context(run_context_id) if run_context_id is not None else None
+
+
+def get_state_sql(state: IncidentState, compiled: bool = False) -> Optional[str]:
+    """
+    SQL for an incident: from state if present, else from its run context.
+    """
+    key = "compiled_sql" if compiled else "raw_sql"
+
+    if state.get(key):
+        return state[key]
+
+    context = context_for_state(state)
+    if not context or not state.get("unique_id"):
+        return None
+
+    node = context.node(state["unique_id"])
+    return node.get("compiled_code" if compiled else "raw_code") or node.get(key)
@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from state import IncidentState
+from api.run_context import context_for_state
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+# Job criticality multipliers: JOB_CRITICALITY="123=5,456=0.5"
+# or a JSON file {"123": 5} at JOB_CRITICALITY_PATH
+DEFAULT_CRITICALITY = float(os.getenv("DEFAULT_JOB_CRITICALITY", "1.0"))
+
+DOWNSTREAM_WEIGHT = float(os.getenv("SCHEDULER_DOWNSTREAM_WEIGHT", "1.0"))
+EXPOSURE_WEIGHT = float(os.getenv("SCHEDULER_EXPOSURE_WEIGHT", "10.0"))
+
+# Score a waiting incident gains per minute (prevents starvation)
+AGING_PER_MINUTE = float(os.getenv("SCHEDULER_AGING_PER_MINUTE", "5.0"))
+
+WORKFLOW_WORKERS = int(os.getenv("WORKFLOW_WORKERS", "2"))
+
+
+def load_job_criticality() -> Dict[str, float]:
+    criticality: Dict[str, float] = {}
+
+    path = os.getenv("JOB_CRITICALITY_PATH")
+    if path and os.path.exists(path):
+        with open(path) as f:
+            criticality.update({str(job): float(value) for job, value in json.load(f).items()})
+
+    for entry in filter(None, os.getenv("JOB_CRITICALITY", "").split(",")):
+        job, _, value = entry.partition("=")
+        try:
+            criticality[job.strip()] = float(value)
+        except ValueError:
+            print(f"⚠️ Ignoring invalid JOB_CRITICALITY entry {entry!r}")
+
+    return criticality
+
+
+JOB_CRITICALITY = load_job_criticality()
+
+
+# -----------------------------
+# Pre-score
+# -----------------------------
+
+def pre_score(state: IncidentState) -> Dict[str, Any]:
+    """
+    Cheap priority estimate from lineage and job criticality, computed
+    before any LLM work:
+
+        criticality x (1 + downstream models x w1 + exposures x w2)
+    """
+    downstream = exposures = 0
+
+    context = context_for_state(state)
+    if context and state.get("unique_id"):
+        for unique_id in context.lineage.descendants(state["unique_id"]):
+            if unique_id.startswith("exposure."):
+                exposures += 1
+            else:
+                downstream += 1
+
+    criticality = JOB_CRITICALITY.get(str(state.get("job_id")), DEFAULT_CRITICALITY)
+    score = criticality * (1 + downstream * DOWNSTREAM_WEIGHT + exposures * EXPOSURE_WEIGHT)
+
+    return {
+        "score": score,
+        "downstream": downstream,
+        "exposures": exposures,
+        "criticality": criticality,
+    }
+
+
+# -----------------------------
+# Scheduler
+# -----------------------------
+
+class IncidentScheduler:
+    """
+    Priority queue of incidents in front of the workflow workers.
+
+    Effective priority = score + aging_rate x seconds waited. Since all
+    entries age at the same rate, ordering by score - aging_rate x
+    enqueued_at is equivalent and never needs re-heapifying.
+    """
+
+    def __init__(self, aging_per_minute: float = AGING_PER_MINUTE):
+        self.aging_rate = aging_per_minute / 60.0
+        self.heap: List[tuple] = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def __len__(self) -> int:
+        with self.condition:
+            return len(self.heap)
+
+    def push(self, state: IncidentState) -> float:
+        breakdown = pre_score(state)
+        state["priority_score"] = breakdown["score"]
+
+        enqueued_at = time.time()
+        key = self.aging_rate * enqueued_at - breakdown["score"]
+
+        with self.condition:
+            heapq.heappush(self.heap, (key, next(self.sequence), enqueued_at, breakdown, state))
+            self.condition.notify()
+
+        return breakdown["score"]
+
+    def pop(self, timeout: Optional[float] = None) -> Optional[IncidentState]:
+        """
+        Highest effective priority first. Returns None once the
+        scheduler is closed and drained (or on timeout).
+        """
+        with self.condition:
+            while not self.heap:
+                if self.closed or not self.condition.wait(timeout):
+                    return None
+
+            return heapq.heappop(self.heap)[-1]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Current queue in processing order (for inspection / logging).
+        """
+        now = time.time()
+
+        with self.condition:
+            entries = sorted(self.heap)
+
+        return [
+            {
+                "incident_id": state.get("incident_id"),
+                "model_name": state.get("model_name"),
+                "job_id": state.get("job_id"),
+                **breakdown,
+                "waited_seconds": round(now - enqueued_at, 1),
+                "effective_priority": breakdown["score"] + self.aging_rate * (now - enqueued_at),
+            }
+            for _, _, enqueued_at, breakdown, state in entries
+        ]
+
+    def run(self, process: Callable[[IncidentState], IncidentState], workers: int = WORKFLOW_WORKERS) -> List[IncidentState]:
+        """
+        Drain the queue with a pool of worker threads.
+        Returns final states in completion order.
+        """
+        results: List[IncidentState] = []
+        results_lock = threading.Lock()
+
+        def worker():
+            while True:
+                # Queue drained: this worker is done
+                state = self.pop(timeout=0.1)
+                if state is None:
+                    return
+
+                print(f"\n--- Processing Incident {state.get('incident_id')} "
+                      f"(priority {state.get('priority_score', 0):.1f}) ---")
+
+                try:
+                    final_state = process(state)
+                except Exception as e:
+                    print(f"❌ Workflow failed for {state.get('incident_id')}: {e}")
+                    final_state = state
+
+                with results_lock:
+                    results.append(final_state)
+
+        threads = [
+            threading.Thread(target=worker, name=f"workflow-{number}", daemon=True)
+            for number in range(max(workers, 1))
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+
+def print_queue(scheduler: IncidentScheduler, limit: int = 20):
+    entries = scheduler.snapshot()
+
+    print(f"\n📋 Incident queue ({len(entries)} pending)")
+    for position, entry in enumerate(entries[:limit], start=1):
+        print(
+            f"{position:>3}. {entry['model_name'] or entry['incident_id']:<40} "
+            f"score={entry['score']:.1f} downstream={entry['downstream']} "
+            f"exposures={entry['exposures']} criticality={entry['criticality']} "
+            f"waited={entry['waited_seconds']}s"
+        )
@@ -0,0 +1,268 @@
+"""
+AI-Ops command line.
+
+    python cli.py status 12345
+    python cli.py ingest --limit 5
+    python cli.py process --run-id 12345
+    python cli.py replay 12345_model.analytics.orders
+    python cli.py retry 678 --model orders
+    python cli.py bench --n 20000
+
+    # Capture every LLM / embeddings / dbt Cloud call, then re-run the
+    # same incidents offline against the recording
+    python cli.py --cassette prod.jsonl.gz --record process --limit 20
+    python cli.py --cassette prod.jsonl.gz --replay process --limit 20
+
+Heavy modules (langgraph, langchain, FAISS, the agents) are imported
+inside the commands that need them, so status / ingest / retry start
+fast enough for scripts and cron.
+"""
+
+import json
+import os
+from typing import Optional
+
+import typer
+
+app = typer.Typer(help="AI-Ops agent for dbt Cloud failures.", no_args_is_help=True, add_completion=False)
+
+# Fields set at ingestion; everything else is recomputed on replay
+REPLAY_INPUT_KEYS = (
+    "incident_id", "description", "source", "job_id", "dbt_run_id",
+    "model_name", "unique_id", "file_path", "run_context_id",
+    "skipped_models", "cascaded_failures", "impacted_models", "blast_radius",
+    "error_message", "execution_time", "detected_at",
+)
+
+INCIDENT_SUMMARY_KEYS = (
+    "incident_id", "model_name", "job_id", "dbt_run_id",
+    "blast_radius", "cascaded_failures", "skipped_models", "description",
+)
+
+
+@app.callback()
+def main(
+    cassette: Optional[str] = typer.Option(None, help="Cassette file (gzip JSONL) of external calls."),
+    record: bool = typer.Option(False, "--record", help="Record external calls to the cassette."),
+    replay: bool = typer.Option(False, "--replay", help="Serve external calls from the cassette, offline."),
+    keep_latency: bool = typer.Option(False, help="On replay, wait the recorded latency of each call.")
+):
+    if record and replay:
+        typer.echo("--record and --replay are mutually exclusive", err=True)
+        raise typer.Exit(2)
+
+    if (record or replay) and not cassette:
+        typer.echo("--record / --replay need --cassette", err=True)
+        raise typer.Exit(2)
+
+    if cassette:
+        # Read by tools.cassette at import
+        os.environ["AIOPS_CASSETTE"] = cassette
+        os.environ["AIOPS_CASSETTE_MODE"] = "record" if record else "replay" if replay else "off"
+        os.environ["AIOPS_CASSETTE_LATENCY"] = "1" if keep_latency else "0"
+
+
+def _ingest(limit: int, run_id: Optional[int]):
+    if run_id is None:
+        from api.dbt_ingestor import extract_dbt_incidents
+        return extract_dbt_incidents(limit=limit)
+
+    from api.dbt_ingestor import incidents_for_run
+    from tools.common_functions import get_dbt_run
+
+    run = get_dbt_run(run_id)
+    if not run:
+        typer.echo(f"Run {run_id} not found", err=True)
+        raise typer.Exit(1)
+
+    return incidents_for_run(run)
+
+
+def _restore_run_context(stored, state):
+    """
+    Re-ingest the incident's dbt run: run contexts (manifest, SQL,
+    lineage) only live in the process that ingested it.
+    """
+    from api.dbt_ingestor import incidents_for_run
+    from tools.common_functions import get_dbt_run
+
+    # dbt_run_id is replaced by the rerun's id after a successful retry
+    run_id = stored.get("run_context_id") or stored.get("dbt_run_id")
+    run = get_dbt_run(run_id) if run_id else None
+    incidents = incidents_for_run(run) if run else []
+
+    for incident in incidents:
+        if incident.get("incident_id") == stored["incident_id"]:
+            state["run_context_id"] = incident["run_context_id"]
+            return state
+
+    typer.echo(f"Cannot rebuild the run context of {stored['incident_id']} (run {run_id})", err=True)
+    raise typer.Exit(1)
+
+
+# -----------------------------
+# Commands
+# -----------------------------
+
+@app.command()
+def status(run_id: int, as_json: bool = typer.Option(False, "--json", help="Machine-readable output.")):
+    """
+    Show the status of a dbt Cloud run.
+    """
+    from tools.common_functions import RUN_STATUS_NAMES, get_dbt_run
+
+    run = get_dbt_run(run_id)
+    if not run:
+        typer.echo(f"Run {run_id} not found", err=True)
+        raise typer.Exit(1)
+
+    summary = {
+        "run_id": run_id,
+        "job_id": run.get("job_id"),
+        "status": RUN_STATUS_NAMES.get(run.get("status"), "unknown"),
+        "finished_at": run.get("finished_at"),
+    }
+
+    if as_json:
+        typer.echo(json.dumps(summary))
+    else:
+        typer.echo(f"Run {run_id} (job {summary['job_id']}): {summary['status']}")
+
+
+@app.command()
+def ingest(
+    limit: int = typer.Option(1, help="Most recent failed runs to read."),
+    run_id: Optional[int] = typer.Option(None, help="Read one specific run instead."),
+    as_json: bool = typer.Option(False, "--json", help="Machine-readable output.")
+):
+    """
+    Extract incidents from failed runs without running the workflow.
+    """
+    incidents = _ingest(limit, run_id)
+    summaries = [{key: incident.get(key) for key in INCIDENT_SUMMARY_KEYS} for incident in incidents]
+
+    if as_json:
+        typer.echo(json.dumps(summaries, default=str))
+        return
+
+    for summary in summaries:
+        first_line = ((summary["description"] or "").strip().splitlines() or [""])[0]
+        typer.echo(
+            f"{summary['incident_id']}: blast_radius={summary['blast_radius']} "
+            f"cascaded={len(summary['cascaded_failures'] or [])} "
+            f"skipped={len(summary['skipped_models'] or [])}\n"
+            f"    {first_line[:160]}"
+        )
+
+
+@app.command()
+def process(
+    limit: int = typer.Option(1, help="Most recent failed runs to process."),
+    run_id: Optional[int] = typer.Option(None, help="Process one specific run instead."),
+    workers: Optional[int] = typer.Option(None, help="Workflow worker threads (default WORKFLOW_WORKERS)."),
+    profile: bool = typer.Option(False, help="Write profiles to AIOPS_PROFILE_DIR.")
+):
+    """
+    Ingest failed runs and run the full workflow for each incident.
+    """
+    if profile:
+        # Read by tools.profiling at import
+        os.environ["AIOPS_PROFILE"] = "1"
+
+    from api.batch import process_incidents
+    from tools.profiling import profile_batch
+
+    with profile_batch("process"):
+        incidents = _ingest(limit, run_id)
+
+        if not incidents:
+            typer.echo("No dbt failures found.")
+            return
+
+        process_incidents(incidents, workers=workers)
+
+
+@app.command()
+def replay(
+    incident_id: str,
+    full: bool = typer.Option(False, help="Run the whole graph (may trigger reruns / alerts)."),
+    persist: bool = typer.Option(False, help="Overwrite the stored incident with the new result.")
+):
+    """
+    Re-analyze a stored incident from its ingested inputs.
+    By default only classification and RCA are re-run.
+    """
+    from memory.incident_store import get_incident_store
+
+    stored = get_incident_store().get(incident_id)
+    if not stored:
+        typer.echo(f"Incident {incident_id} not found", err=True)
+        raise typer.Exit(1)
+
+    state = {key: stored[key] for key in REPLAY_INPUT_KEYS if key in stored}
+
+    from api.run_context import context_for_state
+
+    if context_for_state(state) is None:
+        state = _restore_run_context(stored, state)
+
+    if full:
+        from graph.workflow import run_workflow
+        final_state = run_workflow(state, persist=persist)
+    else:
+        from agents.incident_agent import classify_incident
+        from agents.rca_agent import analyze_root_cause
+        final_state = analyze_root_cause(classify_incident(state))
+
+        if persist:
+            get_incident_store().save(final_state)
+
+    for key in ("incident_type", "recommended_action", "retry_status"):
+        typer.echo(f"{key}: {stored.get(key)} → {final_state.get(key)}")
+
+    causes = final_state.get("root_causes") or []
+    if causes and isinstance(causes[0], dict):
+        typer.echo(f"primary root cause: {causes[0].get('cause')}")
+
+
+@app.command()
+def retry(
+    job_id: int,
+    model: Optional[str] = typer.Option(None, help="Rerun only this model and its children (select mode)."),
+    mode: Optional[str] = typer.Option(None, help="select | retry | full (default DBT_RERUN_MODE)."),
+    attempts: int = typer.Option(1, min=1, max=3),
+    delay: int = typer.Option(15, help="Seconds between attempts.")
+):
+    """
+    Rerun a dbt Cloud job and wait for the result.
+    """
+    if mode:
+        # Read by tools.common_functions at import
+        os.environ["DBT_RERUN_MODE"] = mode
+
+    from tools.common_functions import rerun_options, retry_dbt_cloud_job
+
+    result = retry_dbt_cloud_job(job_id, max_attempts=attempts, delay_seconds=delay, **rerun_options(model))
+    typer.echo(json.dumps(result))
+
+    if not result.get("success"):
+        raise typer.Exit(1)
+
+
+@app.command()
+def bench(
+    n: int = typer.Option(20000, help="Indexed vectors."),
+    dim: int = typer.Option(768),
+    queries: int = typer.Option(200),
+    k: int = typer.Option(10)
+):
+    """
+    Recall / latency benchmark of the incident memory ANN index modes.
+    """
+    from memory.benchmark_ann import print_results, run_benchmark
+
+    print_results(run_benchmark(n, dim, queries, k))
+
+
+if __name__ == "__main__":
+    app()
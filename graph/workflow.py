@@ -1,9 +1,15 @@
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
 from langgraph.graph import StateGraph
 from state import IncidentState
 from agents.incident_agent import classify_incident
 from agents.rca_agent import analyze_root_cause
 from agents.retry_agent import retry_agent_node
 from agents.escalation_agent import escalation_node
+from agents.speculative_retry import cancel_speculative_node, speculative_retry_node
+from memory.incident_store import get_incident_store
+from tools.cassette import replaying
+from tools.profiling import PROFILE_ENABLED, profile_incident, profiled_node
 
 
 # ---------------------------------
@@ -17,13 +23,17 @@ def route_after_rca(state: IncidentState) -> str:
 
     # If RCA confidence is low → escalate
     if state.get("confidence") == "low":
-        return "escalate"
+        return "cancel_speculative" if state.get("speculative_run_id") else "escalate"
 
     action = state.get("recommended_action")
 
     if action == "retry_run":
         return "retry"
 
+    # A speculative rerun was started before RCA disagreed
+    if state.get("speculative_run_id"):
+        return "cancel_speculative"
+
     return "escalate"
 
 
@@ -32,27 +42,36 @@ def route_after_rca(state: IncidentState) -> str:
 # Build Graph
 # ---------------------------------
 
+@lru_cache(maxsize=1)
 def build_graph():
     graph = StateGraph(IncidentState)
 
-    graph.add_node("classify", classify_incident)
-    graph.add_node("rca", analyze_root_cause)
-    graph.add_node("retry", retry_agent_node)
-    graph.add_node("escalate", escalation_node)
+    # Nodes are profiled only while their incident is (see run_workflow)
+    graph.add_node("classify", profiled_node("classify", classify_incident))
+    graph.add_node("speculate", profiled_node("speculate", speculative_retry_node))
+    graph.add_node("rca", profiled_node("rca", analyze_root_cause))
+    graph.add_node("retry", profiled_node("retry", retry_agent_node))
+    graph.add_node("cancel_speculative", profiled_node("cancel_speculative", cancel_speculative_node))
+    graph.add_node("escalate", profiled_node("escalate", escalation_node))
 
     graph.set_entry_point("classify")
 
-    graph.add_edge("classify", "rca")
+    # Speculation is a no-op unless enabled and rule-classified transient
+    graph.add_edge("classify", "speculate")
+    graph.add_edge("speculate", "rca")
 
     graph.add_conditional_edges(
         "rca",
         route_after_rca,
         {
             "retry": "retry",
+            "cancel_speculative": "cancel_speculative",
             "escalate": "escalate",
         }
     )
 
+    graph.add_edge("cancel_speculative", "escalate")
+
     # Important:
     # retry_agent_node already escalates internally if needed
     # So no outgoing edge required from retry
@@ -64,6 +83,42 @@ def build_graph():
 # Run Workflow
 # ---------------------------------
 
-def run_workflow(state: IncidentState):
+def run_workflow(state: IncidentState, persist: Optional[bool] = None, profile: bool = PROFILE_ENABLED):
+    """
+    persist: save the final state to the incident store (default: yes,
+    unless replaying a cassette).
+    profile: write per-node cProfile / allocation reports for this
+    incident (default from AIOPS_PROFILE, see tools/profiling.py).
+    """
+    app = build_graph()
+
+    with profile_incident(state.get("incident_id"), enabled=profile):
+        final_state = app.invoke(state)
+
+    if persist is None:
+        persist = not replaying()
+
+    if persist:
+        get_incident_store().save(final_state)
+
+    return final_state
+
+
+def stream_workflow(state: IncidentState, persist: Optional[bool] = None) -> Iterator[Tuple[str, IncidentState]]:
+    """
+    Run the workflow, yielding (node_name, state) after each node
+    so callers (e.g. the UI) can show progress.
+    """
     app = build_graph()
-    return app.invoke(state)
+    final_state = dict(state)
+
+    for update in app.stream(state, stream_mode="updates"):
+        for node_name, node_state in update.items():
+            final_state.update(node_state or {})
+            yield node_name, final_state
+
+    if persist is None:
+        persist = not replaying()
+
+    if persist:
+        get_incident_store().save(final_state)
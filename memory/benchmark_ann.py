@@ -0,0 +1,97 @@
+"""
+Recall / latency benchmark of the ANN index modes against flat search.
+
+    python -m memory.benchmark_ann --n 50000 --dim 768
+"""
+
+import argparse
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from memory.vector_store import HNSW_EF_SEARCH, IVF_NPROBE, build_index, search_params
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 200, seed: int = 7) -> np.ndarray:
+    """
+    Clustered unit vectors, closer to real incident embeddings than
+    uniform noise (recurring failures form tight groups).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 1.0 * rng.normal(size=(n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def run_benchmark(
+    n: int = 20000,
+    dim: int = 768,
+    queries: int = 200,
+    k: int = 10,
+    ef_search_values: List[int] = (16, 32, HNSW_EF_SEARCH, 128),
+    nprobe_values: List[int] = (1, 4, IVF_NPROBE, 16)
+) -> List[Dict]:
+    vectors = synthetic_vectors(n + queries, dim)
+    data, query_vectors = vectors[:n], vectors[n:]
+
+    results = []
+
+    flat = build_index("flat", dim, data)
+    started = time.perf_counter()
+    _, truth = flat.search(query_vectors, k)
+    flat_ms = (time.perf_counter() - started) * 1000 / queries
+    results.append({"index": "flat", "param": "-", "recall": 1.0, "ms_per_query": flat_ms, "build_s": 0.0})
+
+    def measure(name, index, build_seconds, param_name, values, make_params):
+        for value in values:
+            params = make_params(value)
+            started = time.perf_counter()
+            _, found = index.search(query_vectors, k, params=params)
+            elapsed_ms = (time.perf_counter() - started) * 1000 / queries
+
+            hits = sum(len(set(found[i]) & set(truth[i])) for i in range(queries))
+            results.append({
+                "index": name,
+                "param": f"{param_name}={value}",
+                "recall": hits / (queries * k),
+                "ms_per_query": elapsed_ms,
+                "build_s": build_seconds
+            })
+
+    started = time.perf_counter()
+    hnsw = build_index("hnsw", dim, data)
+    build_seconds = time.perf_counter() - started
+    measure("hnsw", hnsw, build_seconds, "efSearch", ef_search_values,
+            lambda value: search_params(hnsw, ef_search=value))
+
+    started = time.perf_counter()
+    ivf = build_index("ivf", dim, data)
+    build_seconds = time.perf_counter() - started
+    measure("ivf", ivf, build_seconds, "nprobe", nprobe_values,
+            lambda value: search_params(ivf, nprobe=value))
+
+    return results
+
+
+def print_results(results: List[Dict]):
+    print(f"{'index':<6} {'param':<14} {'recall@k':>9} {'ms/query':>9} {'build s':>8}")
+    for row in results:
+        print(
+            f"{row['index']:<6} {row['param']:<14} {row['recall']:>9.3f} "
+            f"{row['ms_per_query']:>9.3f} {row['build_s']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    print_results(run_benchmark(args.n, args.dim, args.queries, args.k))
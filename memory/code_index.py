@@ -0,0 +1,425 @@
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from tools.common_functions import EMBEDDING_MODEL, get_embeddings
+from tools.prompt_budget import estimate_tokens
+from memory.lexical_index import BM25Index, reciprocal_rank_fusion
+from api.run_context import registered_manifest_ids
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+# hybrid (BM25 + embeddings, rank-fused) | lexical (no embedding calls)
+CODE_INDEX_MODE = os.getenv("CODE_INDEX_MODE", "hybrid")
+
+# Chunk embeddings by content hash, so restarts and manifest updates
+# only embed chunks that actually changed
+CODE_EMBEDDINGS_PATH = os.getenv("CODE_EMBEDDINGS_PATH", ".aiops/code_embeddings.db")
+
+CHUNK_TOKENS = int(os.getenv("CODE_CHUNK_TOKENS", "120"))
+
+EMBED_BATCH_SIZE = 64
+
+INDEXED_RESOURCE_TYPES = ("model", "snapshot", "seed")
+
+# Manifests kept indexed besides those of registered run contexts
+# (which are never dropped while registered)
+MAX_MANIFESTS = int(os.getenv("CODE_INDEX_MAX_MANIFESTS", "4"))
+
+
+def _hash(*parts) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def node_checksum(node: Dict[str, Any]) -> str:
+    """
+    Changes whenever the node's SQL or documentation changes
+    (dbt's own checksum only covers the file).
+    """
+    columns = sorted(
+        (name, (column or {}).get("description"))
+        for name, column in (node.get("columns") or {}).items()
+    )
+    return _hash(node.get("raw_code") or node.get("raw_sql"), node.get("description"), columns)
+
+
+# -----------------------------
+# Chunking
+# -----------------------------
+
+def _docs_text(node: Dict[str, Any]) -> str:
+    lines = []
+
+    if node.get("description"):
+        lines.append(node["description"].strip())
+
+    for name, column in (node.get("columns") or {}).items():
+        description = ((column or {}).get("description") or "").strip()
+        lines.append(f"{name}: {description}" if description else name)
+
+    return "\n".join(lines)
+
+
+def _sql_chunks(sql: str, max_tokens: int) -> List[Tuple[int, int, str]]:
+    """
+    Split SQL into (start_line, end_line, text) pieces of roughly
+    max_tokens, preferring to cut at blank lines (CTE boundaries).
+    """
+    lines = sql.splitlines()
+    chunks = []
+    start = 0
+    used = 0
+
+    for index, line in enumerate(lines):
+        used += estimate_tokens(line) + 1
+        at_boundary = not line.strip() and used >= max_tokens // 2
+
+        if used >= max_tokens or at_boundary or index == len(lines) - 1:
+            text = "\n".join(lines[start:index + 1]).strip()
+            if text:
+                chunks.append((start + 1, index + 1, text))
+            start = index + 1
+            used = 0
+
+    return chunks
+
+
+def chunk_node(unique_id: str, node: Dict[str, Any], max_tokens: int = CHUNK_TOKENS) -> List[Dict[str, Any]]:
+    name = node.get("name") or unique_id
+    path = node.get("original_file_path") or ""
+    chunks = []
+
+    docs = _docs_text(node)
+    if docs:
+        chunks.append({
+            "unique_id": unique_id,
+            "kind": "docs",
+            "header": f"{unique_id} (docs)",
+            "code": docs,
+        })
+
+    sql = node.get("raw_code") or node.get("raw_sql") or ""
+    for start_line, end_line, text in _sql_chunks(sql, max_tokens):
+        chunks.append({
+            "unique_id": unique_id,
+            "kind": "sql",
+            "header": f"{unique_id} ({path} lines {start_line}-{end_line})",
+            "code": text,
+        })
+
+    for chunk in chunks:
+        # Names are searchable too ("stg_orders" matches its own SQL)
+        chunk["text"] = f"{name} {path}\n{chunk['code']}"
+        chunk["hash"] = _hash(EMBEDDING_MODEL, chunk["text"])
+
+    return chunks
+
+
+# -----------------------------
+# Embedding Cache
+# -----------------------------
+
+class EmbeddingCache:
+    """
+    Local SQLite store of chunk vectors keyed by content hash.
+    """
+
+    def __init__(self, path: str = CODE_EMBEDDINGS_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS code_embeddings (
+                hash TEXT PRIMARY KEY,
+                vector BLOB NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+
+        with self.lock:
+            # SQLite caps bound parameters per statement
+            for offset in range(0, len(hashes), 500):
+                batch = hashes[offset:offset + 500]
+                rows = self.conn.execute(
+                    f"SELECT hash, vector FROM code_embeddings WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype="float32")) for key, blob in rows)
+
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO code_embeddings VALUES (?, ?)",
+                [(key, vector.astype("float32").tobytes()) for key, vector in vectors.items()]
+            )
+            self.conn.commit()
+
+
+# -----------------------------
+# Code Index
+# -----------------------------
+
+class ModelCodeIndex:
+    """
+    Chunked BM25 (+ embedding) index over the SQL and docs of every
+    model in a manifest, for RCA context retrieval.
+
+    Chunks are stored per node version (unique_id, checksum), so runs
+    with different manifests share one index without swapping it:
+    update() only chunks versions not indexed yet, and search() is
+    restricted to the caller's manifest versions of the given nodes
+    (e.g. a model's upstream closure), whose few candidate vectors are
+    scored exactly. Versions used neither by a registered run context's
+    manifest nor by the last max_manifests other ones are dropped.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        mode: str = CODE_INDEX_MODE,
+        cache: Optional[EmbeddingCache] = None,
+        max_manifests: int = MAX_MANIFESTS
+    ):
+        self.mode = mode
+        self.embeddings = embeddings or (get_embeddings() if mode != "lexical" else None)
+        self.cache = cache or (EmbeddingCache() if mode != "lexical" else None)
+        self.max_manifests = max_manifests
+        self.lock = threading.RLock()
+        self.lexical = BM25Index()
+        self.chunks: Dict[int, Dict[str, Any]] = {}
+        self.vectors: Dict[int, np.ndarray] = {}
+        # (unique_id, checksum) -> chunk ids
+        self.versions: Dict[Tuple[str, str], List[int]] = {}
+        # id(manifest) -> (manifest, unique_id -> checksum), oldest first;
+        # holding the manifest keeps its id from being reused
+        self.manifests: "OrderedDict[int, Tuple[Dict[str, Any], Dict[str, str]]]" = OrderedDict()
+        self.ids = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    # -----------------------------
+    # Updates
+    # -----------------------------
+
+    def _remove_version(self, version: Tuple[str, str]):
+        for chunk_id in self.versions.pop(version, []):
+            self.chunks.pop(chunk_id, None)
+            self.vectors.pop(chunk_id, None)
+            self.lexical.remove(chunk_id)
+
+    def _embed(self, chunks: Dict[int, Dict[str, Any]]) -> Dict[int, np.ndarray]:
+        """
+        Vectors for new chunks: cached ones first, the rest embedded in
+        batches. Chunks that cannot be embedded stay lexical-only.
+        """
+        if self.mode == "lexical" or not chunks:
+            return {}
+
+        cached = self.cache.get_many(list({chunk["hash"] for chunk in chunks.values()}))
+        missing = [chunk_id for chunk_id, chunk in chunks.items() if chunk["hash"] not in cached]
+
+        fresh: Dict[str, np.ndarray] = {}
+        for offset in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[offset:offset + EMBED_BATCH_SIZE]
+            try:
+                vectors = self.embeddings.embed_documents([chunks[chunk_id]["text"] for chunk_id in batch])
+            except Exception as exc:
+                print(f"⚠️ Code embedding failed ({exc}); {len(missing) - offset} chunk(s) stay lexical-only")
+                break
+
+            for chunk_id, vector in zip(batch, vectors):
+                fresh[chunks[chunk_id]["hash"]] = np.asarray(vector, dtype="float32")
+
+        if fresh:
+            self.cache.put_many(fresh)
+
+        vectors = {**cached, **fresh}
+        found = {}
+
+        for chunk_id, chunk in chunks.items():
+            vector = vectors.get(chunk["hash"])
+            if vector is not None:
+                found[chunk_id] = vector / (np.linalg.norm(vector) or 1.0)
+
+        return found
+
+    def _checksums(self, manifest: Dict[str, Any]) -> Dict[str, str]:
+        """
+        unique_id -> checksum of the manifest's indexed nodes,
+        computed once per manifest object.
+        """
+        known = self.manifests.get(id(manifest))
+        if known and known[0] is manifest:
+            self.manifests.move_to_end(id(manifest))
+            return known[1]
+
+        nodes = {
+            unique_id: node
+            for unique_id, node in manifest.get("nodes", {}).items()
+            if node.get("resource_type", "model") in INDEXED_RESOURCE_TYPES
+        }
+        nodes.update(manifest.get("sources", {}))
+
+        checksums = {unique_id: node_checksum(node) for unique_id, node in nodes.items()}
+        self.manifests[id(manifest)] = (manifest, checksums)
+        return checksums
+
+    def update(self, manifest: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Index a manifest. Only node versions not indexed yet are
+        chunked; a no-op for a manifest object seen recently.
+        Returns counts of added and dropped node versions.
+        """
+        if manifest is None:
+            return {"changed": 0, "removed": 0}
+
+        with self.lock:
+            known = self.manifests.get(id(manifest))
+            if known and known[0] is manifest:
+                self.manifests.move_to_end(id(manifest))
+                return {"changed": 0, "removed": 0}
+
+            started = time.perf_counter()
+            checksums = self._checksums(manifest)
+            new_chunks: Dict[int, Dict[str, Any]] = {}
+            changed = 0
+
+            for unique_id, checksum in checksums.items():
+                if (unique_id, checksum) in self.versions:
+                    continue
+
+                changed += 1
+                node = manifest.get("nodes", {}).get(unique_id) or manifest.get("sources", {}).get(unique_id)
+
+                chunk_ids = []
+                for chunk in chunk_node(unique_id, node):
+                    chunk_id = next(self.ids)
+                    self.chunks[chunk_id] = chunk
+                    self.lexical.add(chunk_id, chunk["text"])
+                    new_chunks[chunk_id] = chunk
+                    chunk_ids.append(chunk_id)
+
+                self.versions[(unique_id, checksum)] = chunk_ids
+
+            removed = 0
+            if len(self.manifests) > self.max_manifests:
+                registered = registered_manifest_ids()
+                others = [key for key in self.manifests if key not in registered]
+
+                # Oldest first; the manifest just indexed is always kept
+                for key in others[:len(others) - self.max_manifests]:
+                    if key != id(manifest):
+                        del self.manifests[key]
+
+                in_use = {
+                    version
+                    for _, versions in self.manifests.values()
+                    for version in versions.items()
+                }
+                for version in [version for version in self.versions if version not in in_use]:
+                    self._remove_version(version)
+                    removed += 1
+
+            self.vectors.update(self._embed(new_chunks))
+
+        if changed or removed:
+            print(
+                f"📚 Code index: {changed} node(s) re-chunked, {removed} dropped, "
+                f"{len(self.chunks)} chunks ({time.perf_counter() - started:.2f}s)"
+            )
+
+        return {"changed": changed, "removed": removed}
+
+    # -----------------------------
+    # Search
+    # -----------------------------
+
+    def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self.embeddings.embed_query(query), dtype="float32")
+        except Exception as exc:
+            print(f"⚠️ Embedding failed ({exc}); using lexical code retrieval")
+            return None
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def search(self, manifest: Dict[str, Any], query: str, unique_ids: List[str], k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Top-k chunks of the given nodes, as they are in this manifest,
+        for the query, best first.
+        """
+        if manifest is None:
+            return []
+
+        query_vector = None
+        if self.mode != "lexical":
+            query_vector = self._embed_query(query)
+
+        with self.lock:
+            # Keeps this manifest's versions from being dropped meanwhile
+            self.update(manifest)
+            checksums = self._checksums(manifest)
+            allowed = {
+                chunk_id
+                for unique_id in unique_ids
+                if unique_id in checksums
+                for chunk_id in self.versions.get((unique_id, checksums[unique_id]), [])
+            }
+            if not allowed:
+                return []
+
+            fetch = k * 4
+            rankings = [self.lexical.search(query, k=fetch, allowed=allowed)]
+
+            with_vectors = [chunk_id for chunk_id in allowed if chunk_id in self.vectors]
+            if query_vector is not None and with_vectors:
+                scores = np.stack([self.vectors[chunk_id] for chunk_id in with_vectors]) @ query_vector
+                order = np.argsort(-scores)[:fetch]
+                rankings.append([(with_vectors[i], float(scores[i])) for i in order])
+
+            if len(rankings) == 1:
+                ranked = [chunk_id for chunk_id, _ in rankings[0]]
+            else:
+                fused = reciprocal_rank_fusion(rankings)
+                ranked = sorted(fused, key=fused.get, reverse=True)
+
+            return [self.chunks[chunk_id] for chunk_id in ranked[:k]]
+
+
+# -----------------------------
+# Shared Instance
+# -----------------------------
+
+_index: Optional[ModelCodeIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_code_index() -> ModelCodeIndex:
+    global _index
+
+    with _index_lock:
+        if _index is None:
+            _index = ModelCodeIndex()
+
+    return _index
@@ -0,0 +1,251 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from state import IncidentState
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+INCIDENT_STORE_PATH = os.getenv("INCIDENT_STORE_PATH", ".aiops/incidents.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    incident_id TEXT PRIMARY KEY,
+    run_id INTEGER,
+    job_id INTEGER,
+    model_name TEXT,
+    unique_id TEXT,
+    incident_type TEXT,
+    confidence TEXT,
+    recommended_action TEXT,
+    root_cause TEXT,
+    retry_status TEXT,
+    escalated INTEGER,
+    detected_at REAL,
+    resolved_at REAL,
+    created_at REAL NOT NULL,
+    state_json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_run_id ON incidents (run_id);
+CREATE INDEX IF NOT EXISTS idx_incidents_job_id ON incidents (job_id);
+CREATE INDEX IF NOT EXISTS idx_incidents_model_name ON incidents (model_name);
+CREATE INDEX IF NOT EXISTS idx_incidents_incident_type ON incidents (incident_type);
+CREATE INDEX IF NOT EXISTS idx_incidents_created_at ON incidents (created_at);
+"""
+
+FILTER_COLUMNS = ("run_id", "job_id", "model_name", "incident_type", "retry_status")
+
+
+class IncidentStore:
+    """
+    SQLite store of final IncidentStates, indexed for the UI,
+    aggregate reporting and rebuilding the vector memory.
+    """
+
+    def __init__(self, path: str = INCIDENT_STORE_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+
+    def save(self, state: IncidentState):
+        now = time.time()
+        root_causes = state.get("root_causes") or []
+
+        resolved_at = state.get("resolved_at")
+        if resolved_at is None and state.get("retry_status") == "success":
+            resolved_at = now
+
+        row = (
+            state.get("incident_id") or f"{state.get('dbt_run_id')}_{state.get('unique_id')}",
+            state.get("dbt_run_id") or state.get("run_id"),
+            state.get("job_id"),
+            state.get("model_name"),
+            state.get("unique_id"),
+            state.get("incident_type"),
+            state.get("confidence"),
+            state.get("recommended_action"),
+            root_causes[0].get("cause") if root_causes and isinstance(root_causes[0], dict) else None,
+            state.get("retry_status"),
+            int(bool(state.get("escalated"))),
+            state.get("detected_at"),
+            resolved_at,
+            now,
+            json.dumps(dict(state), default=str),
+        )
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO incidents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+            self.conn.commit()
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+
+    def _where(self, since: Optional[float], filters: Dict[str, Any]):
+        clauses, params = [], []
+
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+
+        for column, value in filters.items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"Unsupported filter: {column}")
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def get(self, incident_id: str) -> Optional[IncidentState]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT state_json FROM incidents WHERE incident_id = ?", (incident_id,)
+            ).fetchone()
+        return json.loads(row["state_json"]) if row else None
+
+    def list_incidents(
+        self,
+        limit: int = 50,
+        offset: int = 0,
+        since: Optional[float] = None,
+        **filters
+    ) -> List[Dict[str, Any]]:
+        """
+        Newest first, one page at a time (without the full state blob).
+        """
+        where, params = self._where(since, filters)
+
+        with self.lock:
+            rows = self.conn.execute(
+                f"""
+                SELECT incident_id, run_id, job_id, model_name, incident_type,
+                       confidence, recommended_action, root_cause, retry_status,
+                       escalated, detected_at, resolved_at, created_at
+                FROM incidents{where}
+                ORDER BY created_at DESC
+                LIMIT ? OFFSET ?
+                """,
+                params + [limit, offset]
+            ).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def count(self, since: Optional[float] = None, **filters) -> int:
+        where, params = self._where(since, filters)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM incidents{where}", params).fetchone()[0]
+
+    def iter_states(self, batch_size: int = 500) -> Iterator[IncidentState]:
+        """
+        All stored states, oldest first (used to rebuild the vector index).
+        """
+        last_rowid = 0
+
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT rowid, state_json FROM incidents WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size)
+                ).fetchall()
+
+            if not rows:
+                return
+
+            for row in rows:
+                yield json.loads(row["state_json"])
+
+            last_rowid = rows[-1]["rowid"]
+
+    # -----------------------------
+    # Aggregates
+    # -----------------------------
+
+    def top_failing_models(self, limit: int = 10, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        where, params = self._where(since, {})
+        where = where + (" AND" if where else " WHERE") + " model_name IS NOT NULL"
+
+        with self.lock:
+            rows = self.conn.execute(
+                f"""
+                SELECT model_name, COUNT(*) AS failures, MAX(created_at) AS last_failed_at
+                FROM incidents{where}
+                GROUP BY model_name
+                ORDER BY failures DESC
+                LIMIT ?
+                """,
+                params + [limit]
+            ).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def mttr_seconds(self, since: Optional[float] = None) -> Optional[float]:
+        """
+        Mean time from detection to resolution over resolved incidents.
+        """
+        where, params = self._where(since, {})
+        where = where + (" AND" if where else " WHERE") + " resolved_at IS NOT NULL AND detected_at IS NOT NULL"
+
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT AVG(resolved_at - detected_at) FROM incidents{where}", params
+            ).fetchone()[0]
+
+    def retry_success_rate(self, since: Optional[float] = None) -> Optional[float]:
+        where, params = self._where(since, {})
+        where = where + (" AND" if where else " WHERE") + " retry_status IN ('success', 'failed')"
+
+        with self.lock:
+            total, successes = self.conn.execute(
+                f"SELECT COUNT(*), SUM(retry_status = 'success') FROM incidents{where}", params
+            ).fetchone()
+
+        return successes / total if total else None
+
+    # -----------------------------
+    # Export
+    # -----------------------------
+
+    def export_parquet(self, path: str, since: Optional[float] = None):
+        """
+        Columnar export of the incident table for offline analysis.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = self.list_incidents(limit=-1, since=since)
+        pq.write_table(pa.Table.from_pylist(rows), path)
+
+
+# -----------------------------
+# Shared Instance
+# -----------------------------
+
+_store: Optional[IncidentStore] = None
+_store_lock = threading.Lock()
+
+
+def get_incident_store() -> IncidentStore:
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = IncidentStore()
+
+    return _store
@@ -0,0 +1,119 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Identifiers (customer_id, stg_orders), dotted names and error codes
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:\.[a-z0-9_]+)*")
+
+STOPWORDS = {
+    "the", "a", "an", "of", "in", "on", "to", "and", "or", "is", "at",
+    "for", "by", "with", "from", "as", "be", "this", "that", "it", "not",
+}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Lowercased tokens that keep exact identifiers intact, plus their
+    parts, so "orders.customer_id" matches "customer_id" and "customer".
+    """
+    tokens: List[str] = []
+
+    for token in TOKEN_PATTERN.findall((text or "").lower()):
+        if token in STOPWORDS:
+            continue
+
+        tokens.append(token)
+
+        parts = re.split(r"[._]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in STOPWORDS)
+
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+    Documents are addressed by integer ids chosen by the caller.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_terms: Dict[int, List[str]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, text: str):
+        counts = Counter(tokenize(text))
+
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+
+        length = sum(counts.values())
+        self.doc_lengths[doc_id] = length
+        self.doc_terms[doc_id] = list(counts)
+        self.total_length += length
+
+    def remove(self, doc_id: int):
+        for term in self.doc_terms.pop(doc_id, []):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        allowed: Optional[Set[int]] = None,
+        excluded: Iterable[int] = ()
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k (doc_id, bm25 score), restricted to allowed ids if given.
+        """
+        if not self.doc_lengths:
+            return []
+
+        excluded = set(excluded)
+        total_docs = len(self.doc_lengths)
+        average_length = self.total_length / total_docs
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+
+            idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+
+            for doc_id, frequency in docs.items():
+                if doc_id in excluded or (allowed is not None and doc_id not in allowed):
+                    continue
+
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Tuple[int, float]]], k: int = 60) -> Dict[int, float]:
+    """
+    Fuse ranked (id, score) lists; robust to the different score
+    scales of BM25 and cosine similarity.
+    """
+    fused: Dict[int, float] = {}
+
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+
+    return fused
@@ -1,40 +1,586 @@
-from langchain_community.vectorstores import FAISS
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
 from langchain_core.documents import Document
 from tools.common_functions import get_embeddings
+from tools.retry_stats import error_fingerprint
+from memory.lexical_index import BM25Index, reciprocal_rank_fusion
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+# flat: exact search | hnsw: graph ANN | ivf: inverted-file ANN
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+
+# vector | hybrid (BM25 + vector, rank-fused) | lexical (no embedding calls)
+RETRIEVAL_MODE = os.getenv("VECTOR_RETRIEVAL_MODE", "hybrid")
+
+# Recall / speed knobs (higher = better recall, slower search)
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", "64"))
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+
+# Half-life of similarity scores; 0 disables time decay
+HALF_LIFE_DAYS = float(os.getenv("VECTOR_HALF_LIFE_DAYS", "30"))
+
+# Filtered candidate sets this small are scored exactly with numpy
+EXACT_FILTER_LIMIT = 2048
+
+# Extra candidates fetched before time-decay rescoring
+OVERSAMPLE = 4
+
+# Metadata fields with a positions index for pre-filtering
+FILTER_KEYS = ("incident_type", "job_id", "model_name")
+
+# New incidents this similar to a stored one (same type) are merged
+DEDUP_THRESHOLD = float(os.getenv("VECTOR_DEDUP_THRESHOLD", "0.95"))
+
+# Retention: 0 disables the limit
+RETENTION_MAX_AGE_DAYS = float(os.getenv("VECTOR_RETENTION_MAX_AGE_DAYS", "180"))
+RETENTION_MAX_COUNT = int(os.getenv("VECTOR_RETENTION_MAX_COUNT", "50000"))
+
+# Background compaction: how often, and how many removed entries trigger a rebuild
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("VECTOR_COMPACTION_INTERVAL_SECONDS", "3600"))
+COMPACTION_MIN_DELETED_FRACTION = 0.1
+
+
+# -----------------------------
+# Index Construction
+# -----------------------------
+
+def build_index(
+    index_type: str,
+    dim: int,
+    vectors: Optional[np.ndarray] = None,
+    hnsw_m: int = HNSW_M,
+    ef_search: int = HNSW_EF_SEARCH,
+    nlist: int = IVF_NLIST,
+    nprobe: int = IVF_NPROBE
+):
+    """
+    Inner-product FAISS index over L2-normalized vectors (cosine).
+
+    IVF needs training data; with too few vectors it falls back to flat.
+    """
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = ef_search
+
+    elif index_type == "ivf" and vectors is not None and len(vectors) >= nlist * 39:
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = nprobe
+
+    else:
+        index = faiss.IndexFlatIP(dim)
 
+    if vectors is not None and len(vectors):
+        index.add(vectors)
+
+    return index
+
+
+def search_params(index, selector=None, ef_search: int = HNSW_EF_SEARCH, nprobe: int = IVF_NPROBE):
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    if isinstance(index, faiss.IndexIVFFlat):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype="float32")
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+# -----------------------------
+# Incident Memory
+# -----------------------------
 
 class IncidentVectorStore:
-    def __init__(self):
-        self.embeddings = get_embeddings()
-        self.store = None
+    """
+    Incident memory over a FAISS index (flat / HNSW / IVF) and a BM25
+    index of the same text, with metadata pre-filtering and
+    time-decayed scoring.
 
-    def add_incident(
+    retrieval_mode "lexical" never calls the embedding model; "hybrid"
+    searches fall back to lexical if the embedding call fails, and
+    incidents added meanwhile are queued until it works again.
+
+    Recurring incidents are merged on insert (occurrences / last_seen)
+    instead of adding near-duplicate vectors. Entries removed by the
+    retention policy are hidden immediately and dropped from the index
+    by compaction.
+    """
+
+    def __init__(self, index_type: str = VECTOR_INDEX_TYPE, embeddings=None, retrieval_mode: str = RETRIEVAL_MODE):
+        self.index_type = index_type
+        self.retrieval_mode = retrieval_mode
+        self.embeddings = embeddings or (get_embeddings() if retrieval_mode != "lexical" else None)
+        self.lock = threading.RLock()
+        self.compaction_thread: Optional[threading.Thread] = None
+        self.stop_compaction = threading.Event()
+        # Incidents whose embedding failed, inserted on the next success
+        self.pending: List[Document] = []
+        self._reset()
+
+    def _reset(self):
+        self.index = None
+        self.buffer: Optional[np.ndarray] = None
+        self.docs: List[Document] = []
+        self.deleted: Set[int] = set()
+        self.lexical = BM25Index()
+
+        # error fingerprint -> position (dedup without vectors)
+        self.fingerprints: Dict[str, int] = {}
+
+        # field -> value -> doc positions
+        self.metadata_index: Dict[str, Dict[Any, List[int]]] = {key: {} for key in FILTER_KEYS}
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        return None if self.buffer is None else self.buffer[:len(self.docs)]
+
+    def __len__(self) -> int:
+        return len(self.docs) - len(self.deleted)
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+
+    def _make_doc(
         self,
         incident_id: str,
         description: str,
         incident_type: str,
-        root_cause: str
-    ):
+        root_cause: str,
+        job_id=None,
+        model_name: Optional[str] = None,
+        created_at: Optional[float] = None
+    ) -> Document:
         text = f"""
         Incident description: {description}
         Incident type: {incident_type}
         Root cause: {root_cause}
         """
 
-        doc = Document(
+        created_at = created_at or time.time()
+
+        return Document(
             page_content=text,
             metadata={
                 "incident_id": incident_id,
-                "incident_type": incident_type
+                "incident_type": incident_type,
+                "job_id": job_id,
+                "model_name": model_name,
+                "created_at": created_at,
+                "last_seen": created_at,
+                "occurrences": 1
             }
         )
 
-        if self.store is None:
-            self.store = FAISS.from_documents([doc], self.embeddings)
+    def _append_vectors(self, vectors: np.ndarray):
+        size = len(self.docs)
+        needed = size + len(vectors)
+
+        # Grow geometrically so repeated single inserts stay cheap
+        if self.buffer is None or needed > len(self.buffer):
+            capacity = max(needed, 2 * (0 if self.buffer is None else len(self.buffer)), 64)
+            grown = np.empty((capacity, vectors.shape[1]), dtype="float32")
+            if self.buffer is not None:
+                grown[:size] = self.buffer[:size]
+            self.buffer = grown
+
+        self.buffer[size:needed] = vectors
+
+    def _add(self, docs: List[Document], vectors: Optional[np.ndarray], index=None):
+        """
+        Append docs (and their vectors). A prebuilt index over exactly
+        the stored vectors is installed as-is instead of being rebuilt.
+        """
+        if vectors is not None:
+            self._append_vectors(vectors)
+
+        for doc in docs:
+            position = len(self.docs)
+            self.docs.append(doc)
+            self.lexical.add(position, doc.page_content)
+            self.fingerprints[error_fingerprint(doc.page_content)] = position
+            for key in FILTER_KEYS:
+                self.metadata_index[key].setdefault(doc.metadata.get(key), []).append(position)
+
+        if vectors is None:
+            return
+
+        if index is not None:
+            self.index = index
+            return
+
+        # IVF re-trains once enough vectors exist to replace the flat fallback
+        needs_rebuild = (
+            self.index is None
+            or (self.index_type == "ivf"
+                and not isinstance(self.index, faiss.IndexIVFFlat)
+                and len(self.docs) >= IVF_NLIST * 39)
+        )
+
+        if needs_rebuild:
+            self.index = build_index(self.index_type, vectors.shape[1], self.vectors)
+        else:
+            self.index.add(vectors)
+
+    def _insert(self, doc: Document, vector: Optional[np.ndarray]) -> bool:
+        """
+        Add doc, or merge it into a near-duplicate of the same type
+        (by cosine similarity, or by normalized text without vectors).
+        Returns True if it was merged.
+        """
+        metadata = doc.metadata
+        duplicate = None
+
+        if vector is not None:
+            nearest = self._candidates(vector, self._allowed_ids({"incident_type": metadata["incident_type"]}), 1)
+            if nearest and nearest[0][1] >= DEDUP_THRESHOLD:
+                duplicate = nearest[0][0]
         else:
-            self.store.add_documents([doc])
+            position = self.fingerprints.get(error_fingerprint(doc.page_content))
+            if position is not None and position not in self.deleted:
+                duplicate = position
+
+        if duplicate is not None:
+            existing = self.docs[duplicate].metadata
+            existing["occurrences"] += 1
+            existing["last_seen"] = max(existing["last_seen"], metadata["created_at"])
+            existing["incident_id"] = metadata["incident_id"]
+            return True
+
+        self._add([doc], vector)
+        return False
+
+    def add_incident(
+        self,
+        incident_id: str,
+        description: str,
+        incident_type: str,
+        root_cause: str,
+        job_id=None,
+        model_name: Optional[str] = None,
+        created_at: Optional[float] = None
+    ):
+        """
+        Add an incident. If the embedding call fails it is queued and
+        inserted with the next successful one, so the caller never
+        fails on an embeddings outage.
+        """
+        doc = self._make_doc(incident_id, description, incident_type, root_cause, job_id, model_name, created_at)
+        self._insert_embedded([doc])
+
+    def _insert_embedded(self, docs: List[Document]):
+        vectors = None
+
+        if self.retrieval_mode != "lexical":
+            with self.lock:
+                # Every stored doc needs a vector (positions are index ids)
+                docs = self.pending + docs
+                self.pending = []
+
+            if not docs:
+                return
+
+            try:
+                vectors = _normalize(self.embeddings.embed_documents([doc.page_content for doc in docs]))
+            except Exception as exc:
+                with self.lock:
+                    self.pending = docs + self.pending
+                print(f"⚠️ Embedding failed ({exc}); {len(docs)} incident(s) queued for memory")
+                return
+
+        with self.lock:
+            for i, doc in enumerate(docs):
+                if self._insert(doc, vectors[i:i + 1] if vectors is not None else None):
+                    print("Similar incident already in memory; occurrence count updated")
+
+    def rebuild_from(self, incident_store):
+        """
+        Rebuild the index from persisted incidents (e.g. after a restart).
+        """
+        docs = []
+
+        for state in incident_store.iter_states():
+            root_causes = state.get("root_causes") or []
+            root_cause = root_causes[0].get("cause", "Unknown") if root_causes else "Unknown"
+
+            docs.append(self._make_doc(
+                incident_id=state.get("incident_id"),
+                description=state.get("description", ""),
+                incident_type=state.get("incident_type", "unknown"),
+                root_cause=root_cause,
+                job_id=state.get("job_id"),
+                model_name=state.get("model_name"),
+                created_at=state.get("detected_at")
+            ))
+
+        vectors = None
+        if docs and self.retrieval_mode != "lexical":
+            vectors = _normalize(self.embeddings.embed_documents([doc.page_content for doc in docs]))
+
+        with self.lock:
+            self._reset()
+            # Rebuilt from the store, which has them too
+            self.pending = []
+            merged = sum(
+                self._insert(doc, vectors[i:i + 1] if vectors is not None else None)
+                for i, doc in enumerate(docs)
+            )
+
+        print(f"Vector memory rebuilt from {len(docs)} stored incidents ({merged} merged as duplicates)")
+
+    # -----------------------------
+    # Retention & Compaction
+    # -----------------------------
+
+    def apply_retention(
+        self,
+        max_age_days: float = RETENTION_MAX_AGE_DAYS,
+        max_count: int = RETENTION_MAX_COUNT
+    ) -> int:
+        """
+        Hide entries not seen within max_age_days, then the least
+        recently seen beyond max_count. Returns the number removed.
+        """
+        with self.lock:
+            live = [position for position in range(len(self.docs)) if position not in self.deleted]
+            removed = set()
+
+            if max_age_days:
+                cutoff = time.time() - max_age_days * 86400
+                removed |= {p for p in live if self.docs[p].metadata["last_seen"] < cutoff}
+
+            if max_count:
+                remaining = sorted(
+                    (p for p in live if p not in removed),
+                    key=lambda p: self.docs[p].metadata["last_seen"],
+                    reverse=True
+                )
+                removed |= set(remaining[max_count:])
+
+            self.deleted |= removed
+            return len(removed)
+
+    def compact(self):
+        """
+        Rebuild the index without deleted entries.
+
+        The new index is built outside the lock so searches keep
+        working; incidents added and entries removed meanwhile are
+        replayed onto it.
+        """
+        with self.lock:
+            if not self.deleted:
+                return
+
+            keep = [p for p in range(len(self.docs)) if p not in self.deleted]
+            snapshot_size = len(self.docs)
+            snapshot_deleted = set(self.deleted)
+            docs = [self.docs[p] for p in keep]
+            vectors = self.vectors[keep].copy() if keep and self.vectors is not None else None
+
+        index = build_index(self.index_type, vectors.shape[1], vectors) if vectors is not None else None
+
+        with self.lock:
+            late_docs = self.docs[snapshot_size:]
+            late_vectors = (
+                self.vectors[snapshot_size:].copy()
+                if late_docs and self.vectors is not None else None
+            )
+            late_deleted = self.deleted - snapshot_deleted
+
+            self._reset()
+
+            if keep:
+                self._add(docs, vectors, index=index)
+
+            offset = len(self.docs)
+            if late_docs:
+                # Appended to the prebuilt index, not rebuilt
+                self._add(late_docs, late_vectors)
+
+            # Retention that ran during the rebuild, in new positions
+            new_position = {old: new for new, old in enumerate(keep)}
+            self.deleted = {
+                new_position[p] if p < snapshot_size else offset + p - snapshot_size
+                for p in late_deleted
+            }
+
+        print(f"Vector memory compacted: {len(snapshot_deleted)} entries dropped, {len(self)} kept")
+
+    def _compaction_loop(self, interval_seconds: float):
+        while not self.stop_compaction.wait(interval_seconds):
+            if self.pending:
+                self._insert_embedded([])
+
+            self.apply_retention()
+
+            with self.lock:
+                total = len(self.docs)
+                deleted_fraction = len(self.deleted) / total if total else 0
+
+            if deleted_fraction >= COMPACTION_MIN_DELETED_FRACTION:
+                self.compact()
+
+    def start_background_compaction(self, interval_seconds: float = COMPACTION_INTERVAL_SECONDS):
+        """
+        Periodically apply retention and compact once enough entries are gone.
+        """
+        if self.compaction_thread and self.compaction_thread.is_alive():
+            return
 
-    def search_similar(self, query: str, k: int = 3):
-        if not self.store:
+        self.stop_compaction.clear()
+        self.compaction_thread = threading.Thread(
+            target=self._compaction_loop,
+            args=(interval_seconds,),
+            name="vector-compaction",
+            daemon=True
+        )
+        self.compaction_thread.start()
+
+    def stop_background_compaction(self):
+        self.stop_compaction.set()
+
+    # -----------------------------
+    # Search
+    # -----------------------------
+
+    def _allowed_ids(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        allowed = None
+
+        for key, value in filters.items():
+            if value is None:
+                continue
+
+            positions = np.array(self.metadata_index[key].get(value, []), dtype="int64")
+            allowed = positions if allowed is None else np.intersect1d(allowed, positions)
+
+        return allowed
+
+    def _candidates(self, query_vector: np.ndarray, allowed: Optional[np.ndarray], fetch: int) -> List[Tuple[int, float]]:
+        """
+        (position, cosine similarity) of the best live matches.
+        """
+        if self.index is None or not self.docs:
             return []
-        return self.store.similarity_search(query, k=k)
+
+        if self.deleted:
+            dead = np.fromiter(self.deleted, dtype="int64")
+            if allowed is None:
+                allowed = np.setdiff1d(np.arange(len(self.docs), dtype="int64"), dead)
+            else:
+                allowed = np.setdiff1d(allowed, dead)
+
+        if allowed is not None and not len(allowed):
+            return []
+
+        fetch = min(fetch, len(self.docs))
+
+        if allowed is not None and len(allowed) <= EXACT_FILTER_LIMIT:
+            # Small filtered set: exact scores beat an ANN walk
+            scores = self.vectors[allowed] @ query_vector[0]
+            order = np.argsort(-scores)[:fetch]
+            return [(int(allowed[i]), float(scores[i])) for i in order]
+
+        selector = faiss.IDSelectorBatch(allowed) if allowed is not None else None
+        scores, ids = self.index.search(query_vector, fetch, params=search_params(self.index, selector))
+        return [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i != -1]
+
+    def _lexical_candidates(self, query: str, allowed: Optional[np.ndarray], fetch: int) -> List[Tuple[int, float]]:
+        return self.lexical.search(
+            query,
+            k=fetch,
+            allowed=set(allowed.tolist()) if allowed is not None else None,
+            excluded=self.deleted
+        )
+
+    def _embed(self, text: str) -> np.ndarray:
+        return _normalize(self.embeddings.embed_query(text))
+
+    def _decay(self, score: float, doc: Document, half_life_days: float, now: float) -> float:
+        if not half_life_days:
+            return score
+        age_days = max(now - (doc.metadata.get("last_seen") or now), 0) / 86400
+        return score * 0.5 ** (age_days / half_life_days)
+
+    def search_similar(
+        self,
+        query: str,
+        k: int = 3,
+        incident_type: Optional[str] = None,
+        job_id=None,
+        model_name: Optional[str] = None,
+        half_life_days: float = HALF_LIFE_DAYS,
+        mode: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Top-k similar incidents, optionally restricted to matching
+        metadata before the search, ranked by time-decayed similarity.
+
+        mode overrides the store's retrieval_mode for this call.
+        """
+        if not self.docs:
+            return []
+
+        mode = mode or self.retrieval_mode
+        fetch = k * OVERSAMPLE
+
+        query_vector = None
+        if mode in ("vector", "hybrid") and self.index is not None:
+            try:
+                query_vector = self._embed(query)
+            except Exception as exc:
+                print(f"⚠️ Embedding failed ({exc}); using lexical retrieval")
+
+        with self.lock:
+            allowed = self._allowed_ids({
+                "incident_type": incident_type,
+                "job_id": job_id,
+                "model_name": model_name
+            })
+
+            rankings = []
+
+            if query_vector is not None:
+                rankings.append(self._candidates(query_vector, allowed, fetch))
+
+            if mode in ("lexical", "hybrid") or query_vector is None:
+                rankings.append(self._lexical_candidates(query, allowed, fetch))
+
+            if len(rankings) == 1:
+                candidates = rankings[0]
+            else:
+                candidates = list(reciprocal_rank_fusion(rankings).items())
+
+            now = time.time()
+            ranked = sorted(
+                (
+                    (self._decay(score, self.docs[position], half_life_days, now), position)
+                    for position, score in candidates
+                ),
+                reverse=True
+            )[:k]
+
+            return [
+                Document(
+                    page_content=self.docs[position].page_content,
+                    metadata={**self.docs[position].metadata, "score": score}
+                )
+                for score, position in ranked
+            ]
@@ -34,12 +34,18 @@ class IncidentState(TypedDict, total=False):
     raw_sql: Optional[str]
     compiled_sql: Optional[str]
 
+    # Key of the shared RunContext (manifest, lineage, run_results)
+    run_context_id: Optional[int]
+
     # -------------------------------
     # Error Info
     # -------------------------------
 
     error_message: Optional[str]
     execution_time: Optional[float]
+    detected_at: Optional[float]
+    priority_score: Optional[float]
+    resolved_at: Optional[float]
 
     # -------------------------------
     # Classification
@@ -48,6 +54,7 @@ class IncidentState(TypedDict, total=False):
     incident_type: Optional[str]
     confidence: Optional[str]
     explanation: Optional[str]
+    classification_source: Optional[str]  # "rule" | "llm"
 
     # -------------------------------
     # RCA Output
@@ -65,6 +72,37 @@ class IncidentState(TypedDict, total=False):
     downstream_models: Optional[List[str]]
     impacted_models: Optional[List[str]]
     blast_radius: Optional[int]
+    skipped_models: Optional[List[str]]
+    cascaded_failures: Optional[List[str]]
 
     missing_column: Optional[str]
     type_mismatch: Optional[Dict[str, str]]
+
+    # -------------------------------
+    # Retry / Escalation
+    # -------------------------------
+
+    retry_status: Optional[str]
+    retry_reason: Optional[str]
+    retry_attempts: Optional[int]
+    retry_decision_source: Optional[str]  # "history" | "llm" | "speculative"
+    speculative_run_id: Optional[int]
+    speculative_cancelled: Optional[bool]
+    error_fingerprint: Optional[str]
+
+    escalation_mode: Optional[str]  # "template" (default) | "llm"
+    escalated: Optional[bool]
+    escalation_payload: Optional[Dict[str, str]]
+
+    # -------------------------------
+    # PR
+    # -------------------------------
+
+    pr_url: Optional[str]
+    pr_diff: Optional[str]
+
+    # -------------------------------
+    # Prompt Budgeting
+    # -------------------------------
+
+    prompt_tokens_saved: Optional[Dict[str, int]]
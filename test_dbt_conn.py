@@ -1,5 +1,6 @@
 from api.dbt_ingestor import extract_dbt_incidents
-from graph.workflow import run_workflow
+from api.batch import process_incidents
+from tools.profiling import profile_batch
 
 def main():
     incidents = extract_dbt_incidents()
@@ -8,11 +9,10 @@ def main():
         print("No dbt failures found.")
         return
 
-    for incident in incidents:
-        print("\n--- Processing Incident ---")
-        final_state = run_workflow(incident)
-        print("\nCLASSIFICATION AND RCA DONE")
+    process_incidents(incidents)
 
 
 if __name__ == "__main__":
-    main()
+    # No-op unless AIOPS_PROFILE=1
+    with profile_batch("batch"):
+        main()
@@ -0,0 +1,344 @@
+"""
+Record / replay of external calls (Ollama LLM, embeddings, dbt Cloud HTTP).
+
+    AIOPS_CASSETTE=.aiops/cassettes/prod.jsonl.gz
+    AIOPS_CASSETTE_MODE=record   # or replay
+    AIOPS_CASSETTE_LATENCY=1     # replay with the recorded latencies
+
+One gzip-compressed JSON line per call: kind, request, response,
+seconds. Replay is offline and deterministic: identical requests are
+served in recorded order, and a request that was never recorded raises
+CassetteMiss instead of touching the network.
+
+Side effects that are not recorded are skipped on replay: Slack alerts
+are dropped, PRs are not pushed or opened, and neither the incident
+store nor the retry history is written. Backoff and polling waits are
+skipped unless AIOPS_CASSETTE_LATENCY is set, and retry exploration is
+off. Replay runs the workflow on a single worker, since repeated
+identical calls (run status polls) are served in the order they were
+recorded.
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CASSETTE_PATH = os.getenv("AIOPS_CASSETTE", "")
+CASSETTE_MODE = os.getenv("AIOPS_CASSETTE_MODE", "off").lower()
+CASSETTE_LATENCY = os.getenv("AIOPS_CASSETTE_LATENCY", "false").lower() in ("1", "true", "yes")
+
+
+class CassetteMiss(Exception):
+    """
+    Raised in replay mode for a call that is not on the cassette.
+    """
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    canonical = json.dumps({"kind": kind, **request}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+class Cassette:
+
+    def __init__(self, path: str, mode: str, replay_latency: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}")
+
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.lock = threading.Lock()
+        self.entries: Dict[str, deque] = defaultdict(deque)
+        self.last: Dict[str, Dict[str, Any]] = {}
+        self.file = None
+
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # Appending adds a gzip member; gzip.open reads them all
+            self.file = gzip.open(path, "at", encoding="utf-8")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        count = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[entry["key"]].append(entry)
+                    count += 1
+
+        print(f"📼 Replaying {count} recorded call(s) from {self.path}")
+
+    def record(self, kind: str, request: Dict[str, Any], response: Any, seconds: float, error: Optional[str] = None):
+        entry = {
+            "key": request_key(kind, request),
+            "kind": kind,
+            "request": request,
+            "response": response,
+            "seconds": round(seconds, 4),
+            "error": error,
+        }
+
+        with self.lock:
+            self.file.write(json.dumps(entry, default=str) + "\n")
+
+    def lookup(self, kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Next recorded entry for this request. Once exhausted, the last
+        one is repeated (e.g. a poll that finally returned "success").
+        """
+        key = request_key(kind, request)
+
+        with self.lock:
+            queue = self.entries.get(key)
+            if queue:
+                self.last[key] = queue.popleft()
+            entry = self.last.get(key)
+
+        if entry is None:
+            raise CassetteMiss(f"No recorded {kind} call for {json.dumps(request, default=str)[:200]}")
+
+        return entry
+
+    def wait(self, seconds: float):
+        if self.replay_latency and seconds > 0:
+            time.sleep(seconds)
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+def replaying() -> bool:
+    """
+    True when external calls are served from a cassette.
+    """
+    return CASSETTE_MODE == "replay" and bool(CASSETTE_PATH)
+
+
+def pause(seconds: float):
+    """
+    time.sleep for waits between calls (backoff, polling); skipped on
+    replay unless the recorded latencies are kept.
+    """
+    if replaying() and not CASSETTE_LATENCY:
+        return
+    time.sleep(seconds)
+
+
+_instance: Optional[Cassette] = None
+_instance_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """
+    Shared cassette, or None when recording / replay is off.
+    """
+    global _instance
+
+    if CASSETTE_MODE not in ("record", "replay") or not CASSETTE_PATH:
+        return None
+
+    with _instance_lock:
+        if _instance is None:
+            _instance = Cassette(CASSETTE_PATH, CASSETTE_MODE, CASSETTE_LATENCY)
+            atexit.register(_instance.close)
+        return _instance
+
+
+# -----------------------------
+# LLM / Embeddings
+# -----------------------------
+
+class CassetteLLM:
+    """
+    Records or replays invoke / stream calls. In replay mode llm may
+    be None (no Ollama client is needed).
+    """
+
+    def __init__(self, llm, cassette: Cassette, model: str, temperature: float):
+        self.llm = llm
+        self.cassette = cassette
+        self.model = model
+        self.temperature = temperature
+
+    def _request(self, method: str, prompt, kwargs) -> Dict[str, Any]:
+        return {
+            "method": method,
+            "model": self.model,
+            "temperature": self.temperature,
+            "prompt": str(prompt),
+            "kwargs": kwargs,
+        }
+
+    def invoke(self, prompt, **kwargs):
+        request = self._request("invoke", prompt, kwargs)
+
+        if self.cassette.replaying:
+            entry = self.cassette.lookup("llm", request)
+            self.cassette.wait(entry["seconds"])
+            if entry["error"]:
+                raise RuntimeError(entry["error"])
+            return entry["response"]
+
+        started = time.perf_counter()
+        try:
+            response = self.llm.invoke(prompt, **kwargs)
+        except Exception as e:
+            self.cassette.record("llm", request, None, time.perf_counter() - started, error=repr(e))
+            raise
+
+        self.cassette.record("llm", request, str(response), time.perf_counter() - started)
+        return response
+
+    def stream(self, prompt, **kwargs):
+        """
+        Chunks are stored with their offset from the start of the call,
+        up to where the consumer closed the stream.
+        """
+        request = self._request("stream", prompt, kwargs)
+
+        if self.cassette.replaying:
+            entry = self.cassette.lookup("llm", request)
+            started = time.perf_counter()
+
+            for offset, text in entry["response"] or []:
+                self.cassette.wait(offset - (time.perf_counter() - started))
+                yield text
+
+            if entry["error"]:
+                raise RuntimeError(entry["error"])
+            return
+
+        chunks = []
+        error = None
+        started = time.perf_counter()
+        stream = self.llm.stream(prompt, **kwargs)
+
+        try:
+            for chunk in stream:
+                text = chunk.content if hasattr(chunk, "content") else str(chunk)
+                chunks.append((round(time.perf_counter() - started, 4), text))
+                yield chunk
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+            self.cassette.record("llm", request, chunks, time.perf_counter() - started, error=error)
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+
+class CassetteEmbeddings:
+
+    def __init__(self, embeddings, cassette: Cassette, model: str):
+        self.embeddings = embeddings
+        self.cassette = cassette
+        self.model = model
+
+    def _call(self, method: str, payload):
+        request = {"method": method, "model": self.model, "input": payload}
+
+        if self.cassette.replaying:
+            entry = self.cassette.lookup("embeddings", request)
+            self.cassette.wait(entry["seconds"])
+            if entry["error"]:
+                raise RuntimeError(entry["error"])
+            return entry["response"]
+
+        started = time.perf_counter()
+        try:
+            response = getattr(self.embeddings, method)(payload)
+        except Exception as e:
+            self.cassette.record("embeddings", request, None, time.perf_counter() - started, error=repr(e))
+            raise
+
+        self.cassette.record("embeddings", request, response, time.perf_counter() - started)
+        return response
+
+    def embed_documents(self, texts):
+        return self._call("embed_documents", list(texts))
+
+    def embed_query(self, text):
+        return self._call("embed_query", text)
+
+    def __getattr__(self, name):
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+
+# -----------------------------
+# dbt Cloud HTTP
+# -----------------------------
+
+def _response_from(entry: Dict[str, Any], url: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = entry["response"]["status_code"]
+    response.headers = CaseInsensitiveDict(entry["response"]["headers"])
+    response._content = entry["response"]["body"].encode("utf-8")
+    response.encoding = "utf-8"
+    response.url = url
+    return response
+
+
+def cassette_http(cassette: Cassette, base_url: str, method: str, url: str, **kwargs) -> requests.Response:
+    """
+    requests.request through the cassette. Keys ignore the host and
+    auth headers so a cassette replays against any base URL.
+    """
+    request = {
+        "method": method.upper(),
+        "path": url[len(base_url):] if url.startswith(base_url) else url,
+        "params": kwargs.get("params"),
+        "json": kwargs.get("json"),
+    }
+
+    if cassette.replaying:
+        entry = cassette.lookup("dbt", request)
+        cassette.wait(entry["seconds"])
+        if entry["error"]:
+            raise requests.ConnectionError(entry["error"])
+        return _response_from(entry, url)
+
+    started = time.perf_counter()
+    try:
+        response = requests.request(method, url, **kwargs)
+    except requests.RequestException as e:
+        cassette.record("dbt", request, None, time.perf_counter() - started, error=repr(e))
+        raise
+
+    cassette.record(
+        "dbt",
+        request,
+        {
+            "status_code": response.status_code,
+            "headers": {key: value for key, value in response.headers.items() if key.lower() == "retry-after"},
+            "body": response.text,
+        },
+        time.perf_counter() - started
+    )
+    return response
@@ -1,23 +1,56 @@
-import json, requests, re, time
-from typing import Optional, Dict, Any
-from langchain_community.llms import Ollama
-from langchain_community.embeddings import OllamaEmbeddings
+import json, os, requests, re, time
+from typing import Optional, Dict, Any, List
+from tenacity import RetryCallState, retry, stop_after_attempt, wait_random_exponential
+from urllib3.exceptions import ConnectTimeoutError
+from tools.json_stream import repair_json
+from tools.rate_limit import CircuitBreaker, CircuitOpenError, TokenBucket, parse_retry_after
+from tools.llm_limiter import LimitedEmbeddings, LimitedLLM, get_limiter
+from tools.cassette import CassetteEmbeddings, CassetteLLM, cassette_http, get_cassette, pause
+
+EMBEDDING_MODEL = "nomic-embed-text"
+
+# Clients share one adaptive concurrency limiter per backend / model.
+# langchain is imported on first use: it dominates start-up time and
+# most CLI commands never need it. When replaying a cassette no
+# Ollama client is built at all.
+def get_llm(temperature: float = 0.1, model: str = "llama3"):
+    cassette = get_cassette()
+    llm = None
+
+    if not (cassette and cassette.replaying):
+        from langchain_community.llms import Ollama
+        llm = Ollama(
+            model=model,
+            temperature=temperature
+        )
+
+    if cassette:
+        llm = CassetteLLM(llm, cassette, model, temperature)
 
-def get_llm():
-    return Ollama(
-        model="llama3",
-        temperature=0.1
-    )
+    # One limiter per model: a large model's normal latency must not
+    # look like congestion to the small one (and vice versa)
+    return LimitedLLM(llm, get_limiter(f"llm:{model}"))
 
 def get_embeddings():
-    return OllamaEmbeddings(
-        model="nomic-embed-text"
-    )
+    cassette = get_cassette()
+    embeddings = None
+
+    if not (cassette and cassette.replaying):
+        from langchain_community.embeddings import OllamaEmbeddings
+        embeddings = OllamaEmbeddings(
+            model=EMBEDDING_MODEL
+        )
+
+    if cassette:
+        embeddings = CassetteEmbeddings(embeddings, cassette, EMBEDDING_MODEL)
+
+    return LimitedEmbeddings(embeddings, get_limiter("embeddings"))
 
 
 def parse_json(text: Optional[str]):
     """
     Safely parse JSON.
+    Falls back to repair_json for sloppy LLM output.
     Returns None if parsing fails.
     """
     if text is None:
@@ -34,25 +67,167 @@ def parse_json(text: Optional[str]):
     try:
         return json.loads(text)
     except json.JSONDecodeError:
+        return repair_json(text)
+
+# HARDCODED FOR NOW (env overrides, e.g. a local fake server)
+
+ACCOUNT_ID = os.getenv("DBT_CLOUD_ACCOUNT_ID", "70471823532973")
+API_TOKEN = os.getenv("DBT_CLOUD_API_TOKEN", "dbtu_ZlIRcR8BMwnf_DWsBUVtXKF19WPExLBe4bW3w6Dln9-is8XiY8")
+BASE_URL = os.getenv("DBT_CLOUD_BASE_URL", "https://iy274.us1.dbt.com").rstrip("/")
+
+
+# -----------------------------
+# dbt Cloud HTTP Client
+# -----------------------------
+#
+# Every dbt Cloud call goes through dbt_request: one token bucket and
+# one circuit breaker shared by ingestion, polling and reruns.
+
+DBT_API_RATE = float(os.getenv("DBT_API_RATE_PER_SECOND", "5"))
+DBT_API_BURST = float(os.getenv("DBT_API_BURST", "10"))
+DBT_API_MAX_ATTEMPTS = int(os.getenv("DBT_API_MAX_ATTEMPTS", "5"))
+DBT_API_MAX_BACKOFF = float(os.getenv("DBT_API_MAX_BACKOFF_SECONDS", "60"))
+DBT_API_TIMEOUT = float(os.getenv("DBT_API_TIMEOUT_SECONDS", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+dbt_bucket = TokenBucket(rate=DBT_API_RATE, capacity=DBT_API_BURST)
+dbt_breaker = CircuitBreaker(
+    "dbt Cloud",
+    failure_threshold=int(os.getenv("DBT_API_BREAKER_THRESHOLD", "5")),
+    reset_seconds=float(os.getenv("DBT_API_BREAKER_RESET_SECONDS", "30")),
+    # A trial call waits for the bucket, then for the request itself
+    trial_timeout=DBT_API_TIMEOUT + DBT_API_MAX_BACKOFF
+)
+
+_jittered_backoff = wait_random_exponential(multiplier=1, max=DBT_API_MAX_BACKOFF)
+
+
+def _dbt_backoff(retry_state: RetryCallState) -> float:
+    # Retry-After wins over our own backoff
+    outcome = retry_state.outcome
+    if outcome and not outcome.failed:
+        retry_after = parse_retry_after(outcome.result().headers.get("Retry-After"))
+        if retry_after is not None:
+            return min(retry_after, DBT_API_MAX_BACKOFF)
+
+    return _jittered_backoff(retry_state)
+
+
+def _give_up(retry_state: RetryCallState):
+    outcome = retry_state.outcome
+    if outcome.failed:
+        print(f"❌ dbt Cloud request failed after {retry_state.attempt_number} attempt(s): {outcome.exception()}")
         return None
 
-# HARDCODED FOR NOW
+    return outcome.result()
 
-ACCOUNT_ID = "70471823532973"         
-API_TOKEN = "dbtu_ZlIRcR8BMwnf_DWsBUVtXKF19WPExLBe4bW3w6Dln9-is8XiY8"
-BASE_URL = "https://iy274.us1.dbt.com"
 
-def get_failed_dbt_runs(limit=1, today_only=True):
-    url = f"{BASE_URL}/api/v2/accounts/{ACCOUNT_ID}/runs/?limit={limit}&status=20&order_by=-created_at"
+def _not_sent(exc: BaseException) -> bool:
+    """
+    True if the request certainly never reached dbt Cloud
+    (connection refused / timed out, DNS failure).
+    """
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
 
-    headers = {
-        "Authorization": f"Token {API_TOKEN}",
-    }
+    if isinstance(exc, requests.ConnectionError) and exc.args:
+        return isinstance(getattr(exc.args[0], "reason", None), ConnectTimeoutError)
+
+    return False
+
+
+def _should_retry(retry_state: RetryCallState) -> bool:
+    """
+    GETs are retried on 429 / 5xx and any request error. Other methods
+    may already have taken effect (a timed-out POST jobs/{id}/run/ may
+    have started a run), so they are only retried on 429 or when the
+    request was never sent.
+    """
+    method = retry_state.args[0] if retry_state.args else retry_state.kwargs["method"]
+    idempotent = method.upper() == "GET"
+    outcome = retry_state.outcome
+
+    if outcome.failed:
+        exc = outcome.exception()
+        return isinstance(exc, requests.RequestException) and (idempotent or _not_sent(exc))
+
+    status = outcome.result().status_code
+    return status in RETRYABLE_STATUS if idempotent else status == 429
+
+
+@retry(
+    retry=_should_retry,
+    wait=_dbt_backoff,
+    sleep=pause,
+    stop=stop_after_attempt(DBT_API_MAX_ATTEMPTS),
+    retry_error_callback=_give_up,
+    reraise=False
+)
+def _dbt_attempt(method: str, url: str, **kwargs) -> requests.Response:
+    dbt_breaker.before_call()
+    dbt_bucket.acquire()
+
+    cassette = get_cassette()
+
+    try:
+        if cassette:
+            response = cassette_http(cassette, BASE_URL, method, url, timeout=DBT_API_TIMEOUT, **kwargs)
+        else:
+            response = requests.request(method, url, timeout=DBT_API_TIMEOUT, **kwargs)
+    except requests.RequestException:
+        dbt_breaker.record_failure()
+        raise
+
+    if response.status_code == 429:
+        # Throttled, not degraded: slow every caller down, and let a
+        # half-open trial be retried rather than block the circuit
+        dbt_breaker.release_trial()
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after:
+            dbt_bucket.pause(retry_after)
+    elif response.status_code >= 500:
+        dbt_breaker.record_failure()
+    else:
+        dbt_breaker.record_success()
+
+    return response
+
+
+def dbt_request(method: str, path: str, **kwargs) -> Optional[requests.Response]:
+    """
+    Call the dbt Cloud v2 API (path relative to the account).
 
-    response = requests.get(url, headers=headers)
+    Rate limited, retried with jittered exponential backoff on 429/5xx
+    and connection errors (honouring Retry-After), and short-circuited
+    while dbt Cloud is degraded.
+
+    Returns the final response (possibly non-2xx), or None if no
+    response was obtained or the circuit is open.
+    """
+    url = f"{BASE_URL}/api/v2/accounts/{ACCOUNT_ID}/{path.lstrip('/')}"
+    headers = {"Authorization": f"Token {API_TOKEN}", **kwargs.pop("headers", {})}
+
+    try:
+        return _dbt_attempt(method, url, headers=headers, **kwargs)
+    except CircuitOpenError as e:
+        print(f"⛔ {e}; skipping {method} {path}")
+        return None
 
-    if response.status_code != 200:
-        print("❌ Failed fetching runs:", response.text)
+
+def _failed(response: Optional[requests.Response], ok=(200,)) -> bool:
+    return response is None or response.status_code not in ok
+
+
+def _text(response: Optional[requests.Response]) -> str:
+    return response.text if response is not None else "no response"
+
+
+def get_failed_dbt_runs(limit=1, today_only=True):
+    response = dbt_request("GET", f"runs/?limit={limit}&status=20&order_by=-created_at")
+
+    if _failed(response):
+        print("❌ Failed fetching runs:", _text(response))
         return []
 
     runs = response.json().get("data", [])
@@ -61,26 +236,74 @@ def get_failed_dbt_runs(limit=1, today_only=True):
     return runs
 
 def get_run_artifact(run_id, artifact_name):
-    url = f"{BASE_URL}/api/v2/accounts/{ACCOUNT_ID}/runs/?limit=1"
+    response = dbt_request("GET", f"runs/{run_id}/artifacts/{artifact_name}")
 
-    url = f"{BASE_URL}/api/v2/accounts/{ACCOUNT_ID}/runs/{run_id}/artifacts/{artifact_name}"
+    if _failed(response):
+        print(f"❌ Failed fetching artifact {artifact_name}")
+        return None
 
-    headers = {
-        "Authorization": f"Token {API_TOKEN}",
-    }
+    return response.json()
 
-    response = requests.get(url, headers=headers)
 
-    if response.status_code != 200:
-        print(f"❌ Failed fetching artifact {artifact_name}")
+# select: rerun only the failing model and its children (steps_override)
+# retry:  dbt Cloud "rerun from failure" endpoint (dbt retry semantics)
+# full:   rerun the whole job
+RERUN_MODE = os.getenv("DBT_RERUN_MODE", "select")
+
+
+def build_rerun_steps(model_name: Optional[str], mode: str = "build") -> Optional[List[str]]:
+    """
+    steps_override for a targeted rerun of one model and its descendants.
+    Returns None when no model is known (caller should rerun the job).
+    """
+    if not model_name:
         return None
 
-    return response.json()
+    if not re.fullmatch(r"[A-Za-z0-9_.]+", model_name):
+        print(f"⚠️ Unsafe model selector {model_name!r}, falling back to full rerun")
+        return None
+
+    return [f"dbt {mode} --select {model_name}+"]
+
 
+def rerun_options(model_name: Optional[str]) -> Dict[str, Any]:
+    """
+    steps_override / from_failure for a rerun under RERUN_MODE.
+    """
+    return {
+        "steps_override": build_rerun_steps(model_name) if RERUN_MODE == "select" else None,
+        "from_failure": RERUN_MODE == "retry",
+    }
 
-def retry_dbt_cloud_job(job_id: int, max_attempts: int = 1, delay_seconds: int = 15):
+
+def start_dbt_rerun(
+    job_id: int,
+    steps_override: Optional[List[str]] = None,
+    from_failure: bool = False
+) -> Optional[int]:
+    """
+    Start one rerun without waiting for it. Returns run_id or None.
+    """
+    if from_failure:
+        return rerun_dbt_cloud_job_from_failure(job_id)
+
+    return trigger_dbt_cloud_job(job_id, steps_override=steps_override)
+
+
+def retry_dbt_cloud_job(
+    job_id: int,
+    max_attempts: int = 1,
+    delay_seconds: int = 15,
+    steps_override: Optional[List[str]] = None,
+    from_failure: bool = False,
+    first_run_id: Optional[int] = None
+):
     """
     Retries a dbt Cloud job multiple times.
+    steps_override narrows the rerun to selected models;
+    from_failure reruns only what failed in the last run;
+    first_run_id adopts an already started (speculative) run as
+    the first attempt.
     Returns final result.
     """
 
@@ -88,7 +311,11 @@ def retry_dbt_cloud_job(job_id: int, max_attempts: int = 1, delay_seconds: int =
 
         print(f"\n🔁 Attempt {attempt}/{max_attempts}")
 
-        run_id = trigger_dbt_cloud_job(job_id)
+        if attempt == 1 and first_run_id:
+            run_id = first_run_id
+            print(f"🔗 Awaiting speculative run {run_id}")
+        else:
+            run_id = start_dbt_rerun(job_id, steps_override=steps_override, from_failure=from_failure)
 
         if not run_id:
             return {"success": False, "reason": "trigger_failed"}
@@ -104,7 +331,7 @@ def retry_dbt_cloud_job(job_id: int, max_attempts: int = 1, delay_seconds: int =
 
         if attempt < max_attempts:
             print(f"⏳ Waiting {delay_seconds}s before next attempt...")
-            time.sleep(delay_seconds)
+            pause(delay_seconds)
 
     return {
         "success": False,
@@ -112,27 +339,29 @@ def retry_dbt_cloud_job(job_id: int, max_attempts: int = 1, delay_seconds: int =
         "reason": "all_attempts_failed"
     }
 
-def trigger_dbt_cloud_job(job_id: int, cause: str = "Triggered by AI Retry Agent") -> Optional[int]:
+def trigger_dbt_cloud_job(
+    job_id: int,
+    cause: str = "Triggered by AI Retry Agent",
+    steps_override: Optional[List[str]] = None
+) -> Optional[int]:
     """
     Triggers a dbt Cloud job run.
+    steps_override replaces the job's commands for this run only.
     Returns run_id if successful, else None.
     """
 
-    url = f"{BASE_URL}/api/v2/accounts/{ACCOUNT_ID}/jobs/{job_id}/run/"
-
-    headers = {
-        "Authorization": f"Token {API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-
     payload = {
         "cause": cause
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    if steps_override:
+        payload["steps_override"] = steps_override
+        print(f"🎯 Targeted rerun: {steps_override}")
+
+    response = dbt_request("POST", f"jobs/{job_id}/run/", json=payload)
 
-    if response.status_code not in (200, 201):
-        print("❌ Failed triggering dbt job:", response.text)
+    if _failed(response, ok=(200, 201)):
+        print("❌ Failed triggering dbt job:", _text(response))
         return None
 
     run_id = response.json().get("data", {}).get("id")
@@ -141,6 +370,64 @@ def trigger_dbt_cloud_job(job_id: int, cause: str = "Triggered by AI Retry Agent
     return run_id
 
 
+def rerun_dbt_cloud_job_from_failure(job_id: int) -> Optional[int]:
+    """
+    Reruns a job from the point of failure of its last run.
+    Returns run_id if successful, else None.
+    """
+
+    response = dbt_request("POST", f"jobs/{job_id}/rerun/")
+
+    if _failed(response, ok=(200, 201)):
+        print("❌ Failed rerunning dbt job from failure:", _text(response))
+        return None
+
+    run_id = response.json().get("data", {}).get("id")
+    print(f"✅ Rerun from failure started: {run_id}")
+
+    return run_id
+
+
+def cancel_dbt_run(run_id: int) -> bool:
+    """
+    Cancel a queued or running dbt Cloud run.
+    Returns True if dbt Cloud accepted the cancellation.
+    """
+    response = dbt_request("POST", f"runs/{run_id}/cancel/")
+
+    if _failed(response, ok=(200, 201)):
+        print(f"❌ Failed cancelling run {run_id}:", _text(response))
+        return False
+
+    print(f"🛑 Cancelled dbt Cloud run: {run_id}")
+    return True
+
+
+def get_dbt_run(run_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Fetch a dbt Cloud run (job_id, status, error, timestamps...).
+    Returns None if the request fails.
+    """
+    response = dbt_request("GET", f"runs/{run_id}/")
+
+    if _failed(response):
+        print(f"❌ Failed fetching run {run_id}:", _text(response))
+        return None
+
+    return response.json().get("data")
+
+
+# dbt Cloud numeric status mapping
+RUN_STATUS_NAMES = {
+    1: "queued",
+    2: "starting",
+    3: "running",
+    10: "success",
+    20: "error",
+    30: "cancelled"
+}
+
+
 def get_dbt_run_status(job_id: int, run_id: int) -> str:
     """
     Fetch the current status of a dbt Cloud run.
@@ -152,38 +439,17 @@ def get_dbt_run_status(job_id: int, run_id: int) -> str:
         str: One of:
              queued | starting | running |
              success | error | cancelled |
-             unknown
+             unknown (status could not be fetched; keep polling)
     """
-    headers = {
-        "Authorization": f"Token {API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-
-    url = f"{BASE_URL}/api/v2/accounts/{ACCOUNT_ID}/runs/{run_id}/"
+    response = dbt_request("GET", f"runs/{run_id}/")
 
-    response = requests.get(url, headers=headers)
-
-    if response.status_code != 200:
-        raise Exception(
-            f"Failed to fetch run status. "
-            f"Status code: {response.status_code}, "
-            f"Response: {response.text}"
-        )
+    if _failed(response):
+        print(f"⚠️ Failed to fetch run status for {run_id}: {_text(response)[:200]}")
+        return "unknown"
 
     data = response.json().get("data", {})
-    status_code = data.get("status")
-
-    # dbt Cloud numeric status mapping
-    status_map = {
-        1: "queued",
-        2: "starting",
-        3: "running",
-        10: "success",
-        20: "error",
-        30: "cancelled"
-    }
 
-    return status_map.get(status_code, "unknown")
+    return RUN_STATUS_NAMES.get(data.get("status"), "unknown")
 
 
 def wait_for_dbt_run_completion(job_id: int, run_id: int, poll_interval: int = 10, timeout: int = 900):
@@ -206,6 +472,6 @@ def wait_for_dbt_run_completion(job_id: int, run_id: int, poll_interval: int = 1
             print("⏰ Polling timeout reached")
             return {"success": False, "status": "timeout"}
 
-        time.sleep(poll_interval)
+        pause(poll_interval)
 
 
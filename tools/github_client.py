@@ -0,0 +1,339 @@
+import base64
+import os
+import re
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from tools.cassette import replaying
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+# "local": push branches to PR_REMOTE_URL only (works fully offline)
+# "github": also open PRs through the GitHub REST API
+PR_BACKEND = os.getenv("PR_BACKEND", "local")
+
+# Any git URL or path; for the local backend a bare repo is created if missing
+PR_REMOTE_URL = os.getenv("PR_REMOTE_URL", ".aiops/pr_remote.git")
+
+# Persistent working tree, reused across PRs instead of re-cloning
+PR_WORKDIR = os.getenv("PR_WORKDIR", ".aiops/pr_worktree")
+
+PR_BASE_BRANCH = os.getenv("PR_BASE_BRANCH", "main")
+
+GITHUB_REPO = os.getenv("GITHUB_REPO")  # "owner/name"
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+
+# -----------------------------
+# PR Hosts
+# -----------------------------
+
+class GitHubAPI:
+    """
+    Opens pull requests through the GitHub REST API.
+    """
+
+    def __init__(self, repo: str, token: str, api_url: str = GITHUB_API_URL):
+        self.repo = repo
+        self.token = token
+        self.api_url = api_url.rstrip("/")
+
+    def open_pull_request(self, head: str, base: str, title: str, body: str) -> Optional[str]:
+        response = requests.post(
+            f"{self.api_url}/repos/{self.repo}/pulls",
+            headers={
+                "Authorization": f"Bearer {self.token}",
+                "Accept": "application/vnd.github+json"
+            },
+            json={"head": head, "base": base, "title": title, "body": body},
+            timeout=30
+        )
+
+        if response.status_code not in (200, 201):
+            print("❌ Failed opening GitHub PR:", response.text)
+            return None
+
+        return response.json().get("html_url")
+
+
+# -----------------------------
+# Clients
+# -----------------------------
+
+class PullRequestClient(ABC):
+    """
+    Interface for whatever hosts the PRs.
+    """
+
+    @abstractmethod
+    def create_pull_request(
+        self,
+        file_path: str,
+        updated_content: str,
+        title: str,
+        body: str,
+        batch_key: Optional[str] = None
+    ) -> Optional[str]:
+        ...
+
+    def flush(self) -> Dict[str, Optional[str]]:
+        return {}
+
+
+class DryRunClient(PullRequestClient):
+    """
+    Logs fixes without pushing or opening anything (cassette replay).
+    """
+
+    def create_pull_request(
+        self,
+        file_path: str,
+        updated_content: str,
+        title: str,
+        body: str,
+        batch_key: Optional[str] = None
+    ) -> Optional[str]:
+        print(f"📼 Replay: PR for {file_path} not created")
+        return None
+
+
+class GitWorkspaceClient(PullRequestClient):
+    """
+    Commits fixes in a persistent local clone and pushes them as branches.
+
+    - Fixes sharing a batch_key (e.g. a dbt run id) are committed to one
+      branch and become one PR when flush() is called.
+    - Fixes without a batch_key are pushed and opened immediately.
+    - With api=None the "PR" is just the pushed branch, so the whole
+      flow can run offline against a bare local repository.
+    """
+
+    def __init__(
+        self,
+        remote_url: str = PR_REMOTE_URL,
+        workdir: str = PR_WORKDIR,
+        base_branch: str = PR_BASE_BRANCH,
+        api: Optional[GitHubAPI] = None,
+        auth_token: Optional[str] = None,
+        web_url: Optional[str] = None
+    ):
+        self.remote_url = remote_url
+        self.workdir = workdir
+        self.base_branch = base_branch
+        self.api = api
+        # Browsable repo URL for branch links, e.g. https://github.com/owner/name
+        self.web_url = web_url
+
+        # Sent as an HTTP header through the environment of each git
+        # call, so the token never lands in .git/config, URLs or logs
+        self.git_env: Dict[str, str] = {}
+        if auth_token:
+            credentials = base64.b64encode(f"x-access-token:{auth_token}".encode()).decode()
+            self.git_env = {
+                "GIT_CONFIG_COUNT": "1",
+                "GIT_CONFIG_KEY_0": "http.extraheader",
+                "GIT_CONFIG_VALUE_0": f"AUTHORIZATION: basic {credentials}",
+            }
+
+        self.lock = threading.Lock()
+        self.batches: Dict[str, Dict] = {}
+        self.repo = self._open_workdir()
+
+    # -----------------------------
+    # Working Tree
+    # -----------------------------
+
+    def _open_workdir(self):
+        from git import Repo
+
+        if os.path.isdir(os.path.join(self.workdir, ".git")):
+            repo = Repo(self.workdir)
+            # Also drops credentials an older clone kept in its origin URL
+            repo.remotes.origin.set_url(self.remote_url)
+            repo.git.fetch("origin", env=self.git_env)
+            return repo
+
+        repo = Repo.clone_from(self.remote_url, self.workdir, env=self.git_env)
+
+        # Empty remote: seed the base branch so PR branches have a parent
+        if not repo.heads:
+            repo.git.checkout("-b", self.base_branch)
+            repo.index.commit("Initial commit")
+            repo.git.push("origin", self.base_branch, env=self.git_env)
+
+        return repo
+
+    def _start_branch(self, branch: str):
+        """
+        Reset the shared working tree onto a fresh branch from origin/base.
+        """
+        self.repo.git.fetch("origin", env=self.git_env)
+        self.repo.git.checkout("-B", branch, f"origin/{self.base_branch}")
+        self.repo.git.clean("-fd")
+
+    def _commit_file(self, file_path: str, updated_content: str, message: str):
+        target = os.path.join(self.repo.working_tree_dir, file_path)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+
+        with open(target, "w") as f:
+            f.write(updated_content)
+
+        self.repo.index.add([file_path])
+        self.repo.index.commit(message)
+
+    def _branch_url(self, branch: str) -> str:
+        if self.web_url:
+            return f"{self.web_url}/tree/{branch}"
+
+        # Never echo credentials embedded in a configured remote
+        return f"{re.sub(r'//[^/@]+@', '//', self.remote_url)}#{branch}"
+
+    def _publish(self, branch: str, title: str, body: str) -> Optional[str]:
+        self.repo.git.push("--force", "origin", f"{branch}:{branch}", env=self.git_env)
+
+        if self.api:
+            return self.api.open_pull_request(branch, self.base_branch, title, body)
+
+        return self._branch_url(branch)
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+
+    def create_pull_request(
+        self,
+        file_path: str,
+        updated_content: str,
+        title: str,
+        body: str,
+        batch_key: Optional[str] = None
+    ) -> Optional[str]:
+        with self.lock:
+            if batch_key is None:
+                branch = f"ai-fix/{_slug(title)}-{int(time.time())}"
+                self._start_branch(branch)
+                self._commit_file(file_path, updated_content, f"{title}\n\n{body.strip()}")
+                return self._publish(branch, title, body)
+
+            batch = self.batches.get(str(batch_key))
+
+            if batch is None:
+                batch = {"branch": f"ai-fix/batch-{_slug(str(batch_key))}", "fixes": []}
+                self.batches[str(batch_key)] = batch
+                self._start_branch(batch["branch"])
+            else:
+                self.repo.git.checkout(batch["branch"])
+
+            self._commit_file(file_path, updated_content, f"{title}: {file_path}\n\n{body.strip()}")
+            batch["fixes"].append({"file_path": file_path, "body": body.strip()})
+
+            print(f"📦 Fix for {file_path} added to batch {batch_key} ({len(batch['fixes'])} fix(es))")
+
+            return self._branch_url(batch["branch"])
+
+    def flush(self) -> Dict[str, Optional[str]]:
+        """
+        Push every pending batch and open one PR per batch.
+        Returns batch_key -> PR url.
+        """
+        urls: Dict[str, Optional[str]] = {}
+
+        with self.lock:
+            for batch_key, batch in self.batches.items():
+                fixes: List[Dict] = batch["fixes"]
+
+                title = f"AI Auto-Fix: {len(fixes)} dbt failure(s) in run {batch_key}"
+                body = "\n\n---\n\n".join(
+                    f"### {fix['file_path']}\n{fix['body']}" for fix in fixes
+                )
+
+                urls[batch_key] = self._publish(batch["branch"], title, body)
+                print(f"PR Created: {urls[batch_key]} ({len(fixes)} fix(es))")
+
+            self.batches.clear()
+
+        return urls
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:50]
+
+
+# -----------------------------
+# Shared Instance
+# -----------------------------
+
+_client: Optional[PullRequestClient] = None
+
+
+def set_pr_client(client: Optional[PullRequestClient]):
+    """
+    Swap the PR backend (e.g. a bare local repo in tests).
+    """
+    global _client
+    _client = client
+
+
+def get_pr_client() -> PullRequestClient:
+    global _client
+
+    if _client is not None:
+        return _client
+
+    if replaying():
+        _client = DryRunClient()
+
+    elif PR_BACKEND == "github":
+        if not (GITHUB_REPO and GITHUB_TOKEN):
+            raise ValueError("PR_BACKEND=github requires GITHUB_REPO and GITHUB_TOKEN")
+
+        _client = GitWorkspaceClient(
+            remote_url=os.getenv("PR_REMOTE_URL", f"https://github.com/{GITHUB_REPO}.git"),
+            api=GitHubAPI(GITHUB_REPO, GITHUB_TOKEN),
+            auth_token=GITHUB_TOKEN,
+            web_url=f"https://github.com/{GITHUB_REPO}"
+        )
+
+    elif PR_BACKEND == "local":
+        if not os.path.exists(PR_REMOTE_URL) and "://" not in PR_REMOTE_URL:
+            from git import Repo
+            Repo.init(PR_REMOTE_URL, bare=True)
+
+        _client = GitWorkspaceClient()
+
+    else:
+        raise ValueError(f"Unsupported PR_BACKEND: {PR_BACKEND}")
+
+    return _client
+
+
+def create_pull_request(
+    file_path: str,
+    updated_content: str,
+    title: str,
+    body: str,
+    batch_key: Optional[str] = None
+) -> Optional[str]:
+    return get_pr_client().create_pull_request(
+        file_path=file_path,
+        updated_content=updated_content,
+        title=title,
+        body=body,
+        batch_key=batch_key
+    )
+
+
+def flush_pull_requests() -> Dict[str, Optional[str]]:
+    """
+    Open PRs for all batched fixes. Call once a run's incidents are done.
+    """
+    if _client is None:
+        return {}
+    return _client.flush()
@@ -0,0 +1,224 @@
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# -----------------------------
+# Incremental JSON Scanner
+# -----------------------------
+
+
+class JsonObjectScanner:
+    """
+    Consumes streamed text chunks and yields each top-level JSON
+    object as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.start = None
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk: str):
+        self.buffer += chunk
+        objects = []
+
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+
+            elif char == '"' and self.depth > 0:
+                self.in_string = True
+
+            elif char == "{":
+                if self.depth == 0:
+                    self.start = self.position
+                self.depth += 1
+
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    objects.append(self.buffer[self.start:self.position + 1])
+                    self.start = None
+
+            self.position += 1
+
+        return objects
+
+
+# -----------------------------
+# Repair Parser
+# -----------------------------
+
+def repair_json(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Best-effort recovery of a JSON object from sloppy LLM output:
+    markdown fences, prose around the object, trailing commas,
+    Python literals and truncated output.
+    """
+    if not text or not isinstance(text, str):
+        return None
+
+    text = re.sub(r"```(?:json)?", "", text).strip()
+
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    scanner = JsonObjectScanner()
+    candidates = scanner.feed(text[start:])
+
+    if candidates:
+        candidate = candidates[0]
+    else:
+        # Truncated: close whatever is still open
+        candidate = text[start:]
+        if scanner.in_string:
+            candidate += '"'
+        candidate = re.sub(r",\s*$", "", candidate)
+        candidate += _closing_brackets(candidate)
+
+    # Outside string values only ("returns None" stays as written)
+    candidate = "".join(
+        segment if quoted else _repair_literals(segment)
+        for segment, quoted in _string_segments(candidate)
+    )
+
+    try:
+        parsed = json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _repair_literals(segment: str) -> str:
+    segment = re.sub(r",\s*([}\]])", r"\1", segment)
+    segment = re.sub(r"\bTrue\b", "true", segment)
+    segment = re.sub(r"\bFalse\b", "false", segment)
+    return re.sub(r"\bNone\b", "null", segment)
+
+
+def _string_segments(text: str) -> List[Tuple[str, bool]]:
+    """
+    Split text into (segment, is_string) pieces; string pieces keep
+    their quotes.
+    """
+    segments = []
+    start = 0
+    in_string = False
+    escaped = False
+
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                segments.append((text[start:position + 1], True))
+                start = position + 1
+                in_string = False
+        elif char == '"':
+            segments.append((text[start:position], False))
+            start = position
+            in_string = True
+
+    segments.append((text[start:], in_string))
+    return segments
+
+
+def _closing_brackets(text: str) -> str:
+    stack = []
+    in_string = False
+    escaped = False
+
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    return "".join(reversed(stack))
+
+
+# -----------------------------
+# Streaming Invocation
+# -----------------------------
+
+def _chunk_text(chunk) -> str:
+    return chunk.content if hasattr(chunk, "content") else str(chunk)
+
+
+def _matches(parsed: Any, required_keys: Iterable[str]) -> bool:
+    return isinstance(parsed, dict) and all(key in parsed for key in required_keys)
+
+
+def invoke_json(
+    llm,
+    prompt: str,
+    required_keys: Iterable[str] = (),
+    stop: Optional[threading.Event] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Stream a completion and stop generation as soon as a complete JSON
+    object containing required_keys has arrived, or once stop is set
+    (returns None then).
+
+    Falls back to repair_json on the full text if no complete object
+    matched. Returns None if nothing could be recovered.
+    """
+    if stop is not None and stop.is_set():
+        return None
+
+    required_keys = tuple(required_keys)
+    scanner = JsonObjectScanner()
+    stream = llm.stream(prompt)
+    started = time.time()
+
+    try:
+        for chunk in stream:
+            if stop is not None and stop.is_set():
+                return None
+
+            for candidate in scanner.feed(_chunk_text(chunk)):
+                try:
+                    parsed = json.loads(candidate)
+                except json.JSONDecodeError:
+                    parsed = repair_json(candidate)
+
+                if _matches(parsed, required_keys):
+                    print(f"⚡ JSON complete after {time.time() - started:.1f}s, stopping generation")
+                    return parsed
+    finally:
+        # Closing the generator drops the HTTP stream, which stops generation
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+    parsed = repair_json(scanner.buffer)
+
+    if parsed is not None and not _matches(parsed, required_keys):
+        print("⚠️ Repaired JSON is missing expected keys")
+
+    return parsed
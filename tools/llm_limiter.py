@@ -0,0 +1,261 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+LLM_CONCURRENCY_INITIAL = int(os.getenv("LLM_CONCURRENCY_INITIAL", "2"))
+LLM_CONCURRENCY_MIN = int(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+LLM_CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", "8"))
+
+# Latency above tolerance x recent best counts as congestion
+LLM_LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "2.0"))
+
+# Multiplicative decrease on congestion or errors
+LLM_BACKOFF_RATIO = float(os.getenv("LLM_BACKOFF_RATIO", "0.7"))
+
+# Priority lanes: lower value is served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """
+    Run the enclosed LLM / embedding calls in the given priority lane.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# -----------------------------
+# AIMD Limiter
+# -----------------------------
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to the observed latency of a shared
+    backend (additive increase, multiplicative decrease).
+
+    - Each call completing close to the recent best latency raises the
+      limit by 1/limit (about +1 per limit's worth of calls)
+    - A call that errors or takes more than tolerance x the recent best
+      cuts the limit by backoff_ratio, at most once per latency period
+    - Waiters are admitted by priority lane, then FIFO
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = LLM_CONCURRENCY_INITIAL,
+        min_limit: int = LLM_CONCURRENCY_MIN,
+        max_limit: int = LLM_CONCURRENCY_MAX,
+        tolerance: float = LLM_LATENCY_TOLERANCE,
+        backoff_ratio: float = LLM_BACKOFF_RATIO,
+        window: int = 50
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.tolerance = tolerance
+        self.backoff_ratio = backoff_ratio
+
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.last_decrease = 0.0
+
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+        self.calls = 0
+        self.errors = 0
+        self.decreases = 0
+
+    # ---- admission ----
+
+    def acquire(self, priority: Optional[int] = None):
+        priority = _priority.get() if priority is None else priority
+        ticket = (priority, next(self.sequence))
+
+        with self.condition:
+            heapq.heappush(self.waiters, ticket)
+
+            while self.waiters[0] != ticket or self.in_flight >= int(self.limit):
+                self.condition.wait()
+
+            heapq.heappop(self.waiters)
+            self.in_flight += 1
+            # The next waiter may fit under the limit too
+            self.condition.notify_all()
+
+    def release(self, latency: float, error: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            self.calls += 1
+            self._adjust(latency, error)
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None):
+        """
+        Hold a slot for the enclosed call and feed its latency back.
+        The body may report a more precise latency via slot["latency"].
+        """
+        self.acquire(priority)
+        measurement: Dict[str, Any] = {"started": time.monotonic(), "latency": None}
+        error = False
+
+        try:
+            yield measurement
+        except Exception:
+            error = True
+            raise
+        finally:
+            latency = measurement["latency"]
+            if latency is None:
+                latency = time.monotonic() - measurement["started"]
+            self.release(latency, error)
+
+    # ---- adaptation ----
+
+    def _adjust(self, latency: float, error: bool):
+        baseline = min(self.latencies) if self.latencies else latency
+        self.latencies.append(latency)
+
+        congested = error or latency > self.tolerance * baseline
+
+        if error:
+            self.errors += 1
+
+        if not congested:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            return
+
+        # Calls already in flight when we backed off report the same
+        # congestion; react once per latency period
+        now = time.monotonic()
+        if now - self.last_decrease < max(baseline, 0.1):
+            return
+
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.last_decrease = now
+        self.decreases += 1
+
+        if int(self.limit) < previous:
+            reason = "error" if error else f"latency {latency:.2f}s vs best {baseline:.2f}s"
+            print(f"🐢 {self.name} concurrency {previous} → {int(self.limit)} ({reason})")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": len(self.waiters),
+                "best_latency": min(self.latencies) if self.latencies else None,
+                "calls": self.calls,
+                "errors": self.errors,
+                "decreases": self.decreases,
+            }
+
+
+# -----------------------------
+# Client Wrappers
+# -----------------------------
+
+class LimitedLLM:
+    """
+    LLM client whose invoke / stream calls go through a limiter.
+    Streaming calls hold their slot until the stream is closed and
+    report time to first chunk, which tracks server load better than
+    total time (output length varies per prompt).
+    """
+
+    def __init__(self, llm, limiter: AdaptiveLimiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    def invoke(self, prompt, **kwargs):
+        with self.limiter.slot():
+            return self.llm.invoke(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        with self.limiter.slot() as measurement:
+            stream = self.llm.stream(prompt, **kwargs)
+            try:
+                for chunk in stream:
+                    if measurement["latency"] is None:
+                        measurement["latency"] = time.monotonic() - measurement["started"]
+                    yield chunk
+            finally:
+                # Propagate an early close so generation stops server-side
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+
+class LimitedEmbeddings:
+    """
+    Embeddings client whose calls go through a limiter.
+    """
+
+    def __init__(self, embeddings, limiter: AdaptiveLimiter):
+        self.embeddings = embeddings
+        self.limiter = limiter
+
+    def embed_documents(self, texts):
+        with self.limiter.slot():
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self.limiter.slot():
+            return self.embeddings.embed_query(text)
+
+    def __getattr__(self, name):
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+
+# -----------------------------
+# Shared Limiters
+# -----------------------------
+
+# One per backend and model: generation and embedding latencies (and a
+# 3B vs 8B model's) differ widely and must not share a baseline
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> AdaptiveLimiter:
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveLimiter(name)
+        return _limiters[name]
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.snapshot() for limiter in limiters}
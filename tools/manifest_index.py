@@ -0,0 +1,119 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Set
+
+MANIFEST_PATH = "target/manifest.json"
+
+# path -> (mtime, manifest)
+_manifest_cache: Dict[str, Any] = {}
+
+
+# -----------------------------
+# Loading
+# -----------------------------
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Load a dbt manifest, re-reading only when the file changes.
+    Returns None if it is missing or unreadable.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except Exception:
+        return None
+
+    _manifest_cache[path] = (mtime, manifest)
+    return manifest
+
+
+def get_node(manifest: Dict[str, Any], unique_id: str) -> Dict[str, Any]:
+    return (
+        manifest.get("nodes", {}).get(unique_id)
+        or manifest.get("sources", {}).get(unique_id)
+        or {}
+    )
+
+
+# -----------------------------
+# Columns
+# -----------------------------
+
+def node_columns(node: Dict[str, Any]) -> Set[str]:
+    return {name.lower() for name in (node.get("columns") or {})}
+
+
+def upstream_columns(manifest: Dict[str, Any], unique_id: str) -> Optional[Set[str]]:
+    """
+    Union of documented columns over a node's direct parents.
+    None if any parent has no documented columns (index incomplete).
+    """
+    parents: List[str] = get_node(manifest, unique_id).get("depends_on", {}).get("nodes", [])
+    if not parents:
+        return None
+
+    columns: Set[str] = set()
+
+    for parent in parents:
+        parent_columns = node_columns(get_node(manifest, parent))
+        if not parent_columns:
+            return None
+        columns |= parent_columns
+
+    return columns
+
+
+# -----------------------------
+# Lineage
+# -----------------------------
+
+class LineageIndex:
+    """
+    Parent / child maps for a manifest, built once per manifest
+    (uses dbt's parent_map / child_map when present).
+    """
+
+    def __init__(self, manifest: Dict[str, Any]):
+        self.parents: Dict[str, List[str]] = dict(manifest.get("parent_map") or {})
+        self.children: Dict[str, List[str]] = dict(manifest.get("child_map") or {})
+
+        if not self.parents:
+            for section in ("nodes", "sources", "exposures"):
+                for unique_id, node in manifest.get(section, {}).items():
+                    self.parents[unique_id] = list(node.get("depends_on", {}).get("nodes", []))
+
+        if not self.children:
+            for unique_id, parents in self.parents.items():
+                self.children.setdefault(unique_id, [])
+                for parent in parents:
+                    self.children.setdefault(parent, []).append(unique_id)
+
+    def _walk(self, start: str, edges: Dict[str, List[str]]) -> List[str]:
+        seen: Set[str] = set()
+        order: List[str] = []
+        frontier = list(edges.get(start, []))
+
+        while frontier:
+            current = frontier.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            order.append(current)
+            frontier.extend(edges.get(current, []))
+
+        return order
+
+    def ancestors(self, unique_id: str) -> List[str]:
+        return self._walk(unique_id, self.parents)
+
+    def descendants(self, unique_id: str) -> List[str]:
+        return self._walk(unique_id, self.children)
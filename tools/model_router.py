@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from tools.common_functions import get_llm
+from tools.json_stream import invoke_json
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+MODEL_TIERS = {
+    "small": os.getenv("LLM_SMALL_MODEL", "llama3.2:3b"),
+    "large": os.getenv("LLM_LARGE_MODEL", "llama3"),
+}
+
+# Cheapest first; fallbacks only ever move right
+TIER_ORDER = ("small", "large")
+
+AGENT_TIERS = {
+    "classify_incident": "small",
+    "analyze_root_cause": "large",
+    "retry_agent_node": "small",
+    "escalation_node": "small",
+    "raise_pr": "large",
+}
+
+# e.g. LLM_AGENT_TIERS="raise_pr=small,classify_incident=large"
+for _override in filter(None, os.getenv("LLM_AGENT_TIERS", "").split(",")):
+    _agent, _, _tier = _override.partition("=")
+    if _tier.strip() in MODEL_TIERS:
+        AGENT_TIERS[_agent.strip()] = _tier.strip()
+
+
+def confident(parsed: Dict[str, Any]) -> bool:
+    """
+    Default acceptance check: the model did not report low confidence.
+    """
+    return str(parsed.get("confidence", "")).strip().lower() != "low"
+
+
+# -----------------------------
+# Router
+# -----------------------------
+
+class ModelRouter:
+    """
+    Sends each agent's calls to the tier it declares and escalates to
+    the next larger tier when the output is missing, fails validation
+    or reports low confidence.
+
+    Records per-tier latency / rejection counts and per-agent fallback
+    rates (see stats()).
+    """
+
+    def __init__(self, tiers: Dict[str, str] = MODEL_TIERS, agent_tiers: Dict[str, str] = AGENT_TIERS):
+        self.tiers = tiers
+        self.agent_tiers = agent_tiers
+        self.clients: Dict[Tuple[str, float], Any] = {}
+        self.lock = threading.Lock()
+
+        self.tier_stats = {tier: {"calls": 0, "rejected": 0, "seconds": 0.0} for tier in tiers}
+        self.agent_stats: Dict[str, Dict[str, int]] = {}
+
+    def chain(self, agent: str) -> List[str]:
+        """
+        Declared tier for the agent, then every larger tier.
+        """
+        declared = self.agent_tiers.get(agent, TIER_ORDER[-1])
+        return [tier for tier in TIER_ORDER[TIER_ORDER.index(declared):] if tier in self.tiers]
+
+    def llm(self, tier: str, temperature: float = 0.1):
+        key = (tier, temperature)
+
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = get_llm(temperature=temperature, model=self.tiers[tier])
+            return self.clients[key]
+
+    def record(self, agent: str, tier: str, seconds: float, accepted: bool, fallback: bool = False):
+        with self.lock:
+            stats = self.tier_stats[tier]
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["rejected"] += 0 if accepted else 1
+
+            agent_stats = self.agent_stats.setdefault(agent, {"calls": 0, "fallbacks": 0})
+            agent_stats["calls"] += 0 if fallback else 1
+            agent_stats["fallbacks"] += 1 if fallback else 0
+
+    def invoke_json(
+        self,
+        agent: str,
+        prompt: str,
+        required_keys: Iterable[str] = (),
+        accept: Callable[[Dict[str, Any]], bool] = confident,
+        temperature: float = 0.1
+    ) -> Optional[Dict[str, Any]]:
+        """
+        invoke_json on the agent's tier, escalating while the result is
+        rejected. Returns the last parsed result even if no tier was
+        accepted (the agents have their own fallbacks).
+        """
+        required_keys = tuple(required_keys)
+        chain = self.chain(agent)
+        best = None
+
+        for position, tier in enumerate(chain):
+            is_last = position == len(chain) - 1
+            started = time.time()
+
+            try:
+                parsed = invoke_json(self.llm(tier, temperature), prompt, required_keys=required_keys)
+            except Exception as e:
+                # e.g. small model not pulled: fall through to a larger tier
+                self.record(agent, tier, time.time() - started, False, fallback=position > 0)
+                if is_last:
+                    raise
+                print(f"🧭 [{agent}] {tier} tier failed ({e}); escalating to {chain[position + 1]}")
+                continue
+
+            accepted = bool(parsed) and all(key in parsed for key in required_keys) and accept(parsed)
+            self.record(agent, tier, time.time() - started, accepted, fallback=position > 0)
+
+            best = parsed if parsed else best
+
+            if accepted or is_last:
+                return best
+
+            print(f"🧭 [{agent}] {tier} tier output rejected; escalating to {chain[position + 1]}")
+
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "tiers": {
+                    tier: {
+                        "model": self.tiers[tier],
+                        "calls": stats["calls"],
+                        "rejected": stats["rejected"],
+                        "avg_seconds": stats["seconds"] / stats["calls"] if stats["calls"] else None,
+                    }
+                    for tier, stats in self.tier_stats.items()
+                },
+                "agents": {
+                    agent: {
+                        "tier": self.agent_tiers.get(agent),
+                        "calls": stats["calls"],
+                        "fallbacks": stats["fallbacks"],
+                        "fallback_rate": stats["fallbacks"] / stats["calls"] if stats["calls"] else None,
+                    }
+                    for agent, stats in self.agent_stats.items()
+                },
+            }
+
+
+_instance: Optional[ModelRouter] = None
+_instance_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    global _instance
+
+    with _instance_lock:
+        if _instance is None:
+            _instance = ModelRouter()
+        return _instance
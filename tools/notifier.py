@@ -0,0 +1,212 @@
+import atexit
+import os
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from tools.cassette import replaying
+from tools.rate_limit import TokenBucket, parse_retry_after
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
+
+# Alerts for the same key within this window are sent as one digest
+DIGEST_WINDOW_SECONDS = float(os.getenv("NOTIFY_DIGEST_WINDOW_SECONDS", "30"))
+
+# Slack incoming webhooks allow roughly one message per second
+WEBHOOK_RATE_PER_SECOND = float(os.getenv("NOTIFY_RATE_PER_SECOND", "1"))
+WEBHOOK_BURST = int(os.getenv("NOTIFY_BURST", "1"))
+
+MAX_SEND_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 1.0
+
+
+def _default_post(url: str, payload: Dict) -> requests.Response:
+    return requests.post(
+        url,
+        json=payload,
+        headers={"Content-Type": "application/json"},
+        timeout=10
+    )
+
+
+# -----------------------------
+# Dispatcher
+# -----------------------------
+
+class NotificationDispatcher:
+    """
+    Queues escalation messages and posts them from a background thread.
+
+    - Messages with the same key (run / cluster) arriving within
+      window_seconds are coalesced into a single digest.
+    - Posting is paced by a token bucket and retried with
+      exponential backoff, honouring Retry-After on 429.
+    """
+
+    def __init__(
+        self,
+        webhook_url: str,
+        window_seconds: float = DIGEST_WINDOW_SECONDS,
+        rate_per_second: float = WEBHOOK_RATE_PER_SECOND,
+        burst: int = WEBHOOK_BURST,
+        max_attempts: int = MAX_SEND_ATTEMPTS,
+        backoff_base: float = BACKOFF_BASE_SECONDS,
+        post: Optional[Callable[[str, Dict], requests.Response]] = None
+    ):
+        self.webhook_url = webhook_url
+        self.window_seconds = window_seconds
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.post = post or _default_post
+
+        self.inbox: "queue.Queue" = queue.Queue()
+        self.pending: Dict[str, Dict] = {}
+        self.stopped = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+
+        self.sent = 0
+        self.failed = 0
+
+        self.worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self.worker.start()
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+
+    def submit(self, key: str, message: str):
+        """
+        Queue a message. Never blocks on the network.
+        """
+        self.idle.clear()
+        self.inbox.put((str(key), message, time.monotonic()))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Send everything pending now, ignoring the digest window.
+        """
+        self.idle.clear()
+        self.inbox.put(None)
+        return self.idle.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 30):
+        self.flush(timeout)
+        self.stopped.set()
+        self.inbox.put(None)
+        self.worker.join(timeout)
+
+    # -----------------------------
+    # Worker
+    # -----------------------------
+
+    def _run(self):
+        while not self.stopped.is_set():
+            timeout = self._next_due()
+
+            try:
+                item = self.inbox.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+
+            force = item is None
+
+            if item:
+                key, message, received_at = item
+                group = self.pending.setdefault(key, {"messages": [], "first_at": received_at})
+                group["messages"].append(message)
+
+            self._send_due(force=force)
+
+            if not self.pending and self.inbox.empty():
+                self.idle.set()
+
+    def _next_due(self) -> Optional[float]:
+        if not self.pending:
+            return None
+        earliest = min(group["first_at"] for group in self.pending.values())
+        return max(earliest + self.window_seconds - time.monotonic(), 0)
+
+    def _send_due(self, force: bool = False):
+        now = time.monotonic()
+
+        for key in list(self.pending):
+            group = self.pending[key]
+            if force or now - group["first_at"] >= self.window_seconds:
+                del self.pending[key]
+                self._deliver(key, group["messages"])
+
+    def _deliver(self, key: str, messages: List[str]):
+        if len(messages) == 1:
+            text = messages[0]
+        else:
+            text = f"🚨 DIGEST: {len(messages)} escalations for {key}\n" + "\n".join(messages)
+
+        payload = {"text": text}
+
+        for attempt in range(1, self.max_attempts + 1):
+            self.bucket.acquire()
+
+            try:
+                response = self.post(self.webhook_url, payload)
+                status = response.status_code
+            except requests.RequestException as exc:
+                print(f"❌ Notification error ({exc}), attempt {attempt}/{self.max_attempts}")
+                status = None
+                response = None
+
+            if status == 200:
+                self.sent += 1
+                print(f"✅ Notification sent ({len(messages)} alert(s) for {key})")
+                return
+
+            if status is not None and status != 429 and status < 500:
+                print(f"❌ Notification rejected ({status}): {response.text}")
+                break
+
+            retry_after = parse_retry_after(
+                response.headers.get("Retry-After") if response is not None else None
+            )
+
+            if retry_after is not None:
+                self.bucket.pause(retry_after)
+            elif attempt < self.max_attempts:
+                time.sleep(self.backoff_base * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+        self.failed += 1
+        print(f"❌ Giving up on notification for {key}")
+
+
+# -----------------------------
+# Shared Instance
+# -----------------------------
+
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> Optional[NotificationDispatcher]:
+    """
+    Shared dispatcher, or None when no webhook is configured
+    or when replaying a cassette.
+    """
+    global _dispatcher
+
+    if not SLACK_WEBHOOK_URL or replaying():
+        return None
+
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(SLACK_WEBHOOK_URL)
+            atexit.register(_dispatcher.close)
+
+    return _dispatcher
@@ -0,0 +1,262 @@
+"""
+Opt-in profiling for workflow runs (AIOPS_PROFILE=1).
+
+Per incident, written to AIOPS_PROFILE_DIR:
+
+    <incident>__<NN>_<node>.prof        cProfile of one graph node
+    <incident>__<NN>_<node>.alloc.txt   top-N allocations during that node
+    <incident>.prof                     all nodes merged
+    <incident>.summary.txt              node timings + top functions
+
+Open .prof files with `python -m pstats` or snakeviz.
+
+tracemalloc is process-wide: run with WORKFLOW_WORKERS=1 for clean
+per-node allocation reports.
+"""
+
+import cProfile
+import functools
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROFILE_ENABLED = os.getenv("AIOPS_PROFILE", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("AIOPS_PROFILE_DIR", ".aiops/profiles")
+PROFILE_TOP_N = int(os.getenv("AIOPS_PROFILE_TOP_N", "25"))
+
+# Frames of the profiler itself are noise in allocation reports
+_ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def _slug(value) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(value))[:120]
+
+
+# Concurrent incidents share tracing; the last one out stops it
+_tracing_users = 0
+_tracing_owned = False
+_tracing_lock = threading.Lock()
+
+
+def _acquire_tracing():
+    global _tracing_users, _tracing_owned
+
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            # One frame is enough for per-line reports and much cheaper
+            tracemalloc.start(1)
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _release_tracing():
+    global _tracing_users, _tracing_owned
+
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_ALLOCATION_FILTERS)
+
+
+def _write_allocations(path: str, title: str, before, after, top_n: int) -> float:
+    """
+    Top-N allocation growth between two snapshots.
+    Returns net KiB allocated.
+    """
+    diffs = after.compare_to(before, "lineno")
+    net_kib = sum(diff.size_diff for diff in diffs) / 1024
+
+    with open(path, "w") as f:
+        f.write(f"{title}\nnet allocated: {net_kib:.1f} KiB\n\n")
+        for diff in diffs[:top_n]:
+            f.write(f"{diff}\n")
+
+    return net_kib
+
+
+def _top_functions(stats: pstats.Stats, top_n: int) -> str:
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats("cumulative").print_stats(top_n)
+    return buffer.getvalue()
+
+
+# -----------------------------
+# Incident Profile
+# -----------------------------
+
+class IncidentProfile:
+    """
+    Collects per-node profiles for one incident's workflow run.
+    """
+
+    def __init__(self, incident_id: str, directory: str = PROFILE_DIR, top_n: int = PROFILE_TOP_N):
+        self.incident_id = incident_id
+        self.prefix = os.path.join(directory, _slug(incident_id))
+        self.top_n = top_n
+        self.node_stats: List[pstats.Stats] = []
+        self.timings: List[Tuple[str, float, float]] = []
+        self.started = time.perf_counter()
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def node(self, name: str):
+        tag = f"{self.prefix}__{len(self.timings) + 1:02d}_{_slug(name)}"
+        profiler = cProfile.Profile()
+        before = _snapshot()
+        started = time.perf_counter()
+
+        try:
+            profiler.enable()
+            profiling = True
+        except ValueError:
+            # Another profiler already owns this thread
+            profiling = False
+
+        try:
+            yield
+        finally:
+            if profiling:
+                profiler.disable()
+
+            seconds = time.perf_counter() - started
+            net_kib = _write_allocations(
+                f"{tag}.alloc.txt",
+                f"incident={self.incident_id} node={name} seconds={seconds:.3f}",
+                before,
+                _snapshot(),
+                self.top_n
+            )
+
+            if profiling:
+                profiler.dump_stats(f"{tag}.prof")
+                self.node_stats.append(pstats.Stats(profiler))
+
+            self.timings.append((name, seconds, net_kib))
+
+    def write_summary(self):
+        total = time.perf_counter() - self.started
+        lines = [
+            f"incident={self.incident_id} wall={total:.3f}s (includes snapshot overhead)",
+            "",
+            "node timings:"
+        ]
+        lines += [
+            f"  {name:<22} {seconds:>8.3f}s  {net_kib:>10.1f} KiB"
+            for name, seconds, net_kib in self.timings
+        ]
+
+        if self.node_stats:
+            merged = self.node_stats[0]
+            for stats in self.node_stats[1:]:
+                merged.add(stats)
+            merged.dump_stats(f"{self.prefix}.prof")
+            lines += ["", _top_functions(merged, self.top_n)]
+
+        with open(f"{self.prefix}.summary.txt", "w") as f:
+            f.write("\n".join(lines))
+
+        print(f"🔬 Profile for {self.incident_id} written to {self.prefix}.summary.txt")
+
+
+# Active profiles by incident_id (nodes only see the state)
+_active: Dict[str, IncidentProfile] = {}
+_active_lock = threading.Lock()
+
+
+@contextmanager
+def profile_incident(incident_id: Optional[str], enabled: bool = PROFILE_ENABLED):
+    if not enabled or not incident_id:
+        yield None
+        return
+
+    _acquire_tracing()
+    profile = IncidentProfile(incident_id)
+
+    with _active_lock:
+        _active[incident_id] = profile
+
+    try:
+        yield profile
+    finally:
+        with _active_lock:
+            _active.pop(incident_id, None)
+
+        profile.write_summary()
+        _release_tracing()
+
+
+def profiled_node(name: str, fn: Callable) -> Callable:
+    """
+    Wrap a graph node so it is profiled whenever its incident is.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        with _active_lock:
+            profile = _active.get(state.get("incident_id"))
+
+        if profile is None:
+            return fn(state)
+
+        with profile.node(name):
+            return fn(state)
+
+    return wrapper
+
+
+# -----------------------------
+# Batch Profile
+# -----------------------------
+
+@contextmanager
+def profile_batch(name: str = "batch", enabled: bool = PROFILE_ENABLED):
+    """
+    Profile the calling thread (ingestion, scheduling, flushing) and
+    the batch's overall allocations. Workflow nodes running on worker
+    threads are covered by their incident profiles.
+    """
+    if not enabled:
+        yield
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prefix = os.path.join(PROFILE_DIR, f"{_slug(name)}_{time.strftime('%Y%m%d-%H%M%S')}")
+
+    _acquire_tracing()
+    before = _snapshot()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - started
+
+        profiler.dump_stats(f"{prefix}.prof")
+        _write_allocations(f"{prefix}.alloc.txt", f"{name} seconds={seconds:.3f}", before, _snapshot(), PROFILE_TOP_N)
+
+        with open(f"{prefix}.summary.txt", "w") as f:
+            f.write(f"{name} total={seconds:.3f}s\n\n")
+            f.write(_top_functions(pstats.Stats(profiler), PROFILE_TOP_N))
+
+        _release_tracing()
+
+        print(f"🔬 Batch profile written to {prefix}.summary.txt")
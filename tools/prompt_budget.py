@@ -0,0 +1,274 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+# Rough chars-per-token ratio for llama-style tokenizers on English + SQL.
+CHARS_PER_TOKEN = 4
+
+ERROR_TOKEN_BUDGET = 400
+SNIPPETS_TOKEN_BUDGET = 300
+SQL_TOKEN_BUDGET = 600
+CODE_TOKEN_BUDGET = 500
+
+# Lines that usually carry the actual failure in dbt / warehouse logs
+ERROR_LINE_PATTERN = re.compile(
+    r"(error|exception|failed|does not exist|invalid|denied|timeout|"
+    r"cannot|mismatch|exceeded|not found|traceback)",
+    re.IGNORECASE
+)
+
+STACK_LINE_PATTERN = re.compile(r"^\s*(File \"|at |\s+\^|line \d+)", re.IGNORECASE)
+
+
+# -----------------------------
+# Measuring
+# -----------------------------
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Cheap token estimate (no tokenizer round trip).
+    """
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "\n... [truncated]"
+
+
+# -----------------------------
+# Error Logs
+# -----------------------------
+
+def compact_error(text: Optional[str], max_tokens: int = ERROR_TOKEN_BUDGET) -> str:
+    """
+    Shrink a long error log to the lines that matter:
+    the first error lines plus the stack section right after them.
+    """
+    if not text:
+        return ""
+
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    lines = [line.rstrip() for line in text.splitlines() if line.strip()]
+
+    keep: List[int] = []
+    seen = set()
+
+    for index, line in enumerate(lines):
+        if not ERROR_LINE_PATTERN.search(line):
+            continue
+
+        # The error line, plus the stack / caret lines that follow it
+        window = [index]
+        cursor = index + 1
+        while cursor < len(lines) and len(window) < 6 and STACK_LINE_PATTERN.match(lines[cursor]):
+            window.append(cursor)
+            cursor += 1
+
+        for position in window:
+            if position not in seen:
+                seen.add(position)
+                keep.append(position)
+
+    if not keep:
+        return _truncate_to_tokens(text, max_tokens)
+
+    selected: List[str] = []
+    used = 0
+    previous = None
+
+    for position in sorted(keep):
+        line = lines[position]
+        cost = estimate_tokens(line) + 1
+
+        if used + cost > max_tokens:
+            break
+
+        if previous is not None and position != previous + 1:
+            selected.append("...")
+
+        selected.append(line)
+        used += cost
+        previous = position
+
+    if not selected:
+        return _truncate_to_tokens(lines[keep[0]], max_tokens)
+
+    return "\n".join(selected)
+
+
+# -----------------------------
+# Similar Incident Snippets
+# -----------------------------
+
+def _normalize_snippet(text: str) -> str:
+    text = re.sub(r"\d+", "#", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def compact_snippets(snippets: Iterable[str], max_tokens: int = SNIPPETS_TOKEN_BUDGET) -> str:
+    """
+    Dedup near-identical memory snippets and fit them into a token budget.
+    """
+    seen = set()
+    selected: List[str] = []
+    used = 0
+
+    for snippet in snippets:
+        snippet = re.sub(r"\n\s+", "\n", (snippet or "").strip())
+        if not snippet:
+            continue
+
+        key = _normalize_snippet(snippet)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        remaining = max_tokens - used
+        if remaining <= 0:
+            break
+
+        snippet = _truncate_to_tokens(snippet, remaining)
+        selected.append(f"- {snippet}")
+        used += estimate_tokens(snippet) + 1
+
+    return "\n\n".join(selected)
+
+
+# -----------------------------
+# Related Code
+# -----------------------------
+
+def compact_code(snippets: Iterable[Tuple[str, str]], max_tokens: int = CODE_TOKEN_BUDGET) -> str:
+    """
+    Fit (header, code) snippets, best first, into a token budget.
+    A snippet that no longer fits is truncated if enough room is left.
+    """
+    selected: List[str] = []
+    used = 0
+
+    for header, code in snippets:
+        remaining = max_tokens - used - estimate_tokens(header) - 2
+        if remaining < 40:
+            break
+
+        code = _truncate_to_tokens(code.strip(), remaining)
+        selected.append(f"-- {header}\n{code}")
+        used += estimate_tokens(header) + estimate_tokens(code) + 2
+
+    return "\n\n".join(selected)
+
+
+# -----------------------------
+# SQL
+# -----------------------------
+
+def _find_focus_line(lines: List[str], column: Optional[str], line_number: Optional[int]) -> Optional[int]:
+    if line_number and 0 < line_number <= len(lines):
+        return line_number - 1
+
+    if column:
+        pattern = re.compile(rf"\b{re.escape(column)}\b", re.IGNORECASE)
+        for index, line in enumerate(lines):
+            if pattern.search(line):
+                return index
+
+    return None
+
+
+def extract_error_line(error: Optional[str]) -> Optional[int]:
+    """
+    Pull a line number out of warehouse errors ("line 12", "at line 12:4").
+    """
+    if not error:
+        return None
+    match = re.search(r"\bline\s+(\d+)", error, re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+
+def trim_sql(
+    sql: Optional[str],
+    column: Optional[str] = None,
+    line_number: Optional[int] = None,
+    max_tokens: int = SQL_TOKEN_BUDGET
+) -> Tuple[str, int, int]:
+    """
+    Trim SQL to the region around the failing column or line.
+
+    Returns (excerpt, start_line, end_line) with 1-based inclusive
+    line numbers so callers can splice a fixed excerpt back in.
+    """
+    if not sql:
+        return "", 0, 0
+
+    lines = sql.splitlines()
+
+    if estimate_tokens(sql) <= max_tokens:
+        return sql, 1, len(lines)
+
+    focus = _find_focus_line(lines, column, line_number)
+
+    if focus is None:
+        focus = 0
+
+    start = end = focus
+    used = estimate_tokens(lines[focus]) + 1
+
+    # Grow the window around the focus line, alternating up and down
+    while True:
+        grew = False
+
+        if start > 0:
+            cost = estimate_tokens(lines[start - 1]) + 1
+            if used + cost <= max_tokens:
+                start -= 1
+                used += cost
+                grew = True
+
+        if end < len(lines) - 1:
+            cost = estimate_tokens(lines[end + 1]) + 1
+            if used + cost <= max_tokens:
+                end += 1
+                used += cost
+                grew = True
+
+        if not grew:
+            break
+
+    return "\n".join(lines[start:end + 1]), start + 1, end + 1
+
+
+def splice_sql(sql: str, excerpt: str, start_line: int, end_line: int) -> str:
+    """
+    Replace lines start_line..end_line (1-based, inclusive) with excerpt.
+    """
+    lines = sql.splitlines()
+    updated = lines[:start_line - 1] + excerpt.splitlines() + lines[end_line:]
+    result = "\n".join(updated)
+    return result + "\n" if sql.endswith("\n") else result
+
+
+# -----------------------------
+# Reporting
+# -----------------------------
+
+def report_prompt_budget(call_name: str, original_prompt: str, prompt: str) -> int:
+    """
+    Print prompt size for a call and return the tokens saved by compaction.
+    """
+    original_tokens = estimate_tokens(original_prompt)
+    final_tokens = estimate_tokens(prompt)
+    saved = max(original_tokens - final_tokens, 0)
+
+    print(f"📏 [{call_name}] prompt ~{final_tokens} tokens (saved ~{saved} of {original_tokens})")
+
+    return saved
@@ -0,0 +1,170 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After header → seconds. Accepts delta-seconds or an HTTP date.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    rate:     tokens added per second
+    capacity: maximum burst size
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Block until tokens are available.
+        Returns False if timeout elapses first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now >= self.blocked_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+
+                wait = max(
+                    self.blocked_until - now,
+                    (tokens - self.tokens) / self.rate if self.rate else 1.0
+                )
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+
+            time.sleep(max(wait, 0.001))
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for a while (e.g. after a Retry-After).
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a backend whose circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a backend is degraded.
+
+    closed:    calls go through; failure_threshold consecutive
+               failures open the circuit
+    open:      calls are rejected for reset_seconds
+    half_open: one trial call; success closes, failure re-opens
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0, trial_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        # A trial that never reports back stops blocking after this long
+        self.trial_timeout = trial_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.trial_started = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless a call may go through now.
+        """
+        with self.lock:
+            now = time.monotonic()
+            state = self._state(now)
+
+            if state == "closed":
+                return
+
+            trial_expired = self.trial_in_flight and now - self.trial_started >= self.trial_timeout
+
+            if state == "half_open" and (not self.trial_in_flight or trial_expired):
+                self.trial_in_flight = True
+                self.trial_started = now
+                return
+
+            remaining = max(self.reset_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+        raise CircuitOpenError(f"{self.name} circuit open (retry in {remaining:.0f}s)")
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                print(f"🟢 {self.name} circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """
+        The trial call got an answer that says nothing about health
+        (e.g. 429): let the next call be the trial instead.
+        """
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            trial_failed = self.trial_in_flight
+            self.trial_in_flight = False
+
+            if trial_failed or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                print(f"🔴 {self.name} circuit open for {self.reset_seconds:.0f}s after {self.failures} failure(s)")
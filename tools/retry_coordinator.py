@@ -0,0 +1,344 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+# Concurrent dbt Cloud reruns allowed per account
+MAX_RERUNS_PER_ACCOUNT = int(os.getenv("RETRY_MAX_RERUNS_PER_ACCOUNT", "3"))
+
+# A finished rerun is reused by incidents for the same job arriving
+# within this many seconds, instead of triggering another one
+SHARE_RESULT_SECONDS = float(os.getenv("RETRY_SHARE_RESULT_SECONDS", "300"))
+
+
+# -----------------------------
+# Rerun Selectors
+# -----------------------------
+
+def _selectors(steps: List[str]) -> Set[Tuple[str, str]]:
+    # "dbt build --select a+ b+" -> {("dbt build", "a+"), ("dbt build", "b+")}
+    selectors = set()
+    for step in steps:
+        command, _, selection = step.partition(" --select ")
+        for selector in selection.split() or [""]:
+            selectors.add((command, selector))
+    return selectors
+
+
+def covers(running: Dict[str, Any], requested: Dict[str, Any]) -> bool:
+    """
+    True if a rerun with the running options also reruns everything
+    the requested options ask for (a full-job rerun covers any selector).
+    """
+    if running.get("from_failure"):
+        return bool(requested.get("from_failure"))
+
+    steps = running.get("steps_override")
+    if not steps:
+        return True
+
+    requested_steps = requested.get("steps_override")
+    return (
+        bool(requested_steps)
+        and not requested.get("from_failure")
+        and _selectors(requested_steps) <= _selectors(steps)
+    )
+
+
+def merge_steps(current: List[str], extra: List[str]) -> List[str]:
+    """
+    Union of two steps_override lists; selections of the same dbt
+    command are combined into one step.
+    """
+    merged = list(current)
+
+    for step in extra:
+        command, _, selection = step.partition(" --select ")
+
+        for index, existing in enumerate(merged):
+            existing_command, _, existing_selection = existing.partition(" --select ")
+            if selection and existing_selection and command == existing_command:
+                added = [s for s in selection.split() if s not in existing_selection.split()]
+                merged[index] = " ".join([existing] + added)
+                break
+        else:
+            merged.append(step)
+
+    return merged
+
+
+def merge_rerun_options(current: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Options for one rerun that satisfies both requests. Other keys
+    (attempts, delay) are taken from current.
+    """
+    if covers(current, extra):
+        return current
+
+    if covers(extra, current):
+        return {**current, "steps_override": extra.get("steps_override"), "from_failure": extra.get("from_failure")}
+
+    if current.get("from_failure") or extra.get("from_failure"):
+        # Mixed modes: only the full job covers both
+        return {**current, "steps_override": None, "from_failure": False}
+
+    return {**current, "steps_override": merge_steps(current["steps_override"], extra["steps_override"])}
+
+
+# -----------------------------
+# Coordinator
+# -----------------------------
+
+class RetryCoordinator:
+    """
+    Dedupes dbt Cloud reruns per job: at most one rerun per job runs
+    at a time.
+
+    - Incidents for a job with a rerun in flight that covers their
+      model await that rerun's result instead of triggering their own.
+    - Requests for a job whose rerun has not started yet (waiting for
+      an account slot or for the previous rerun) are merged into it
+      by widening its selector.
+    - Otherwise one follow-up rerun is queued behind the running one.
+    - A recently finished covering rerun is shared for SHARE_RESULT_SECONDS.
+    - At most max_per_account reruns run concurrently per account.
+    - A speculative rerun (started before the retry decision) is
+      adopted by the next retry for its key, or cancelled once every
+      incident holding it has decided against retrying.
+    """
+
+    def __init__(
+        self,
+        retry_fn: Optional[Callable[..., Dict[str, Any]]] = None,
+        max_per_account: int = MAX_RERUNS_PER_ACCOUNT,
+        share_seconds: float = SHARE_RESULT_SECONDS,
+        start_fn: Optional[Callable[..., Optional[int]]] = None,
+        cancel_fn: Optional[Callable[[int], bool]] = None
+    ):
+        if retry_fn is None or start_fn is None or cancel_fn is None:
+            from tools.common_functions import cancel_dbt_run, retry_dbt_cloud_job, start_dbt_rerun
+            retry_fn = retry_fn or retry_dbt_cloud_job
+            start_fn = start_fn or start_dbt_rerun
+            cancel_fn = cancel_fn or cancel_dbt_run
+
+        self.retry_fn = retry_fn
+        self.start_fn = start_fn
+        self.cancel_fn = cancel_fn
+        self.max_per_account = max_per_account
+        self.share_seconds = share_seconds
+
+        self.lock = threading.Lock()
+        # key -> latest rerun {"future", "retry_kwargs", "started", "speculative"}
+        self.in_flight: Dict[Tuple, Dict[str, Any]] = {}
+        # key -> (finished_at, result, retry_kwargs)
+        self.finished: Dict[Tuple, Tuple[float, Dict[str, Any], Dict[str, Any]]] = {}
+        self.account_slots: Dict[str, threading.Semaphore] = {}
+        # key -> {"run_id": ..., "holders": incidents still undecided}
+        self.speculative: Dict[Tuple, Dict[str, Any]] = {}
+        self.executor = ThreadPoolExecutor(thread_name_prefix="dbt-retry")
+
+    def _slots(self, account_id: str) -> threading.Semaphore:
+        if account_id not in self.account_slots:
+            self.account_slots[account_id] = threading.BoundedSemaphore(self.max_per_account)
+        return self.account_slots[account_id]
+
+    def submit(self, job_id: int, account_id: str = "default", **retry_kwargs) -> Future:
+        """
+        Returns a future for the job's rerun, shared with any other
+        incident that asked for the same job.
+        """
+        return self._submit(job_id, account_id, retry_kwargs)[0]
+
+    @staticmethod
+    def _key(job_id: int, account_id: str) -> Tuple:
+        return (account_id, job_id)
+
+    def _shared_result(self, key: Tuple, retry_kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        finished = self.finished.get(key)
+        if (
+            finished
+            and time.monotonic() - finished[0] < self.share_seconds
+            and covers(finished[2], retry_kwargs)
+        ):
+            return finished[1]
+        return None
+
+    def _submit(self, job_id: int, account_id: str, retry_kwargs: Dict[str, Any]) -> Tuple[Future, bool]:
+        key = self._key(job_id, account_id)
+
+        with self.lock:
+            latest = self.in_flight.get(key)
+
+            if latest and not latest["started"]:
+                latest["retry_kwargs"] = merge_rerun_options(latest["retry_kwargs"], retry_kwargs)
+                print(f"🔗 Merged into pending rerun for job {job_id}")
+                return latest["future"], True
+
+            if latest and covers(latest["retry_kwargs"], retry_kwargs):
+                print(f"🔗 Joining in-flight rerun for job {job_id}")
+                return latest["future"], True
+
+            shared = self._shared_result(key, retry_kwargs)
+
+            if shared is not None:
+                # A speculative run started since is not needed any more
+                stale = self.speculative.pop(key, None)
+            else:
+                # Adopt a speculative rerun as the first attempt
+                speculative = self.speculative.pop(key, None)
+
+                entry = {"retry_kwargs": retry_kwargs, "started": False, "speculative": speculative}
+                previous = latest["future"] if latest else None
+                if previous is not None:
+                    print(f"⏳ Queued follow-up rerun for job {job_id} behind the running one")
+
+                entry["future"] = self.executor.submit(self._run, key, entry, previous, self._slots(account_id), job_id)
+                self.in_flight[key] = entry
+
+        if shared is not None:
+            if stale:
+                self._cancel_speculative(stale)
+
+            print(f"🔗 Reusing recent rerun result for job {job_id}")
+            future: Future = Future()
+            future.set_result(shared)
+            return future, True
+
+        return entry["future"], False
+
+    def _run(self, key: Tuple, entry: Dict[str, Any], previous: Optional[Future], slots: threading.Semaphore, job_id: int):
+        retry_kwargs = entry["retry_kwargs"]
+
+        try:
+            if previous is not None:
+                # One rerun per job at a time
+                previous.result()
+
+            with slots:
+                with self.lock:
+                    # No more merging from here on
+                    entry["started"] = True
+                    retry_kwargs = dict(entry["retry_kwargs"])
+
+                speculative = entry["speculative"]
+                if speculative:
+                    # It may still be starting
+                    speculative["ready"].wait()
+                    if not covers(speculative["retry_kwargs"], retry_kwargs):
+                        # Merged beyond the speculative selector: superseded
+                        self._cancel_speculative(speculative)
+                    elif speculative["run_id"]:
+                        retry_kwargs["first_run_id"] = speculative["run_id"]
+
+                result = self.retry_fn(job_id=job_id, **retry_kwargs)
+        except Exception as exc:
+            result = {"success": False, "reason": f"retry_error: {exc}"}
+
+        retry_kwargs.pop("first_run_id", None)
+
+        with self.lock:
+            if self.in_flight.get(key) is entry:
+                del self.in_flight[key]
+            self.finished[key] = (time.monotonic(), result, retry_kwargs)
+
+        return result
+
+    def _cancel_speculative(self, speculative: Dict[str, Any]) -> bool:
+        speculative["ready"].wait()
+        return bool(speculative["run_id"]) and self.cancel_fn(speculative["run_id"])
+
+    def speculate(self, job_id: int, account_id: str = "default", **rerun_kwargs) -> Optional[int]:
+        """
+        Start a rerun now, before the retry decision is made.
+        Incidents speculating on the same key share one run.
+        Returns the run_id, or None if nothing was started (including
+        when a running or recent rerun already covers this request).
+        """
+        key = self._key(job_id, account_id)
+
+        with self.lock:
+            if key in self.in_flight or self._shared_result(key, rerun_kwargs) is not None:
+                return None
+
+            speculative = self.speculative.get(key)
+            if speculative:
+                if not covers(speculative["retry_kwargs"], rerun_kwargs):
+                    return None
+                speculative["holders"] += 1
+                starting = False
+            else:
+                # Reserve the key; the dbt Cloud call happens outside the lock
+                speculative = {"run_id": None, "holders": 1, "retry_kwargs": rerun_kwargs, "ready": threading.Event()}
+                self.speculative[key] = speculative
+                starting = True
+
+        if not starting:
+            speculative["ready"].wait()
+            if speculative["run_id"]:
+                print(f"🔗 Joining speculative run {speculative['run_id']} for job {job_id}")
+            return speculative["run_id"]
+
+        try:
+            speculative["run_id"] = self.start_fn(job_id=job_id, **rerun_kwargs)
+        finally:
+            speculative["ready"].set()
+
+            if not speculative["run_id"]:
+                with self.lock:
+                    if self.speculative.get(key) is speculative:
+                        del self.speculative[key]
+
+        return speculative["run_id"]
+
+    def abandon(self, job_id: int, account_id: str = "default", **rerun_kwargs) -> bool:
+        """
+        Drop this incident's hold on a speculative rerun; the run is
+        cancelled when no holder is left and no retry adopted it.
+        Returns True if the run was cancelled.
+        """
+        key = self._key(job_id, account_id)
+
+        with self.lock:
+            speculative = self.speculative.get(key)
+            if not speculative:
+                return False
+
+            speculative["holders"] -= 1
+            if speculative["holders"] > 0:
+                return False
+
+            del self.speculative[key]
+
+        return self._cancel_speculative(speculative)
+
+    def retry(self, job_id: int, account_id: str = "default", **retry_kwargs) -> Dict[str, Any]:
+        """
+        Blocking helper: submit (or join) and wait for the shared result.
+        Results this caller did not trigger are marked shared=True.
+        """
+        future, shared = self._submit(job_id, account_id, retry_kwargs)
+        result = future.result()
+        return {**result, "shared": True} if shared else result
+
+
+# -----------------------------
+# Shared Instance
+# -----------------------------
+
+_coordinator: Optional[RetryCoordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def get_retry_coordinator() -> RetryCoordinator:
+    global _coordinator
+
+    with _coordinator_lock:
+        if _coordinator is None:
+            _coordinator = RetryCoordinator()
+
+    return _coordinator
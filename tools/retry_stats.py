@@ -0,0 +1,188 @@
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# -----------------------------
+# Configuration
+# -----------------------------
+
+RETRY_STATS_PATH = os.getenv("RETRY_STATS_PATH", ".aiops/retry_stats.db")
+
+# Minimum recorded retries before history overrides the LLM
+MIN_SAMPLES = int(os.getenv("RETRY_STATS_MIN_SAMPLES", "5"))
+
+# Below this success rate retrying is considered pointless
+MIN_SUCCESS_RATE = float(os.getenv("RETRY_STATS_MIN_SUCCESS_RATE", "0.2"))
+
+# Only outcomes this recent count; 0 keeps all history
+WINDOW_DAYS = float(os.getenv("RETRY_STATS_WINDOW_DAYS", "30"))
+
+# Share of "don't retry" verdicts overridden by a single exploratory
+# retry, so a key whose failures became transient can recover
+EXPLORE_RATE = float(os.getenv("RETRY_STATS_EXPLORE_RATE", "0.1"))
+
+
+# -----------------------------
+# Error Fingerprint
+# -----------------------------
+
+def error_fingerprint(description: Optional[str]) -> str:
+    """
+    Stable hash of an error message with run-specific noise removed
+    (ids, numbers, quoted values, whitespace).
+    """
+    text = (description or "").lower()
+
+    text = re.sub(r"'[^']*'|\"[^\"]*\"", "<str>", text)
+    text = re.sub(r"\b[0-9a-f]{8,}\b", "<hex>", text)
+    text = re.sub(r"\d+(\.\d+)?", "<n>", text)
+    text = re.sub(r"\s+", " ", text).strip()
+
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+# -----------------------------
+# Outcome Store
+# -----------------------------
+
+class RetryOutcomeStore:
+    """
+    Local SQLite record of retry outcomes per
+    (job_id, incident_type, error fingerprint).
+    """
+
+    def __init__(self, path: str = RETRY_STATS_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS retry_outcomes (
+                job_id TEXT NOT NULL,
+                incident_type TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                success INTEGER NOT NULL,
+                attempts INTEGER,
+                delay_seconds INTEGER,
+                recorded_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_retry_outcomes_key
+            ON retry_outcomes (job_id, incident_type, fingerprint)
+            """
+        )
+        self.conn.commit()
+
+    def record(
+        self,
+        job_id,
+        incident_type: str,
+        fingerprint: str,
+        success: bool,
+        attempts: Optional[int] = None,
+        delay_seconds: Optional[int] = None
+    ):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO retry_outcomes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(job_id), incident_type or "unknown", fingerprint,
+                    int(bool(success)), attempts, delay_seconds, time.time()
+                )
+            )
+            self.conn.commit()
+
+    def decide(
+        self,
+        job_id,
+        incident_type: str,
+        fingerprint: str,
+        window_days: float = WINDOW_DAYS,
+        explore_rate: float = EXPLORE_RATE
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Retry decision from recent history, or None if there is not
+        enough history for this key (caller should ask the LLM).
+        """
+        since = time.time() - window_days * 86400 if window_days else 0
+
+        with self.lock:
+            total, successes, avg_attempts, avg_delay = self.conn.execute(
+                """
+                SELECT
+                    COUNT(*),
+                    COALESCE(SUM(success), 0),
+                    AVG(CASE WHEN success = 1 THEN attempts END),
+                    AVG(CASE WHEN success = 1 THEN delay_seconds END)
+                FROM retry_outcomes
+                WHERE job_id = ? AND incident_type = ? AND fingerprint = ?
+                  AND recorded_at >= ?
+                """,
+                (str(job_id), incident_type or "unknown", fingerprint, since)
+            ).fetchone()
+
+        if total < MIN_SAMPLES:
+            return None
+
+        success_rate = successes / total
+
+        if success_rate < MIN_SUCCESS_RATE:
+            if random.random() < explore_rate:
+                # The outcome is recorded like any other retry
+                return {
+                    "retry": True,
+                    "max_attempts": 1,
+                    "delay_seconds": 10,
+                    "success_rate": success_rate,
+                    "samples": total,
+                    "reason": f"Exploratory retry despite {success_rate:.0%} historical success over {total} runs"
+                }
+
+            return {
+                "retry": False,
+                "success_rate": success_rate,
+                "samples": total,
+                "reason": f"Historical retry success {success_rate:.0%} over {total} runs"
+            }
+
+        # Lower success rates get more attempts, capped at 3
+        attempts = round(avg_attempts or 1)
+        if success_rate < 0.6:
+            attempts += 1
+
+        return {
+            "retry": True,
+            "max_attempts": min(max(attempts, 1), 3),
+            "delay_seconds": min(max(int(avg_delay or 10), 5), 60),
+            "success_rate": success_rate,
+            "samples": total,
+            "reason": f"Historical retry success {success_rate:.0%} over {total} runs"
+        }
+
+
+# -----------------------------
+# Shared Instance
+# -----------------------------
+
+_store: Optional[RetryOutcomeStore] = None
+_store_lock = threading.Lock()
+
+
+def get_retry_stats() -> RetryOutcomeStore:
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = RetryOutcomeStore()
+
+    return _store
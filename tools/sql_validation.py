@@ -0,0 +1,201 @@
+import difflib
+import re
+from typing import Iterable, List, Optional, Set, Tuple
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # optional dependency
+    sqlglot = None
+    exp = None
+
+
+# -----------------------------
+# Jinja Stripping
+# -----------------------------
+
+def strip_jinja(sql: str) -> str:
+    """
+    Turn dbt Jinja into plain SQL that a parser can read:
+    ref/source calls become identifiers, other expressions a placeholder,
+    and statements/comments are dropped.
+    """
+    sql = re.sub(r"\{#.*?#\}", "", sql, flags=re.DOTALL)
+    sql = re.sub(r"\{%.*?%\}", "", sql, flags=re.DOTALL)
+
+    sql = re.sub(
+        r"\{\{\s*ref\(\s*['\"]([\w.]+)['\"]\s*\)\s*\}\}",
+        r"\1",
+        sql
+    )
+    sql = re.sub(
+        r"\{\{\s*source\(\s*['\"](\w+)['\"]\s*,\s*['\"](\w+)['\"]\s*\)\s*\}\}",
+        r"\1.\2",
+        sql
+    )
+
+    return re.sub(r"\{\{.*?\}\}", "__jinja__", sql, flags=re.DOTALL)
+
+
+# -----------------------------
+# Column Extraction
+# -----------------------------
+
+# Words the fallback tokenizer never treats as column names
+SQL_WORDS = {
+    "select", "from", "where", "and", "or", "not", "as", "on", "join", "left",
+    "right", "inner", "outer", "full", "cross", "group", "by", "order", "having",
+    "limit", "offset", "union", "all", "distinct", "case", "when", "then", "else",
+    "end", "is", "null", "in", "like", "ilike", "between", "with", "true", "false",
+    "asc", "desc", "over", "partition", "exists", "using", "qualify", "nulls",
+    "first", "last", "rows", "range", "unbounded", "preceding", "following",
+    "current", "row", "any", "some", "except", "intersect", "lateral", "values",
+    "filter", "within", "interval", "recursive",
+    # types in casts (x::date, cast(x as int))
+    "int", "integer", "bigint", "smallint", "numeric", "decimal", "float",
+    "double", "precision", "real", "varchar", "char", "text", "string",
+    "boolean", "bool", "date", "time", "timestamp", "timestamp_ntz",
+    "timestamp_tz", "timestamptz", "variant", "number", "__jinja__",
+}
+
+
+def _parse(sql: str):
+    return sqlglot.parse_one(strip_jinja(sql))
+
+
+def _fallback_columns(sql: str) -> Set[str]:
+    """
+    Every identifier that could be a column, qualified or not.
+    Deliberately over-inclusive: an unknown name in a fix is reported
+    rather than missed, so validation fails closed without a parser.
+    """
+    sql = strip_jinja(sql)
+    sql = re.sub(r"--[^\n]*|/\*.*?\*/", " ", sql, flags=re.DOTALL)
+    sql = re.sub(r"'(?:[^']|'')*'", " ", sql)
+
+    # Relations after FROM / JOIN (and their aliases) are not columns
+    sql = re.sub(
+        r"\b(?:from|join)\s+[\w.\"]+(?:\s+(?:as\s+)?[A-Za-z_]\w*)?",
+        " ",
+        sql,
+        flags=re.IGNORECASE
+    )
+
+    columns = set()
+
+    for match in re.finditer(r"(?<![\w.])([A-Za-z_][\w.]*)(\s*\()?", sql):
+        if match.group(2):
+            # Function call
+            continue
+
+        name = match.group(1).rstrip(".").split(".")[-1].lower()
+        if name and name not in SQL_WORDS:
+            columns.add(name)
+
+    return columns
+
+
+def referenced_columns(sql: str) -> Set[str]:
+    """
+    Column names referenced in the query (lowercase).
+    Falls back to an identifier tokenizer without sqlglot.
+    """
+    if sqlglot is None:
+        return _fallback_columns(sql)
+
+    tree = _parse(sql)
+    return {column.name.lower() for column in tree.find_all(exp.Column) if column.name}
+
+
+def defined_names(sql: str) -> Set[str]:
+    """
+    Names the query defines itself (aliases, CTE names),
+    which are valid column references without being upstream columns.
+    """
+    if sqlglot is None:
+        plain = strip_jinja(sql)
+        names = set(re.findall(r"\bas\s+(\w+)", plain, re.IGNORECASE))
+        names |= set(re.findall(r"\b(\w+)\s+as\s*\(", plain, re.IGNORECASE))
+        return {name.lower() for name in names}
+
+    tree = _parse(sql)
+    names = {alias.alias.lower() for alias in tree.find_all(exp.Alias) if alias.alias}
+    names |= {cte.alias.lower() for cte in tree.find_all(exp.CTE) if cte.alias}
+    return names
+
+
+# -----------------------------
+# Validation
+# -----------------------------
+
+def validate_sql_fix(
+    original_sql: str,
+    fixed_sql: str,
+    known_columns: Optional[Set[str]] = None,
+    forbidden_columns: Iterable[str] = ()
+) -> Tuple[bool, List[str]]:
+    """
+    Local checks on a candidate fix, before anything remote happens.
+
+    - fixed SQL parses (sqlglot; else bracket balance, with every
+      identifier treated as a possible column)
+    - it no longer references forbidden (known-missing) columns
+    - columns it newly introduces exist in known_columns
+      (skipped when the manifest column index is incomplete)
+
+    Returns (ok, errors).
+    """
+    errors: List[str] = []
+
+    if not fixed_sql or not fixed_sql.strip():
+        return False, ["empty SQL"]
+
+    if fixed_sql.strip() == (original_sql or "").strip():
+        return False, ["fix does not change the SQL"]
+
+    if sqlglot is not None:
+        try:
+            _parse(fixed_sql)
+        except Exception as exc:
+            return False, [f"parse error: {str(exc).splitlines()[0]}"]
+    elif strip_jinja(fixed_sql).count("(") != strip_jinja(fixed_sql).count(")"):
+        return False, ["unbalanced parentheses"]
+
+    try:
+        columns = referenced_columns(fixed_sql)
+        original_columns = referenced_columns(original_sql) if original_sql else set()
+    except Exception:
+        # Original SQL may not parse; only the fix has to
+        columns = referenced_columns(fixed_sql)
+        original_columns = set()
+
+    for column in forbidden_columns:
+        if column and column.lower() in columns:
+            errors.append(f"still references missing column {column}")
+
+    if known_columns:
+        introduced = columns - original_columns - defined_names(fixed_sql)
+        unknown = sorted(introduced - known_columns)
+        if unknown:
+            errors.append(f"introduces unknown column(s): {', '.join(unknown)}")
+
+    return not errors, errors
+
+
+# -----------------------------
+# Diff
+# -----------------------------
+
+def unified_diff(original_sql: str, fixed_sql: str, file_path: str) -> str:
+    """
+    Minimal unified diff between the original and fixed file.
+    """
+    return "".join(
+        difflib.unified_diff(
+            (original_sql or "").splitlines(keepends=True),
+            fixed_sql.splitlines(keepends=True),
+            fromfile=f"a/{file_path}",
+            tofile=f"b/{file_path}",
+            n=2
+        )
+    )
@@ -1,38 +1,220 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
-from tools.common_functions import get_dbt_run_status, retry_dbt_cloud_job
-from your_workflow import run_workflow
+from tools.common_functions import ACCOUNT_ID, RUN_STATUS_NAMES, get_dbt_run
+from memory.incident_store import get_incident_store
 
 st.set_page_config(page_title="AI-Ops Copilot", layout="wide")
 
 st.title("🚨 AI-Ops Copilot Dashboard")
 
+HISTORY_PAGE_SIZE = 25
+
+# Finished jobs are dropped this long after they started
+JOB_RETENTION_SECONDS = 3600
+
+# ------------------------
+# Shared Resources
+# ------------------------
+#
+# Created once per server process and shared by all sessions, so
+# long RCA / retry work never runs inside a button handler.
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="ui-job")
+
+
+@st.cache_resource
+def get_jobs() -> dict:
+    return {}
+
+
+# ------------------------
+# Cached Lookups
+# ------------------------
+
+@st.cache_data(ttl=15)
+def cached_run(run_id: int):
+    return get_dbt_run(run_id)
+
+
+@st.cache_data(ttl=15)
+def cached_history(offset: int, limit: int, incident_type=None):
+    return get_incident_store().list_incidents(limit=limit, offset=offset, incident_type=incident_type)
+
+
+@st.cache_data(ttl=15)
+def cached_metrics():
+    store = get_incident_store()
+    return {
+        "total": store.count(),
+        "mttr": store.mttr_seconds(),
+        "retry_success_rate": store.retry_success_rate(),
+        "top_models": store.top_failing_models(limit=5),
+    }
+
+
+# ------------------------
+# Background Jobs
+# ------------------------
+
+def prune_jobs():
+    jobs = get_jobs()
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+
+    for job_id, job in list(jobs.items()):
+        if job["future"].done() and job["started_at"] < cutoff:
+            jobs.pop(job_id, None)
+
+
+def submit_job(kind: str, target, **kwargs) -> str:
+    prune_jobs()
+
+    job_id = uuid.uuid4().hex[:8]
+    job = {"kind": kind, "events": [], "started_at": time.time(), "result": None}
+    job["future"] = get_executor().submit(target, job, **kwargs)
+
+    jobs = get_jobs()
+    jobs[job_id] = job
+    st.session_state["job_ids"] = [
+        known for known in st.session_state.get("job_ids", []) if known in jobs
+    ] + [job_id]
+    return job_id
+
+
+def rca_job(job: dict, run: dict):
+    # Heavy imports only happen on the worker thread, once
+    from api.dbt_ingestor import incidents_for_run
+    from api.run_context import release_run_context
+    from graph.workflow import stream_workflow
+
+    # Fetched here, not through st.cache_data: worker threads have no
+    # script run context
+    incidents = incidents_for_run(run)
+    job["events"].append(f"Extracted {len(incidents)} incident(s)")
+
+    results = []
+
+    try:
+        for incident in incidents:
+            final_state = incident
+            for node_name, final_state in stream_workflow(incident):
+                job["events"].append(f"{incident.get('model_name')}: {node_name} done")
+            results.append(final_state)
+    finally:
+        if incidents:
+            release_run_context(run["id"])
+
+    job["result"] = [
+        {
+            "model": state.get("model_name"),
+            "incident_type": state.get("incident_type"),
+            "root_causes": state.get("root_causes"),
+            "recommended_action": state.get("recommended_action"),
+            "retry_status": state.get("retry_status"),
+        }
+        for state in results
+    ]
+
+
+def retry_job(job: dict, job_id: int):
+    from tools.retry_coordinator import get_retry_coordinator
+
+    job["events"].append(f"Rerun requested for job {job_id}")
+    job["result"] = get_retry_coordinator().retry(job_id, account_id=ACCOUNT_ID)
+    job["events"].append("Rerun finished")
+
+
 # ------------------------
 # Input Section
 # ------------------------
 
 run_id = st.number_input("Enter dbt Run ID", min_value=1)
 
-if st.button("Check Run Status"):
-    status = get_dbt_run_status(run_id)
-    st.success(f"Current Status: {status}")
+run = cached_run(int(run_id))
+
+col_status, col_rca, col_retry = st.columns(3)
+
+with col_status:
+    if st.button("Check Run Status"):
+        if run:
+            st.success(f"Current Status: {RUN_STATUS_NAMES.get(run.get('status'), 'unknown')}")
+        else:
+            st.error("Run not found")
 
 # ------------------------
 # RCA Section
 # ------------------------
 
-if st.button("Run RCA"):
-    incident = f"dbt run {run_id} failed"
-    result = run_workflow(incident)
-
-    st.subheader("🧠 Root Cause Analysis")
-    st.write(result.get("root_causes"))
-    st.write("Recommended Action:", result.get("recommended_action"))
+with col_rca:
+    if st.button("Run RCA", disabled=not run):
+        submit_job("rca", rca_job, run=run)
 
 # ------------------------
 # Retry Section
 # ------------------------
 
-if st.button("Retry Job"):
-    result = retry_dbt_cloud_job(job_id=1234)  # replace dynamically
-    st.subheader("🔁 Retry Result")
-    st.write(result)
+with col_retry:
+    if st.button("Retry Job", disabled=not (run and run.get("job_id"))):
+        submit_job("retry", retry_job, job_id=run["job_id"])
+
+
+# ------------------------
+# Job Progress
+# ------------------------
+
+@st.fragment(run_every=2)
+def job_progress():
+    jobs = get_jobs()
+
+    for job_id in reversed(st.session_state.get("job_ids", [])):
+        job = jobs.get(job_id)
+        if not job:
+            continue
+
+        future = job["future"]
+        state = "running" if not future.done() else ("failed" if future.exception() else "done")
+        elapsed = int(time.time() - job["started_at"])
+
+        with st.expander(f"{job['kind'].upper()} {job_id} — {state} ({elapsed}s)", expanded=not future.done()):
+            for event in job["events"][-20:]:
+                st.write(event)
+
+            if state == "failed":
+                st.error(str(future.exception()))
+            elif state == "done":
+                st.subheader("🧠 Root Cause Analysis" if job["kind"] == "rca" else "🔁 Retry Result")
+                st.write(job["result"])
+
+
+job_progress()
+
+# ------------------------
+# Incident History
+# ------------------------
+
+st.header("📚 Incident History")
+
+metrics = cached_metrics()
+
+col_total, col_mttr, col_retry_rate = st.columns(3)
+col_total.metric("Incidents", metrics["total"])
+col_mttr.metric("MTTR", f"{metrics['mttr'] / 60:.1f} min" if metrics["mttr"] else "n/a")
+col_retry_rate.metric(
+    "Retry success",
+    f"{metrics['retry_success_rate']:.0%}" if metrics["retry_success_rate"] is not None else "n/a"
+)
+
+if metrics["top_models"]:
+    st.write("Top failing models:", metrics["top_models"])
+
+page = st.number_input("Page", min_value=1, value=1)
+
+st.dataframe(
+    cached_history((page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE),
+    use_container_width=True
+)